@@ -1,4 +1,5 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, stream_with_context
+from functools import wraps
 from flask_cors import CORS
 import os
 import logging
@@ -6,8 +7,19 @@ from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
 from models.prediction_model import PredictionModel
+from models.sharded_model import ShardedModelSet
+from models.prediction_sweeper import PredictionSweeper
+from models.network_simulator import NetworkSimulator
+from models.sequence_model import tracking_windows
 from utils.data_processor import DataProcessor
 from utils.feature_engineer import FeatureEngineer
+from utils.train_state import TrainStateStore, INGEST_BATCH_SIZE
+from utils.time_codec import parse_minutes, format_minutes_array, delay_minutes
+from utils.drift_monitor import DriftMonitor
+from utils.prediction_store import create_prediction_store
+from utils.admission import AdmissionController, FULL, DEGRADED, REJECTED
+from utils.thread_budget import configure_serving, get_budget
+from utils.weather_grid import WeatherGrid, WEATHER_FEATURES, epoch_minutes
 import json
 
 # Initialize Flask app
@@ -21,10 +33,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Size native thread pools for serving before any model runs
+configure_serving()
+
 # Initialize ML components
 prediction_model = PredictionModel()
+sharded_model = ShardedModelSet(prediction_model)
 data_processor = DataProcessor()
 feature_engineer = FeatureEngineer()
+train_states = TrainStateStore()
+drift_monitor = DriftMonitor(feature_engineer.feature_names)
+weather_grid = WeatherGrid()
+prediction_sweeper = PredictionSweeper(
+    prediction_model, data_processor, feature_engineer, create_prediction_store(), train_states,
+    simulator=NetworkSimulator(), weather=weather_grid, sharded_model=sharded_model
+)
+admission = AdmissionController()
+
+# Rows scored per model call when streaming batch predictions
+STREAM_CHUNK_SIZE = int(os.getenv('ML_STREAM_CHUNK_SIZE', 1000))
+
+def grid_weather(data, train_state=None):
+    """Cached weather at the train's position, or its target station, if a grid covers it"""
+    location = data.get('current_location') or train_state or {}
+    return weather_grid.weather_at(location.get('latitude'), location.get('longitude'), data.get('station_id'))
+
+def recent_tracking(data):
+    """Tracking points sent with a request, or the streamed ones for its train"""
+    return data.get('recent_tracking') or train_states.window_for(data.get('train_id'))
+
+def read_ndjson(stream):
+    """Yield one parsed object per line of an NDJSON stream, None for malformed lines"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+def read_chunks(items, size):
+    """Group an iterable into lists of at most size items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def admission_controlled(view):
+    """Hold a model slot for the request, or mark it for the fallback model under overload"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with admission.admit(admission.deadline_from(request.headers)) as mode:
+            if mode == REJECTED:
+                return jsonify({'error': 'Request deadline exceeded'}), 503
+            # Without a fallback model overflow is turned away, never run without a slot
+            if mode == DEGRADED and not prediction_model.has_fallback():
+                return jsonify({'error': 'Service overloaded'}), 503
+            g.degraded = mode == DEGRADED
+            response = app.make_response(view(*args, **kwargs))
+        if g.degraded:
+            response.headers['X-Prediction-Mode'] = DEGRADED
+        return response
+    return wrapper
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -37,6 +112,7 @@ def health_check():
     })
 
 @app.route('/predict', methods=['POST'])
+@admission_controlled
 def predict_arrival():
     """Predict train arrival time"""
     try:
@@ -50,34 +126,50 @@ def predict_arrival():
                     'error': f'Missing required field: {field}'
                 }), 400
         
-        # Extract features
-        features = feature_engineer.extract_features(data)
+        # Extract features, reading movement from the streamed train state when available
+        train_state = train_states.features_for(data['train_id'], data['station_id'])
+        features = feature_engineer.extract_features(data, train_state, grid_weather(data, train_state))
+        drift_monitor.update(features)
         
-        # Make prediction
-        prediction = prediction_model.predict(features)
+        # Under overload the global model's linear fallback answers instead
+        if g.degraded:
+            model = prediction_model
+            explain = False
+            prediction = model.predict_fast(features)
+        else:
+            # Route to the segment shard, falling back to the global model
+            model = sharded_model.get_model(sharded_model.segment_key(data, features))
+            
+            # Make prediction, with model-based factor attributions when requested
+            explain = bool(data.get('explain', False))
+            windows = tracking_windows([recent_tracking(data)]) if model.uses_tracking_windows() else None
+            prediction = model.predict(features, explain=explain, top_k=int(data.get('top_k', 3)), windows=windows)
         
         # Calculate confidence score
-        confidence = prediction_model.calculate_confidence(features, prediction)
+        confidence = model.calculate_confidence(features, prediction)
         
         # Determine delay
         scheduled_time = data.get('scheduled_time')
-        delay_minutes = 0
+        delay = 0
         
         if scheduled_time:
-            scheduled_dt = datetime.strptime(scheduled_time, '%H:%M:%S')
-            predicted_dt = datetime.strptime(prediction['predicted_time'], '%H:%M:%S')
-            delay_minutes = (predicted_dt - scheduled_dt).total_seconds() / 60
+            delay = delay_minutes(parse_minutes(scheduled_time), parse_minutes(prediction['predicted_time']))
         
         response = {
             'predicted_time': prediction['predicted_time'],
             'confidence_score': round(confidence, 2),
-            'delay_minutes': round(delay_minutes),
-            'prediction_method': 'ml_model',
+            'delay_minutes': round(delay),
+            'prediction_interval': prediction.get('prediction_interval'),
+            'prediction_method': 'ml_fallback' if g.degraded else 'ml_model',
             'factors': prediction.get('factors', []),
-            'model_version': prediction_model.get_version(),
+            'model_version': model.get_version(),
             'timestamp': datetime.now().isoformat()
         }
         
+        if explain:
+            response['factor_contributions'] = prediction.get('factor_contributions', [])
+            response['attribution_ms'] = prediction.get('attribution_ms')
+        
         logger.info(f"Prediction made for train {data['train_id']}, station {data['station_id']}")
         return jsonify(response)
         
@@ -89,6 +181,7 @@ def predict_arrival():
         }), 500
 
 @app.route('/batch_predict', methods=['POST'])
+@admission_controlled
 def batch_predict():
     """Batch prediction for multiple train-station pairs"""
     try:
@@ -99,20 +192,34 @@ def batch_predict():
             return jsonify({'error': 'No prediction data provided'}), 400
         
         results = []
+        explain = bool(data.get('explain', False))
+        top_k = int(data.get('top_k', 3))
         
         for pred_data in predictions_data:
             try:
-                features = feature_engineer.extract_features(pred_data)
-                prediction = prediction_model.predict(features)
-                confidence = prediction_model.calculate_confidence(features, prediction)
+                train_state = train_states.features_for(pred_data.get('train_id'), pred_data.get('station_id'))
+                features = feature_engineer.extract_features(pred_data, train_state, grid_weather(pred_data, train_state))
+                drift_monitor.update(features)
+                if g.degraded:
+                    model = prediction_model
+                    prediction = model.predict_fast(features)
+                else:
+                    model = sharded_model.get_model(sharded_model.segment_key(pred_data, features))
+                    windows = tracking_windows([recent_tracking(pred_data)]) if model.uses_tracking_windows() else None
+                    prediction = model.predict(features, explain=explain, top_k=top_k, windows=windows)
+                confidence = model.calculate_confidence(features, prediction)
                 
-                results.append({
+                result = {
                     'train_id': pred_data['train_id'],
                     'station_id': pred_data['station_id'],
                     'predicted_time': prediction['predicted_time'],
                     'confidence_score': round(confidence, 2),
+                    'prediction_interval': prediction.get('prediction_interval'),
                     'factors': prediction.get('factors', [])
-                })
+                }
+                if explain and not g.degraded:
+                    result['factor_contributions'] = prediction.get('factor_contributions', [])
+                results.append(result)
             except Exception as e:
                 logger.error(f"Batch prediction error for train {pred_data.get('train_id')}: {str(e)}")
                 results.append({
@@ -124,6 +231,7 @@ def batch_predict():
         return jsonify({
             'predictions': results,
             'total': len(results),
+            'prediction_method': 'ml_fallback' if g.degraded else 'ml_model',
             'timestamp': datetime.now().isoformat()
         })
         
@@ -134,6 +242,373 @@ def batch_predict():
             'message': str(e)
         }), 500
 
+def score_chunk(chunk):
+    """Score one chunk of batch requests with a model call per shard; results keep input order"""
+    results = [None] * len(chunk)
+    rows = []
+    positions = []
+    for i, pred_data in enumerate(chunk):
+        if not isinstance(pred_data, dict) or 'train_id' not in pred_data or 'station_id' not in pred_data:
+            results[i] = {'error': 'Missing required field: train_id or station_id'}
+            continue
+        try:
+            train_state = train_states.features_for(pred_data['train_id'], pred_data['station_id'])
+            features = feature_engineer.extract_features(pred_data, train_state)
+            location = pred_data.get('current_location') or train_state or {}
+            rows.append((i, pred_data, features))
+            positions.append((location.get('latitude'), location.get('longitude')))
+        except Exception as e:
+            results[i] = {'train_id': pred_data['train_id'], 'station_id': pred_data['station_id'], 'error': str(e)}
+    if not rows:
+        return results
+    
+    feature_matrix = np.array([
+        [features[name] for name in feature_engineer.feature_names] for _, _, features in rows
+    ], dtype=float)
+    
+    # Cached weather for the whole chunk in one interpolation, at each train or its target station
+    covered = weather_grid.apply(
+        feature_matrix, feature_engineer.feature_names,
+        [np.nan if latitude is None else latitude for latitude, _ in positions],
+        [np.nan if longitude is None else longitude for _, longitude in positions],
+        station_ids=[pred_data['station_id'] for _, pred_data, _ in rows]
+    )
+    for position in np.flatnonzero(covered):
+        features = rows[position][2]
+        for name in WEATHER_FEATURES:
+            features[name] = float(feature_matrix[position, feature_engineer.feature_names.index(name)])
+    drift_monitor.update(feature_matrix)
+    
+    # Each chunk is admitted like one batch request and degrades as a whole
+    with admission.admit(admission.deadline_from(request.headers)) as mode:
+        fast = mode != FULL
+        if fast and not prediction_model.has_fallback():
+            # Nothing cheap to answer with, so the chunk fails rather than running without a slot
+            error = 'Request deadline exceeded' if mode == REJECTED else 'Service overloaded'
+            for i, pred_data, _ in rows:
+                results[i] = {'train_id': pred_data['train_id'], 'station_id': pred_data['station_id'], 'error': error}
+            return results
+        groups = {}
+        for position, (_, pred_data, features) in enumerate(rows):
+            model = prediction_model if fast else sharded_model.get_model(sharded_model.segment_key(pred_data, features))
+            groups.setdefault(id(model), (model, []))[1].append(position)
+        
+        for model, positions in groups.values():
+            windows = None
+            if not fast and model.uses_tracking_windows():
+                windows = tracking_windows([recent_tracking(rows[position][1]) for position in positions])
+            scored = model.predict_many(feature_matrix[positions], fast=fast, windows=windows)
+            uncertainty = scored['uncertainty']
+            predicted_times = format_minutes_array(scored['scheduled_minutes'] + scored['delay_minutes'])
+            if uncertainty is not None:
+                earliest_times = format_minutes_array(scored['scheduled_minutes'] + uncertainty['lower'])
+                latest_times = format_minutes_array(scored['scheduled_minutes'] + uncertainty['upper'])
+            for k, position in enumerate(positions):
+                i, pred_data, features = rows[position]
+                delay = float(scored['delay_minutes'][k])
+                result = {
+                    'train_id': pred_data['train_id'],
+                    'station_id': pred_data['station_id'],
+                    'predicted_time': str(predicted_times[k]),
+                    'delay_minutes': round(delay),
+                    'confidence_score': round(model.calculate_confidence(features, None), 2),
+                    'prediction_interval': None,
+                    'prediction_method': 'ml_fallback' if fast else 'ml_model',
+                    'factors': model.analyze_prediction_factors(features, delay)
+                }
+                if uncertainty is not None:
+                    result['confidence_score'] = round(float(uncertainty['confidence'][k]), 2)
+                    result['prediction_interval'] = {
+                        'level': model.interval_level,
+                        'lower_delay_minutes': round(float(uncertainty['lower'][k]), 1),
+                        'upper_delay_minutes': round(float(uncertainty['upper'][k]), 1),
+                        'earliest_time': str(earliest_times[k]),
+                        'latest_time': str(latest_times[k])
+                    }
+                results[i] = result
+    
+    return results
+
+@app.route('/batch_predict/stream', methods=['POST'])
+def batch_predict_stream():
+    """Score an NDJSON stream of prediction requests in chunks, streaming NDJSON results back"""
+    if request.mimetype == 'application/x-ndjson':
+        items = read_ndjson(request.stream)
+    else:
+        data = request.get_json(silent=True) or {}
+        items = data.get('predictions', [])
+        if not items:
+            return jsonify({'error': 'No prediction data provided'}), 400
+    
+    def generate():
+        total = errors = 0
+        started = datetime.now()
+        try:
+            # Memory stays at one chunk of requests and results however long the stream is
+            for chunk in read_chunks(items, STREAM_CHUNK_SIZE):
+                results = score_chunk(chunk)
+                total += len(results)
+                errors += sum(1 for result in results if 'error' in result)
+                yield ''.join(json.dumps(result) + '\n' for result in results)
+        except Exception as e:
+            logger.error(f"Streaming batch prediction error: {str(e)}")
+            yield json.dumps({'error': 'Batch prediction failed', 'message': str(e)}) + '\n'
+        
+        # A closing summary line lets clients tell a complete stream from a cut one
+        yield json.dumps({
+            'summary': {
+                'total': total,
+                'errors': errors,
+                'elapsed_ms': round((datetime.now() - started).total_seconds() * 1000, 1),
+                'timestamp': datetime.now().isoformat()
+            }
+        }) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/predict_route', methods=['POST'])
+@admission_controlled
+def predict_route():
+    """Predict arrivals at every remaining stop of a train in one pass"""
+    try:
+        data = request.get_json()
+        
+        if 'train_id' not in data:
+            return jsonify({'error': 'Missing required field: train_id'}), 400
+        
+        stops = data.get('stops', [])
+        if not stops:
+            return jsonify({'error': 'No stops provided'}), 400
+        
+        # Fill in stop distances the caller did not send from the streamed position
+        distances = train_states.distances_for(data['train_id'], [stop.get('station_id') for stop in stops])
+        stops = [
+            {**stop, 'distance_km': distance} if stop.get('distance_km') is None else stop
+            for stop, distance in zip(stops, distances)
+        ]
+        
+        # Extract the train state once and expand it to one row per stop
+        train_state = train_states.features_for(data['train_id'])
+        feature_matrix, features = feature_engineer.extract_route_features(data, stops, train_state)
+        
+        # Weather at each stop's station around its scheduled time
+        midnight = epoch_minutes(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0))
+        unknown = np.full(len(stops), np.nan)
+        weather_grid.apply(
+            feature_matrix, feature_engineer.feature_names, unknown, unknown,
+            midnight + feature_matrix[:, feature_engineer.feature_names.index('scheduled_time_minutes')],
+            station_ids=[stop.get('station_id') for stop in stops]
+        )
+        drift_monitor.update(feature_matrix)
+        if g.degraded:
+            model = prediction_model
+        else:
+            model = sharded_model.get_model(sharded_model.segment_key(data, features))
+        
+        windows = None
+        if not g.degraded and model.uses_tracking_windows():
+            windows = np.repeat(tracking_windows([recent_tracking(data)]), len(stops), axis=0)
+        
+        route = model.predict_route(
+            feature_matrix,
+            carried_delay=float(data.get('current_delay_minutes', 0) or 0),
+            fast=g.degraded,
+            windows=windows
+        )
+        uncertainty = route['uncertainty']
+        scheduled = route['scheduled_minutes']
+        predicted_times = format_minutes_array(scheduled + route['delay_minutes'])
+        if uncertainty is not None:
+            earliest_times = format_minutes_array(scheduled + uncertainty['lower'])
+            latest_times = format_minutes_array(scheduled + uncertainty['upper'])
+        
+        predictions = []
+        for i, stop in enumerate(stops):
+            delay = float(route['delay_minutes'][i])
+            prediction = {
+                'station_id': stop.get('station_id'),
+                'scheduled_time': stop.get('scheduled_time'),
+                'predicted_time': str(predicted_times[i]),
+                'delay_minutes': round(delay),
+                'confidence_score': 0.6,
+                'prediction_method': 'ml_fallback' if g.degraded else 'ml_model',
+                'factors': model.analyze_prediction_factors(
+                    dict(zip(model.feature_names, feature_matrix[i])), delay
+                )
+            }
+            if uncertainty is not None:
+                prediction['confidence_score'] = round(float(uncertainty['confidence'][i]), 2)
+                prediction['prediction_interval'] = {
+                    'level': model.interval_level,
+                    'lower_delay_minutes': round(float(uncertainty['lower'][i]), 1),
+                    'upper_delay_minutes': round(float(uncertainty['upper'][i]), 1),
+                    'earliest_time': str(earliest_times[i]),
+                    'latest_time': str(latest_times[i])
+                }
+            predictions.append(prediction)
+        
+        logger.info(f"Route prediction made for train {data['train_id']}, {len(stops)} stops")
+        return jsonify({
+            'train_id': data['train_id'],
+            'predictions': predictions,
+            'total': len(predictions),
+            'model_version': model.get_version(),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Route prediction error: {str(e)}")
+        return jsonify({
+            'error': 'Route prediction failed',
+            'message': str(e)
+        }), 500
+
+@app.route('/ingest/tracking', methods=['POST'])
+def ingest_tracking():
+    """Ingest a batch or an NDJSON stream of tracking points into the live train state"""
+    try:
+        totals = {'accepted': 0, 'rejected': 0, 'trains': 0}
+        
+        def apply(batch):
+            result = train_states.ingest(batch)
+            for key in totals:
+                totals[key] += result[key]
+        
+        if request.mimetype == 'application/x-ndjson':
+            # Apply the stream in batches as it arrives instead of buffering the body
+            for batch in read_chunks(read_ndjson(request.stream), INGEST_BATCH_SIZE):
+                points = [point for point in batch if point is not None]
+                totals['rejected'] += len(batch) - len(points)
+                if points:
+                    apply(points)
+        else:
+            data = request.get_json()
+            points = data.get('points', []) if isinstance(data, dict) else data
+            if not points:
+                return jsonify({'error': 'No tracking points provided'}), 400
+            apply(points)
+        
+        return jsonify({
+            **totals,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Tracking ingest error: {str(e)}")
+        return jsonify({
+            'error': 'Tracking ingest failed',
+            'message': str(e)
+        }), 500
+
+@app.route('/trains/<int:train_id>/state', methods=['GET'])
+def get_train_state(train_id):
+    """Get the live movement state of a train"""
+    state = train_states.features_for(train_id)
+    if state is None:
+        return jsonify({'error': 'No live state for train'}), 404
+    return jsonify(state)
+
+@app.route('/predictions/<int:train_id>', methods=['GET'])
+def get_precomputed_predictions(train_id):
+    """Get the latest precomputed predictions for a train's upcoming stops"""
+    try:
+        predictions, version = prediction_sweeper.lookup(train_id)
+        if predictions is None:
+            return jsonify({'error': 'No current precomputed predictions for train'}), 404
+        return jsonify({
+            'train_id': train_id,
+            'predictions': predictions,
+            'total': len(predictions),
+            'version': version
+        })
+    except Exception as e:
+        logger.error(f"Precomputed lookup error: {str(e)}")
+        return jsonify({
+            'error': 'Failed to read precomputed predictions',
+            'message': str(e)
+        }), 500
+
+@app.route('/predictions/<int:train_id>/<int:station_id>', methods=['GET'])
+def get_precomputed_prediction(train_id, station_id):
+    """Get the latest precomputed prediction for one stop of a train"""
+    try:
+        prediction, version = prediction_sweeper.lookup(train_id, station_id)
+        if prediction is None:
+            return jsonify({'error': 'No current precomputed prediction for stop'}), 404
+        return jsonify({**prediction, 'train_id': train_id, 'version': version})
+    except Exception as e:
+        logger.error(f"Precomputed lookup error: {str(e)}")
+        return jsonify({
+            'error': 'Failed to read precomputed prediction',
+            'message': str(e)
+        }), 500
+
+@app.route('/weather/grids', methods=['POST'])
+def ingest_weather_grids():
+    """Ingest gridded weather observations or forecasts into the weather cache"""
+    try:
+        data = request.get_json()
+        grids = data.get('grids', [data]) if isinstance(data, dict) else data
+        if not grids:
+            return jsonify({'error': 'No weather grids provided'}), 400
+        
+        accepted = 0
+        errors = []
+        for i, grid in enumerate(grids):
+            try:
+                weather_grid.write(grid)
+                accepted += 1
+            except (KeyError, TypeError, ValueError) as e:
+                errors.append({'index': i, 'error': str(e)})
+        
+        return jsonify({
+            'accepted': accepted,
+            'rejected': len(errors),
+            'errors': errors,
+            'weather': weather_grid.get_info()
+        }), 200 if accepted else 400
+    except Exception as e:
+        logger.error(f"Weather ingest error: {str(e)}")
+        return jsonify({
+            'error': 'Weather ingest failed',
+            'message': str(e)
+        }), 500
+
+@app.route('/weather', methods=['GET'])
+def get_weather():
+    """Get cached weather at a position (lat, lon) or a station (station_id)"""
+    weather = weather_grid.weather_at(
+        request.args.get('lat', type=float),
+        request.args.get('lon', type=float),
+        request.args.get('station_id', type=int),
+        request.args.get('time')
+    )
+    if weather is None:
+        return jsonify({'error': 'No weather grid covers this point'}), 404
+    return jsonify(weather)
+
+@app.route('/network/delays/<int:train_id>', methods=['GET'])
+def get_network_delay(train_id):
+    """Get the knock-on delay a train picks up from other trains over the simulation horizon"""
+    network_delay = prediction_sweeper.lookup_network_delay(train_id)
+    if network_delay is None:
+        return jsonify({'error': 'No network simulation for train'}), 404
+    return jsonify({
+        **network_delay,
+        'train_id': train_id,
+        'computed_at': (prediction_sweeper.last_run or {}).get('computed_at')
+    })
+
+@app.route('/precompute/run', methods=['POST'])
+def run_precompute():
+    """Run a prediction sweep now instead of waiting for the schedule"""
+    result = prediction_sweeper.run()
+    return jsonify({
+        'message': 'Prediction sweep published' if result else 'Prediction sweep skipped',
+        'sweep': result,
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/retrain', methods=['POST'])
 def retrain_model():
     """Retrain the ML model with new data"""
@@ -143,6 +618,7 @@ def retrain_model():
         # Get training parameters
         model_type = data.get('model_type', 'random_forest')
         use_recent_data_only = data.get('use_recent_data_only', False)
+        train_shards = data.get('sharded', False)
         
         # Start retraining process
         result = prediction_model.retrain(
@@ -150,12 +626,19 @@ def retrain_model():
             use_recent_data_only=use_recent_data_only
         )
         
+        shards = sharded_model.retrain(model_type=model_type) if train_shards else None
+        drift_monitor.set_reference(prediction_model.drift_reference)
+        
+        # Republish so precomputed predictions come from the new model
+        prediction_sweeper.run()
+        
         logger.info(f"Model retrained successfully: {result}")
         
         return jsonify({
             'message': 'Model retrained successfully',
             'model_type': model_type,
             'training_metrics': result.get('metrics', {}),
+            'shards': shards,
             'timestamp': datetime.now().isoformat()
         })
         
@@ -171,6 +654,12 @@ def model_info():
     """Get information about the current model"""
     try:
         info = prediction_model.get_model_info()
+        info['shards'] = sharded_model.get_info()
+        info['train_state'] = train_states.get_info()
+        info['precompute'] = prediction_sweeper.get_info()
+        info['admission'] = admission.get_info()
+        info['thread_budget'] = get_budget()
+        info['weather'] = weather_grid.get_info()
         return jsonify(info)
     except Exception as e:
         logger.error(f"Model info error: {str(e)}")
@@ -179,6 +668,27 @@ def model_info():
             'message': str(e)
         }), 500
 
+@app.route('/model/drift', methods=['GET'])
+def model_drift():
+    """Compare live feature distributions against the training snapshot"""
+    try:
+        return jsonify(drift_monitor.report())
+    except Exception as e:
+        logger.error(f"Drift report error: {str(e)}")
+        return jsonify({
+            'error': 'Failed to compute drift report',
+            'message': str(e)
+        }), 500
+
+@app.route('/model/drift/reset', methods=['POST'])
+def reset_drift():
+    """Start a new live window for drift monitoring"""
+    drift_monitor.reset()
+    return jsonify({
+        'message': 'Drift sketches reset',
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/model/metrics', methods=['GET'])
 def model_metrics():
     """Get model performance metrics"""
@@ -228,6 +738,30 @@ if __name__ == '__main__':
         logger.info("🔄 Training new model...")
         prediction_model.train_initial_model()
     
+    # Live inputs are compared against the distribution the model was trained on
+    drift_monitor.set_reference(prediction_model.drift_reference)
+    
+    # Station locations let streamed positions be turned into distances
+    station_coordinates = data_processor.load_station_coordinates()
+    train_states.set_station_coordinates(station_coordinates)
+    weather_grid.set_station_coordinates(station_coordinates)
+    
+    # Load dropped weather grids and keep watching for new ones
+    weather_grid.start()
+    
+    # Seed live train state for the whole fleet in one query so a restart is not blind
+    active_stops = data_processor.load_active_stops()
+    if not active_stops.empty:
+        recent, train_ids, _ = data_processor.load_real_time_data_bulk(active_stops['train_id'].unique())
+        if not recent.empty:
+            # Oldest first, since a train's state only moves forward in time
+            recent = recent.iloc[::-1]
+            result = train_states.ingest(recent.astype(object).where(recent.notna(), None).to_dict('records'))
+            logger.info(f"Seeded live state for {result['trains']} of {len(train_ids)} tracked trains")
+    
+    # Keep predictions for every active train precomputed for cheap lookups
+    prediction_sweeper.start()
+    
     # Start Flask app
     port = int(os.environ.get('ML_SERVICE_PORT', 8000))
     debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
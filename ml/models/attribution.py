@@ -0,0 +1,161 @@
+import logging
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.linear_model import LinearRegression
+from models.compression import CompactForest
+
+logger = logging.getLogger(__name__)
+
+# Thresholds behind the heuristic prediction factors
+HEAVY_RAINFALL_MM = 5
+REDUCED_SPEED_KMH = 30
+
+# Factor names reported to clients; several features can share one factor
+FEATURE_FACTORS = {
+    'hour': 'time_of_day',
+    'day_of_week': 'day_of_week',
+    'is_weekend': 'day_of_week',
+    'is_peak_hour': 'peak_hour',
+    'weather_temp': 'temperature',
+    'weather_humidity': 'humidity',
+    'weather_rainfall': 'rainfall',
+    'distance_to_station': 'distance_remaining',
+    'current_speed': 'speed',
+    'scheduled_time_minutes': 'time_of_day',
+    'train_type_express': 'train_service_type',
+    'train_type_intercity': 'train_service_type',
+    'historical_avg_delay': 'historical_delays'
+}
+
+# A factor is reported under the rule-based analysis's condition name only for
+# rows whose raw feature value meets that condition: (feature, test, threshold, name)
+FACTOR_CONDITIONS = {
+    'rainfall': ('weather_rainfall', np.greater, HEAVY_RAINFALL_MM, 'heavy_rainfall'),
+    'speed': ('current_speed', np.less, REDUCED_SPEED_KMH, 'reduced_speed'),
+    'peak_hour': ('is_peak_hour', np.not_equal, 0, 'peak_hour_traffic')
+}
+
+
+class ModelAttributor:
+    def __init__(self, model, feature_names):
+        self.model = model
+        self.feature_names = list(feature_names)
+        self.trees = []
+        self.path_contributions = None
+        self.node_offsets = None
+        self.scale = 1.0
+
+        # Several features share a factor; a 0/1 matrix folds them together
+        self.factor_names = sorted(set(
+            FEATURE_FACTORS.get(name, name) for name in self.feature_names
+        ))
+        self.factor_matrix = np.zeros((len(self.feature_names), len(self.factor_names)))
+        for i, name in enumerate(self.feature_names):
+            self.factor_matrix[i, self.factor_names.index(FEATURE_FACTORS.get(name, name))] = 1
+
+        self.compile()
+
+    @staticmethod
+    def supports(model):
+        """Check whether attributions can be computed for a model"""
+        return isinstance(model, (RandomForestRegressor, GradientBoostingRegressor, CompactForest, LinearRegression))
+
+    def _tree_path_contributions(self, tree):
+        """Dense (nodes x features) sum of split deltas from the root to each node"""
+        tree = tree.tree_
+        left, right = tree.children_left, tree.children_right
+        values = tree.value[:, 0, 0]
+        paths = np.zeros((tree.node_count, len(self.feature_names)), dtype=np.float32)
+
+        # Walk the tree one level at a time so each level is a single array operation
+        frontier = np.array([0])
+        while frontier.size:
+            parents = frontier[left[frontier] >= 0]
+            for children in (left[parents], right[parents]):
+                paths[children] = paths[parents]
+                paths[children, tree.feature[parents]] += values[children] - values[parents]
+            frontier = np.concatenate([left[parents], right[parents]])
+
+        return paths
+
+    def _compact_path_contributions(self, forest):
+        """Root-to-node contributions over a compact forest's flattened node arrays"""
+        paths = np.zeros((forest.node_count, len(self.feature_names)), dtype=np.float32)
+
+        # Leaves point at themselves; every root starts the walk at once
+        frontier = forest.roots
+        while frontier.size:
+            parents = frontier[forest.left[frontier] != frontier]
+            for children in (forest.left[parents], forest.right[parents]):
+                paths[children] = paths[parents]
+                paths[children, forest.feature[parents]] += forest.value[children] - forest.value[parents]
+            frontier = np.concatenate([forest.left[parents], forest.right[parents]])
+
+        return paths
+
+    def compile(self):
+        """Precompute root-to-node contributions for every tree in the ensemble"""
+        if isinstance(self.model, CompactForest):
+            # Leaf indices already address the flattened arrays, so no offsets
+            self.path_contributions = self._compact_path_contributions(self.model)
+            self.node_offsets = 0
+            self.scale = 1.0 / self.model.n_estimators
+            return
+        if isinstance(self.model, RandomForestRegressor):
+            self.trees = list(self.model.estimators_)
+            self.scale = 1.0 / len(self.trees)
+        elif isinstance(self.model, GradientBoostingRegressor):
+            self.trees = list(self.model.estimators_[:, 0])
+            self.scale = self.model.learning_rate
+        else:
+            return
+
+        paths = [self._tree_path_contributions(tree) for tree in self.trees]
+        self.node_offsets = np.cumsum([0] + [len(p) for p in paths[:-1]])
+        self.path_contributions = np.vstack(paths)
+
+    def contributions(self, features_scaled):
+        """Per-row, per-feature contributions to the predicted delay in minutes"""
+        features_scaled = np.asarray(features_scaled)
+
+        if isinstance(self.model, LinearRegression):
+            # Scaled training features are zero-mean, so each term is its contribution
+            return features_scaled * self.model.coef_
+
+        # A row's contribution from one tree is the precomputed path sum at its leaf
+        features_32 = np.ascontiguousarray(features_scaled, dtype=np.float32)
+        if isinstance(self.model, CompactForest):
+            leaves = self.model.apply(features_32).T
+        else:
+            leaves = np.column_stack([
+                tree.apply(features_32, check_input=False) for tree in self.trees
+            ])
+        return self.path_contributions[leaves + self.node_offsets].sum(axis=1) * self.scale
+
+    def factor_labels(self, features, rows):
+        """Per-row factor names, using condition names where the raw feature meets them"""
+        labels = np.tile(np.array(self.factor_names, dtype=object), (rows, 1))
+        if features is None:
+            return labels
+
+        features = np.asarray(features, dtype=float).reshape(rows, -1)
+        for factor, (feature, test, threshold, name) in FACTOR_CONDITIONS.items():
+            if factor in self.factor_names and feature in self.feature_names:
+                met = test(features[:, self.feature_names.index(feature)], threshold)
+                labels[met, self.factor_names.index(factor)] = name
+        return labels
+
+    def top_factors(self, features_scaled, top_k=3, features=None):
+        """Return the top-k delay drivers for each row, given the unscaled rows for condition names"""
+        factor_contributions = self.contributions(features_scaled) @ self.factor_matrix
+        order = np.argsort(-factor_contributions, axis=1)[:, :top_k]
+        labels = self.factor_labels(features, len(factor_contributions))
+
+        results = []
+        for row, names, indices in zip(factor_contributions, labels, order):
+            drivers = [
+                {'factor': names[i], 'contribution_minutes': round(float(row[i]), 2)}
+                for i in indices if row[i] > 0
+            ]
+            results.append(drivers)
+        return results
@@ -0,0 +1,100 @@
+import logging
+from datetime import datetime
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.preprocessing import StandardScaler
+from models.prediction_model import PredictionModel
+from utils.thread_budget import training_threads
+
+logger = logging.getLogger(__name__)
+
+
+def _evaluate_window(X, y, train_start, train_end, test_end, model_type, model_params):
+    """Fit on one rolling-origin window and score the period right after it"""
+    # X and y are the shared time-ordered matrices; slicing them only creates views
+    X_train, y_train = X[train_start:train_end], y[train_start:train_end]
+    X_test, y_test = X[train_end:test_end], y[train_end:test_end]
+
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+
+    model = PredictionModel().build_estimator(model_type, model_params)
+    model.fit(X_train_scaled, y_train)
+
+    errors = np.abs(model.predict(X_test_scaled) - y_test)
+    return {
+        'mae': float(errors.mean()),
+        'accuracy_within_5min': float((errors <= 5).mean()),
+        'accuracy_within_10min': float((errors <= 10).mean())
+    }
+
+
+class Backtester:
+    def __init__(self, model_type='random_forest', model_params=None, n_jobs=None):
+        self.model_type = model_type
+        self.model_params = model_params
+        self.n_jobs = n_jobs or training_threads()
+
+        # Every window already runs in its own worker, so keep forests single-threaded
+        if model_type == 'random_forest' and model_params is None:
+            self.model_params = {'n_jobs': 1}
+
+    def rolling_windows(self, n_samples, n_windows=5, min_train_fraction=0.5, window_size=None):
+        """Build (train_start, train_end, test_end) index triples over time-ordered rows"""
+        min_train = int(n_samples * min_train_fraction)
+        test_size = (n_samples - min_train) // n_windows
+        if min_train <= 0 or test_size <= 0:
+            raise ValueError(f"Not enough samples ({n_samples}) for {n_windows} windows")
+
+        windows = []
+        for i in range(n_windows):
+            train_end = min_train + i * test_size
+            test_end = n_samples if i == n_windows - 1 else train_end + test_size
+            # Expanding origin by default, sliding when a fixed window size is given
+            train_start = max(0, train_end - window_size) if window_size else 0
+            windows.append((train_start, train_end, test_end))
+        return windows
+
+    def run(self, X, y, timestamps, n_windows=5, min_train_fraction=0.5, window_size=None):
+        """Replay history in rolling-origin windows ordered by timestamp"""
+        timestamps = np.asarray(timestamps)
+        order = np.argsort(timestamps, kind='stable')
+
+        # Build the ordered feature matrix once; joblib memory-maps it so every
+        # worker reads the same cached copy instead of receiving its own
+        X_sorted = np.ascontiguousarray(np.asarray(X, dtype=np.float64)[order])
+        y_sorted = np.ascontiguousarray(np.asarray(y, dtype=np.float64)[order])
+        ts_sorted = timestamps[order]
+
+        windows = self.rolling_windows(len(X_sorted), n_windows, min_train_fraction, window_size)
+        logger.info(f"Backtesting {self.model_type} over {len(windows)} windows...")
+
+        scores = Parallel(n_jobs=self.n_jobs, max_nbytes='1M')(
+            delayed(_evaluate_window)(
+                X_sorted, y_sorted, train_start, train_end, test_end,
+                self.model_type, self.model_params
+            )
+            for train_start, train_end, test_end in windows
+        )
+
+        results = []
+        for index, ((train_start, train_end, test_end), score) in enumerate(zip(windows, scores)):
+            results.append({
+                'window': index + 1,
+                'train_from': str(ts_sorted[train_start]),
+                'train_to': str(ts_sorted[train_end - 1]),
+                'test_from': str(ts_sorted[train_end]),
+                'test_to': str(ts_sorted[test_end - 1]),
+                'train_samples': train_end - train_start,
+                'test_samples': test_end - train_end,
+                **score
+            })
+
+        return {
+            'model_type': self.model_type,
+            'windows': results,
+            'mean_mae': float(np.mean([w['mae'] for w in results])),
+            'mean_accuracy_within_5min': float(np.mean([w['accuracy_within_5min'] for w in results])),
+            'run_at': datetime.now().isoformat()
+        }
@@ -0,0 +1,236 @@
+import io
+import os
+import copy
+import time
+import logging
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_METHODS = ('prune', 'compact', 'distill')
+
+# Largest relative increase in held-out MAE a compressed model may cost
+MAX_MAE_INCREASE = float(os.getenv('ML_COMPRESSION_MAX_MAE_INCREASE', 0.02))
+
+# Pruned forests keep at least this many trees so the spread stays meaningful
+MIN_TREES = 10
+
+# Student used for distillation: a shallow boosted ensemble fitted to the forest's outputs
+STUDENT_PARAMS = {
+    'n_estimators': 80,
+    'max_depth': 4,
+    'learning_rate': 0.1,
+    'random_state': 42
+}
+
+
+class CompactForest:
+    """Random forest flattened into contiguous float32 node arrays
+
+    All trees are walked together with numpy indexing. Leaves point at
+    themselves, so a fixed number of steps (the deepest tree) reaches every leaf.
+    """
+
+    def __init__(self, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        counts = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        left = np.concatenate([tree.children_left for tree in trees])
+        right = np.concatenate([tree.children_right for tree in trees])
+        feature = np.concatenate([tree.feature for tree in trees])
+        threshold = np.concatenate([tree.threshold for tree in trees])
+        value = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+
+        node_offsets = np.repeat(offsets, counts)
+        own = np.arange(len(left))
+        leaf = left < 0
+
+        self.roots = offsets.astype(np.int32)
+        self.left = np.where(leaf, own, left + node_offsets).astype(np.int32)
+        self.right = np.where(leaf, own, right + node_offsets).astype(np.int32)
+        self.feature = np.where(leaf, 0, feature).astype(np.int16 if forest.n_features_in_ < 2 ** 15 else np.int32)
+
+        # Trees compare float32 inputs with float64 thresholds; rounding each
+        # threshold down to the float32 at or below it keeps every split identical
+        threshold_32 = threshold.astype(np.float32)
+        too_high = threshold_32.astype(np.float64) > threshold
+        threshold_32[too_high] = np.nextafter(threshold_32[too_high], np.float32(-np.inf))
+        self.threshold = np.where(leaf, np.float32(np.inf), threshold_32).astype(np.float32)
+
+        self.value = value.astype(np.float32)
+        self.depth = int(max(tree.max_depth for tree in trees))
+        self.n_features_in_ = forest.n_features_in_
+        self.n_estimators = len(trees)
+
+    @property
+    def node_count(self):
+        return len(self.left)
+
+    def apply(self, X):
+        """Leaf reached in every tree, as indices into the node arrays, shape (n_trees, n_rows)"""
+        X = np.asarray(X, dtype=np.float32)
+        node = np.repeat(self.roots[:, None], len(X), axis=1)
+        rows = np.arange(len(X))[None, :]
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_trees(self, X):
+        """Per-tree predictions, shape (n_trees, n_rows)"""
+        return self.value[self.apply(X)]
+
+    def predict_distribution(self, X):
+        """Forest mean and the spread of its trees"""
+        tree_predictions = self.predict_trees(X)
+        return tree_predictions.mean(axis=0, dtype=np.float64), tree_predictions.std(axis=0, dtype=np.float64)
+
+    def predict(self, X):
+        return self.predict_distribution(X)[0]
+
+
+def node_count(estimator):
+    """Total decision nodes of a tree ensemble (0 for other models)"""
+    if isinstance(estimator, CompactForest):
+        return estimator.node_count
+    if isinstance(estimator, RandomForestRegressor):
+        return int(sum(tree.tree_.node_count for tree in estimator.estimators_))
+    if isinstance(estimator, GradientBoostingRegressor):
+        return int(sum(tree.tree_.node_count for tree in estimator.estimators_[:, 0]))
+    return 0
+
+
+def prune_forest(forest, X_select, y_select, max_mae_increase=MAX_MAE_INCREASE):
+    """Keep the smallest set of trees that matches the full forest on held-out rows
+
+    Trees are added greedily, each time the one that most lowers the ensemble
+    error (ordered aggregation), until the error is within the tolerance.
+    """
+    X_32 = np.ascontiguousarray(X_select, dtype=np.float32)
+    tree_predictions = np.stack([tree.predict(X_32, check_input=False) for tree in forest.estimators_])
+    target_mae = np.abs(tree_predictions.mean(axis=0) - y_select).mean() * (1 + max_mae_increase)
+
+    remaining = list(range(len(tree_predictions)))
+    selected = []
+    running_sum = np.zeros(len(y_select))
+    while remaining:
+        candidates = (running_sum + tree_predictions[remaining]) / (len(selected) + 1)
+        errors = np.abs(candidates - y_select).mean(axis=1)
+        best = int(np.argmin(errors))
+        running_sum += tree_predictions[remaining[best]]
+        selected.append(remaining.pop(best))
+        if len(selected) >= MIN_TREES and errors[best] <= target_mae:
+            break
+
+    pruned = copy.copy(forest)
+    pruned.estimators_ = [forest.estimators_[i] for i in selected]
+    pruned.n_estimators = len(selected)
+    return pruned
+
+
+def distill(model, X_train_scaled):
+    """Fit a shallow boosted student to the model's own predictions"""
+    teacher, _ = model.predict_distribution(X_train_scaled)
+    student = GradientBoostingRegressor(**STUDENT_PARAMS)
+    student.fit(X_train_scaled, teacher)
+    return student
+
+
+def profile(model, estimator, X_eval_scaled, y_eval, repeats=200):
+    """Held-out error, serialized size, load time and latency of one candidate"""
+    buffer = io.BytesIO()
+    joblib.dump(estimator, buffer)
+    size = buffer.tell()
+    buffer.seek(0)
+    start = time.perf_counter()
+    joblib.load(buffer)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    # Score through the serving path so the forest spread is included
+    served = model.model
+    model.model = estimator
+    try:
+        y_pred, _ = model.predict_distribution(X_eval_scaled)
+        row = X_eval_scaled[:1]
+        single = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model.predict_distribution(row)
+            single.append(time.perf_counter() - start)
+        batch = X_eval_scaled[np.arange(1000) % len(X_eval_scaled)]
+        start = time.perf_counter()
+        model.predict_distribution(batch)
+        batch_ms = (time.perf_counter() - start) * 1000
+    finally:
+        model.model = served
+
+    return {
+        'mae': float(np.abs(y_pred - y_eval).mean()),
+        'nodes': node_count(estimator),
+        'size_kb': round(size / 1024, 1),
+        'load_ms': round(load_ms, 2),
+        'row_latency_ms': round(float(np.median(single)) * 1000, 3),
+        'batch_1000_ms': round(batch_ms, 2)
+    }
+
+
+def compress_model(model, X_train, y_train, X_holdout, y_holdout, methods=COMPRESSION_METHODS,
+                   max_mae_increase=MAX_MAE_INCREASE):
+    """Build compressed candidates, keep the fastest within the accuracy guardrail
+
+    Half of the held-out rows guide pruning, the other half judge every
+    candidate, so the guardrail is checked on rows no choice was fitted to.
+    The chosen model is recalibrated, saved and described in the report.
+    """
+    X_train_scaled = model.scaler.transform(X_train)
+    X_holdout_scaled = model.scaler.transform(X_holdout)
+    y_holdout = np.asarray(y_holdout, dtype=float)
+    half = len(X_holdout_scaled) // 2
+    X_select, y_select = X_holdout_scaled[:half], y_holdout[:half]
+    X_eval, y_eval = X_holdout_scaled[half:], y_holdout[half:]
+
+    original = model.model
+    candidates = {'original': original}
+    forest = original if isinstance(original, RandomForestRegressor) else None
+
+    if forest is not None and 'prune' in methods:
+        forest = candidates['pruned'] = prune_forest(forest, X_select, y_select, max_mae_increase)
+    if forest is not None and 'compact' in methods:
+        candidates['compact'] = CompactForest(forest)
+    # A student fitted on features alone cannot stand in for a model that reads tracking windows
+    if 'distill' in methods and not model.uses_tracking_windows():
+        candidates['distilled'] = distill(model, X_train_scaled)
+
+    report = {name: profile(model, estimator, X_eval, y_eval) for name, estimator in candidates.items()}
+    baseline = report['original']
+    limit = baseline['mae'] * (1 + max_mae_increase)
+    for name, stats in report.items():
+        stats['mae_increase'] = round(stats['mae'] / baseline['mae'] - 1, 4) if baseline['mae'] else 0.0
+        stats['within_guardrail'] = stats['mae'] <= limit
+        logger.info(
+            f"{name:<10} MAE {stats['mae']:6.3f} ({stats['mae_increase']:+.1%})  nodes {stats['nodes']:>8}  "
+            f"{stats['size_kb']:>9.1f} KB  load {stats['load_ms']:>7.2f} ms  "
+            f"row {stats['row_latency_ms']:>7.3f} ms  1000 rows {stats['batch_1000_ms']:>7.2f} ms"
+        )
+
+    accepted = [name for name in report if name != 'original' and report[name]['within_guardrail']]
+    # Serving cost decides among the accepted candidates, then footprint
+    chosen = min(accepted, key=lambda name: (report[name]['row_latency_ms'], report[name]['size_kb'])) if accepted else 'original'
+
+    if chosen != 'original':
+        model.model = candidates[chosen]
+        model._attributor = None
+        y_pred, y_spread = model.predict_distribution(X_eval)
+        model.calibrate(y_eval, y_pred, y_spread)
+    model.compression = {
+        'chosen': chosen,
+        'max_mae_increase': max_mae_increase,
+        'candidates': report
+    }
+    model.save_model()
+
+    logger.info(f"Compression chose {chosen} (guardrail +{max_mae_increase:.0%} MAE)")
+    return model.compression
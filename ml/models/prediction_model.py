@@ -3,28 +3,50 @@ import joblib
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.linear_model import LinearRegression
+from sklearn.linear_model import LinearRegression, Ridge
 from sklearn.neural_network import MLPRegressor
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import train_test_split, cross_val_score, check_cv, TimeSeriesSplit
+from sklearn.base import clone
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.preprocessing import StandardScaler
 import logging
+import time
 from datetime import datetime, timedelta
 import json
+from models.attribution import ModelAttributor, HEAVY_RAINFALL_MM, REDUCED_SPEED_KMH
+from models.sequence_model import SequenceRegressor
+from utils.time_codec import format_minutes
+from utils.drift_monitor import build_reference
+from utils.thread_budget import training_budget, training_threads, use_serving_threads
 
 logger = logging.getLogger(__name__)
 
+# Share of scheduled running time between stops a late train can win back
+RECOVERY_RATE = 0.05
+
+# Predicted delay above which a prediction is flagged as significant
+SIGNIFICANT_DELAY_MINUTES = 10
+
 class PredictionModel:
-    def __init__(self):
+    def __init__(self, model_dir=None):
         self.model = None
         self.scaler = StandardScaler()
         self.model_type = 'random_forest'
         self.model_version = '1.0.0'
         self.is_trained = False
         self.feature_names = []
-        self.model_path = os.path.join(os.path.dirname(__file__), 'trained_model.joblib')
-        self.scaler_path = os.path.join(os.path.dirname(__file__), 'scaler.joblib')
-        self.metadata_path = os.path.join(os.path.dirname(__file__), 'model_metadata.json')
+        self.calibration = None
+        self.drift_reference = None
+        self.fallback = None
+        self._fallback_weights = None
+        self.compression = None
+        self.interval_level = 0.9
+        self._attributor = None
+        self.last_attribution_ms = 0.0
+        self.model_dir = model_dir or os.path.dirname(__file__)
+        self.model_path = os.path.join(self.model_dir, 'trained_model.joblib')
+        self.scaler_path = os.path.join(self.model_dir, 'scaler.joblib')
+        self.metadata_path = os.path.join(self.model_dir, 'model_metadata.json')
 
     def is_loaded(self):
         """Check if model is loaded and ready"""
@@ -34,8 +56,9 @@ class PredictionModel:
         """Load trained model from disk"""
         try:
             if os.path.exists(self.model_path):
-                self.model = joblib.load(self.model_path)
+                self.model = use_serving_threads(joblib.load(self.model_path))
                 self.scaler = joblib.load(self.scaler_path)
+                self._attributor = None
                 
                 # Load metadata
                 if os.path.exists(self.metadata_path):
@@ -44,6 +67,11 @@ class PredictionModel:
                         self.model_type = metadata.get('model_type', 'random_forest')
                         self.model_version = metadata.get('version', '1.0.0')
                         self.feature_names = metadata.get('feature_names', [])
+                        self.calibration = metadata.get('calibration')
+                        self.drift_reference = metadata.get('drift_reference')
+                        self.fallback = metadata.get('fallback')
+                        self.compression = metadata.get('compression')
+                        self._fallback_weights = None
                 
                 self.is_trained = True
                 logger.info(f"Model loaded successfully: {self.model_type} v{self.model_version}")
@@ -70,6 +98,10 @@ class PredictionModel:
                 'model_type': self.model_type,
                 'version': self.model_version,
                 'feature_names': self.feature_names,
+                'calibration': self.calibration,
+                'drift_reference': self.drift_reference,
+                'fallback': self.fallback,
+                'compression': self.compression,
                 'trained_at': datetime.now().isoformat(),
                 'is_trained': self.is_trained
             }
@@ -140,48 +172,104 @@ class PredictionModel:
         
         return df.values, delay
 
-    def train(self, X, y, model_type='random_forest'):
-        """Train the prediction model"""
+    def build_estimator(self, model_type='random_forest', model_params=None):
+        """Create an untrained estimator for the given model type"""
+        model_params = model_params or {}
+        
+        if model_type == 'random_forest':
+            return RandomForestRegressor(**{
+                'n_estimators': 100,
+                'max_depth': 10,
+                'random_state': 42,
+                'n_jobs': training_threads(),
+                **model_params
+            })
+        elif model_type == 'gradient_boosting':
+            return GradientBoostingRegressor(**{
+                'n_estimators': 100,
+                'max_depth': 6,
+                'random_state': 42,
+                **model_params
+            })
+        elif model_type == 'sequence':
+            return SequenceRegressor(**model_params)
+        elif model_type == 'neural_network':
+            return MLPRegressor(
+                hidden_layer_sizes=(100, 50),
+                max_iter=500,
+                random_state=42
+            )
+        return LinearRegression()
+
+    def split_data(self, X, y, timestamps=None):
+        """Split into training and held-out rows, with the matching cross-validation scheme"""
+        if timestamps is not None:
+            # Hold out the most recent 20% so evaluation never sees the future
+            order = np.argsort(np.asarray(timestamps), kind='stable')
+            X = np.asarray(X)[order]
+            y = np.asarray(y)[order]
+            split = int(len(X) * 0.8)
+            return X[:split], X[split:], y[:split], y[split:], TimeSeriesSplit(n_splits=5)
+        
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42
+        )
+        return X_train, X_test, y_train, y_test, 5
+
+    def cross_validate(self, X, y, cv, windows=None):
+        """Cross-validated negative MAE, feeding each fold its tracking windows when there are any"""
+        if windows is None:
+            return cross_val_score(self.model, X, y, cv=cv, scoring='neg_mean_absolute_error')
+        
+        scores = []
+        for fold_train, fold_test in check_cv(cv).split(X):
+            fold_model = clone(self.model).fit(X[fold_train], y[fold_train], windows=windows[fold_train])
+            scores.append(-mean_absolute_error(y[fold_test], fold_model.predict(X[fold_test], windows[fold_test])))
+        return np.array(scores)
+
+    def train(self, X, y, model_type='random_forest', model_params=None, timestamps=None, windows=None):
+        """Train the prediction model
+        
+        windows holds each row's recent tracking window for the sequence model.
+        """
         try:
             self.model_type = model_type
-            
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.2, random_state=42
-            )
+            self.compression = None
+            X = np.asarray(X, dtype=float)
+            # Folds index targets by position, so a pandas Series is flattened first
+            y = np.asarray(y, dtype=float)
+            index_train, index_test, y_train, y_test, cv = self.split_data(np.arange(len(X)), y, timestamps)
+            X_train, X_test = X[index_train], X[index_test]
+            windows_train = windows_test = None
+            if windows is not None:
+                windows_train, windows_test = windows[index_train], windows[index_test]
+            
+            # Snapshot the raw training distribution for drift monitoring
+            self.drift_reference = build_reference(X_train, self.feature_names)
             
             # Scale features
             X_train_scaled = self.scaler.fit_transform(X_train)
             X_test_scaled = self.scaler.transform(X_test)
             
             # Initialize model based on type
-            if model_type == 'random_forest':
-                self.model = RandomForestRegressor(
-                    n_estimators=100,
-                    max_depth=10,
-                    random_state=42,
-                    n_jobs=-1
-                )
-            elif model_type == 'gradient_boosting':
-                self.model = GradientBoostingRegressor(
-                    n_estimators=100,
-                    max_depth=6,
-                    random_state=42
-                )
-            elif model_type == 'neural_network':
-                self.model = MLPRegressor(
-                    hidden_layer_sizes=(100, 50),
-                    max_iter=500,
-                    random_state=42
-                )
-            else:
-                self.model = LinearRegression()
+            self.model = self.build_estimator(model_type, model_params)
             
-            # Train model
-            self.model.fit(X_train_scaled, y_train)
+            # Train and cross-validate on the training thread budget
+            fit_params = {} if windows is None else {'windows': windows_train}
+            with training_budget(self.model):
+                self.model.fit(X_train_scaled, y_train, **fit_params)
+                cv_scores = self.cross_validate(X_train_scaled, y_train, cv, windows_train)
+            use_serving_threads(self.model)
+            self._attributor = None
             
             # Evaluate model
-            y_pred = self.model.predict(X_test_scaled)
+            y_pred, y_spread = self.predict_distribution(X_test_scaled, windows_test)
+            
+            # Calibrate uncertainty on the held-out rows
+            self.calibrate(y_test, y_pred, y_spread)
+            
+            # Cheap linear stand-in served when the service is overloaded
+            self.fit_fallback(X_train_scaled, y_train, X_test, y_test)
             
             metrics = {
                 'mae': mean_absolute_error(y_test, y_pred),
@@ -191,7 +279,6 @@ class PredictionModel:
             }
             
             # Cross-validation
-            cv_scores = cross_val_score(self.model, X_train_scaled, y_train, cv=5, scoring='neg_mean_absolute_error')
             metrics['cv_mae'] = -cv_scores.mean()
             metrics['cv_std'] = cv_scores.std()
             
@@ -212,7 +299,7 @@ class PredictionModel:
             logger.error(f"Training error: {e}")
             raise e
 
-    def predict(self, features):
+    def predict(self, features, explain=False, top_k=3, windows=None):
         """Make prediction for given features"""
         if not self.is_loaded():
             raise Exception("Model not loaded")
@@ -227,33 +314,260 @@ class PredictionModel:
             # Scale features
             features_scaled = self.scaler.transform(feature_array)
             
-            # Make prediction (delay in minutes)
-            delay_prediction = self.model.predict(features_scaled)[0]
+            # Make prediction (delay in minutes) with its uncertainty in one pass
+            delay, spread = self.predict_distribution(features_scaled, windows)
+            uncertainty = self.estimate_uncertainty(delay, spread)
+            delay_prediction = delay[0]
             
             # Convert to predicted time
             scheduled_time = features.get('scheduled_time_minutes', 0) if isinstance(features, dict) else 0
-            predicted_minutes = scheduled_time + max(0, delay_prediction)
-            
-            # Convert minutes to time string
-            hours = int(predicted_minutes // 60) % 24
-            minutes = int(predicted_minutes % 60)
-            predicted_time = f"{hours:02d}:{minutes:02d}:00"
-            
-            # Determine factors affecting prediction
-            factors = self.analyze_prediction_factors(features, delay_prediction)
+            predicted_time = format_minutes(scheduled_time + max(0, delay_prediction))
             
-            return {
+            result = {
                 'predicted_time': predicted_time,
-                'delay_minutes': max(0, delay_prediction),
-                'factors': factors
+                'delay_minutes': max(0, delay_prediction)
             }
             
+            # Determine factors affecting prediction
+            drivers = self.explain(features_scaled, top_k, feature_array) if explain else None
+            if drivers is not None:
+                result['factors'] = [driver['factor'] for driver in drivers[0]] or ['normal_conditions']
+                result['factor_contributions'] = drivers[0]
+                result['attribution_ms'] = round(self.last_attribution_ms, 3)
+            else:
+                result['factors'] = self.analyze_prediction_factors(features, delay_prediction)
+            
+            if uncertainty is not None:
+                lower = uncertainty['lower'][0]
+                upper = uncertainty['upper'][0]
+                result['confidence'] = float(uncertainty['confidence'][0])
+                result['prediction_interval'] = {
+                    'level': self.interval_level,
+                    'lower_delay_minutes': round(float(lower), 1),
+                    'upper_delay_minutes': round(float(upper), 1),
+                    'earliest_time': format_minutes(scheduled_time + lower),
+                    'latest_time': format_minutes(scheduled_time + upper)
+                }
+            
+            return result
+            
         except Exception as e:
             logger.error(f"Prediction error: {e}")
             raise e
 
+    def predict_fast(self, features):
+        """Predict with the linear fallback model; a dot product, for use under overload"""
+        if not self.has_fallback():
+            raise Exception("Fallback model not available")
+        
+        if isinstance(features, dict):
+            feature_array = np.array([features[name] for name in self.feature_names], dtype=float).reshape(1, -1)
+        else:
+            feature_array = np.array(features, dtype=float).reshape(1, -1)
+        
+        delay = self.predict_fallback(feature_array)
+        uncertainty = self.fallback_uncertainty(delay)
+        delay_prediction = float(delay[0])
+        scheduled_time = features.get('scheduled_time_minutes', 0) if isinstance(features, dict) else 0
+        lower = uncertainty['lower'][0]
+        upper = uncertainty['upper'][0]
+        
+        return {
+            'predicted_time': format_minutes(scheduled_time + delay_prediction),
+            'delay_minutes': delay_prediction,
+            'factors': self.analyze_prediction_factors(features, delay_prediction),
+            'confidence': float(uncertainty['confidence'][0]),
+            'prediction_interval': {
+                'level': self.interval_level,
+                'lower_delay_minutes': round(float(lower), 1),
+                'upper_delay_minutes': round(float(upper), 1),
+                'earliest_time': format_minutes(scheduled_time + lower),
+                'latest_time': format_minutes(scheduled_time + upper)
+            }
+        }
+
+    def predict_many(self, feature_matrix, fast=False, windows=None):
+        """Predict delays for independent feature rows in one model call"""
+        if not self.is_loaded():
+            raise Exception("Model not loaded")
+        
+        feature_matrix = np.asarray(feature_matrix, dtype=float)
+        if fast:
+            delay = self.predict_fallback(feature_matrix)
+            uncertainty = self.fallback_uncertainty(delay)
+        else:
+            delay, spread = self.predict_distribution(self.scaler.transform(feature_matrix), windows)
+            uncertainty = self.estimate_uncertainty(delay, spread)
+        
+        return {
+            'scheduled_minutes': feature_matrix[:, self.feature_names.index('scheduled_time_minutes')],
+            'delay_minutes': np.maximum(0, delay),
+            'uncertainty': uncertainty
+        }
+
+    def predict_route(self, feature_matrix, carried_delay=0.0, fast=False, windows=None):
+        """Predict arrivals for a train's remaining stops in one pass, propagating delay"""
+        return self.predict_routes(feature_matrix, [0], [carried_delay], fast=fast, windows=windows)
+
+    def predict_routes(self, feature_matrix, route_starts, carried_delays=None, fast=False, windows=None):
+        """Predict arrivals for many trains' stops in one model call
+
+        Rows are grouped by train in stop order; route_starts holds the first
+        row of each train and carried_delays the delay each train already has.
+        With fast set the linear fallback model scores the rows; windows holds
+        each row's recent tracking for models that read it.
+        """
+        if not self.is_loaded():
+            raise Exception("Model not loaded")
+        
+        feature_matrix = np.asarray(feature_matrix, dtype=float)
+        if fast:
+            delay, spread = self.predict_fallback(feature_matrix), None
+        else:
+            delay, spread = self.predict_distribution(self.scaler.transform(feature_matrix), windows)
+        
+        n_rows = len(feature_matrix)
+        route_starts = np.asarray(route_starts, dtype=int)
+        segment = np.repeat(np.arange(len(route_starts)), np.diff(np.append(route_starts, n_rows)))
+        carried = np.zeros(len(route_starts)) if carried_delays is None else np.maximum(0, np.asarray(carried_delays, dtype=float))
+        
+        # A delay carried into a stop only shrinks by the slack in the schedule,
+        # so delay[i] = max(model[i], delay[i-1] - recovery[i]). With cumulative
+        # recovery R that is max(carried, max_j(model[j] + R[j])) - R[i], a running maximum.
+        scheduled = feature_matrix[:, self.feature_names.index('scheduled_time_minutes')]
+        gaps = np.diff(scheduled, prepend=scheduled[:1]) % 1440
+        gaps[route_starts] = 0
+        recovery = np.cumsum(gaps * RECOVERY_RATE)
+        recovery -= recovery[route_starts][segment]
+        
+        # Offsetting each train by more than any delay keeps the running
+        # maximum from leaking across trains
+        candidates = np.maximum(0, delay) + recovery
+        offset = segment * (candidates.max() + carried.max() + 1 if n_rows else 0)
+        running = np.maximum.accumulate(candidates + offset) - offset
+        propagated = np.maximum(running, carried[segment]) - recovery
+        
+        return {
+            'scheduled_minutes': scheduled,
+            'delay_minutes': propagated,
+            'model_delay_minutes': delay,
+            'uncertainty': self.fallback_uncertainty(propagated) if fast else self.estimate_uncertainty(propagated, spread)
+        }
+
+    def uses_tracking_windows(self):
+        """Whether the model reads the window of recent tracking points"""
+        return isinstance(self.model, SequenceRegressor)
+
+    def predict_distribution(self, features_scaled, windows=None):
+        """Predict delays and their spread for a batch of scaled feature rows"""
+        if isinstance(self.model, RandomForestRegressor):
+            # The forest mean is the average of its trees, so the per-tree
+            # predictions give the spread at no extra model evaluations
+            features_32 = np.ascontiguousarray(features_scaled, dtype=np.float32)
+            tree_predictions = np.stack([
+                tree.predict(features_32, check_input=False) for tree in self.model.estimators_
+            ])
+            return tree_predictions.mean(axis=0), tree_predictions.std(axis=0)
+        
+        if isinstance(self.model, SequenceRegressor):
+            return self.model.predict(features_scaled, windows), None
+        
+        # Compressed forests walk all their trees at once and give the spread themselves
+        if hasattr(self.model, 'predict_distribution'):
+            return self.model.predict_distribution(features_scaled)
+        
+        return self.model.predict(features_scaled), None
+
+    def calibrate(self, y_true, y_pred, y_spread=None):
+        """Fit conformal scores on held-out residuals"""
+        residuals = np.abs(np.asarray(y_true) - np.asarray(y_pred))
+        normalized = y_spread is not None
+        scores = residuals / (y_spread + 1.0) if normalized else residuals
+        
+        # Keep a fixed number of quantiles so metadata stays small
+        self.calibration = {
+            'normalized': normalized,
+            'scores': np.quantile(scores, np.linspace(0, 1, 201)).round(4).tolist()
+        }
+
+    def estimate_uncertainty(self, delay, spread=None):
+        """Compute prediction intervals and calibrated confidence for a batch"""
+        if not self.calibration:
+            return None
+        
+        scores = np.asarray(self.calibration['scores'])
+        if self.calibration['normalized'] and spread is not None:
+            scale = spread + 1.0
+        else:
+            scale = np.ones_like(delay)
+        
+        # Split-conformal interval at the configured coverage level
+        half_width = np.quantile(scores, self.interval_level) * scale
+        
+        # Confidence is the calibrated probability of landing within 5 minutes
+        confidence = np.searchsorted(scores, 5.0 / scale, side='right') / len(scores)
+        
+        return {
+            'lower': np.maximum(0, delay - half_width),
+            'upper': np.maximum(0, delay + half_width),
+            'confidence': np.clip(confidence, 0.05, 0.99)
+        }
+
+    def fit_fallback(self, X_train_scaled, y_train, X_test, y_test):
+        """Fit the ridge fallback and fold the scaler into weights on raw features"""
+        ridge = Ridge(alpha=1.0).fit(X_train_scaled, y_train)
+        coef = ridge.coef_ / self.scaler.scale_
+        intercept = ridge.intercept_ - coef @ self.scaler.mean_
+        
+        errors = np.abs(np.asarray(y_test) - np.maximum(0, np.asarray(X_test, dtype=float) @ coef + intercept))
+        self.fallback = {
+            'coef': coef.tolist(),
+            'intercept': float(intercept),
+            'mae': float(errors.mean()),
+            'interval_half_width': float(np.quantile(errors, self.interval_level)),
+            'within_5min': float((errors <= 5).mean())
+        }
+        self._fallback_weights = None
+
+    def has_fallback(self):
+        """Check if the lightweight fallback model is available"""
+        return self.fallback is not None
+
+    def predict_fallback(self, feature_matrix):
+        """Delay in minutes from the linear fallback for raw feature rows"""
+        if self._fallback_weights is None:
+            self._fallback_weights = (np.array(self.fallback['coef']), self.fallback['intercept'])
+        coef, intercept = self._fallback_weights
+        return np.maximum(0, np.asarray(feature_matrix, dtype=float) @ coef + intercept)
+
+    def fallback_uncertainty(self, delay):
+        """Fixed-width interval and confidence from the fallback's held-out errors"""
+        half_width = self.fallback['interval_half_width']
+        return {
+            'lower': np.maximum(0, delay - half_width),
+            'upper': delay + half_width,
+            'confidence': np.full(len(delay), np.clip(self.fallback['within_5min'], 0.05, 0.99))
+        }
+
+    def explain(self, features_scaled, top_k=3, features=None):
+        """Model-based top-k delay drivers for a batch of scaled feature rows"""
+        if not ModelAttributor.supports(self.model):
+            return None
+        
+        start = time.perf_counter()
+        if self._attributor is None:
+            self._attributor = ModelAttributor(self.model, self.feature_names)
+        drivers = self._attributor.top_factors(features_scaled, top_k, features)
+        self.last_attribution_ms = (time.perf_counter() - start) * 1000
+        
+        return drivers
+
     def calculate_confidence(self, features, prediction):
         """Calculate confidence score for prediction"""
+        # Prefer the model's calibrated estimate when it is available
+        if isinstance(prediction, dict) and 'confidence' in prediction:
+            return prediction['confidence']
+        
         try:
             # Base confidence
             confidence = 0.8
@@ -284,20 +598,33 @@ class PredictionModel:
         factors = []
         
         if isinstance(features, dict):
-            if features.get('weather_rainfall', 0) > 5:
+            if features.get('weather_rainfall', 0) > HEAVY_RAINFALL_MM:
                 factors.append('heavy_rainfall')
             
             if features.get('is_peak_hour', 0):
                 factors.append('peak_hour_traffic')
             
-            if features.get('current_speed', 0) < 30:
+            if features.get('current_speed', 0) < REDUCED_SPEED_KMH:
                 factors.append('reduced_speed')
             
-            if delay_prediction > 10:
+            if delay_prediction > SIGNIFICANT_DELAY_MINUTES:
                 factors.append('significant_delay_expected')
         
         return factors if factors else ['normal_conditions']
 
+    def analyze_prediction_factors_many(self, feature_matrix, delay):
+        """Factors of analyze_prediction_factors for every row of a feature matrix, tested column-wise"""
+        column = self.feature_names.index
+        flags = [
+            ('heavy_rainfall', feature_matrix[:, column('weather_rainfall')] > HEAVY_RAINFALL_MM),
+            ('peak_hour_traffic', feature_matrix[:, column('is_peak_hour')] != 0),
+            ('reduced_speed', feature_matrix[:, column('current_speed')] < REDUCED_SPEED_KMH),
+            ('significant_delay_expected', np.asarray(delay) > SIGNIFICANT_DELAY_MINUTES)
+        ]
+        names = np.array([name for name, _ in flags])
+        hits = np.column_stack([hit for _, hit in flags])
+        return [names[row].tolist() or ['normal_conditions'] for row in hits]
+
     def retrain(self, model_type='random_forest', use_recent_data_only=False):
         """Retrain model with new data"""
         try:
@@ -318,7 +645,9 @@ class PredictionModel:
             'version': self.model_version,
             'is_trained': self.is_trained,
             'feature_count': len(self.feature_names),
-            'feature_names': self.feature_names
+            'feature_names': self.feature_names,
+            'fallback_mae': round(self.fallback['mae'], 3) if self.fallback else None,
+            'compression': self.compression['chosen'] if self.compression else None
         }
 
     def get_performance_metrics(self):
@@ -0,0 +1,396 @@
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import schedule
+from models.sequence_model import tracking_windows
+from utils.prediction_store import sweep_version
+from utils.time_codec import parse_minutes_array, format_minutes_array, MINUTES_PER_DAY
+from utils.weather_grid import epoch_minutes
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionSweeper:
+    def __init__(self, model, data_processor, feature_engineer, store, train_states=None, interval_minutes=None,
+                 simulator=None, weather=None, sharded_model=None):
+        self.model = model
+        # Trains are scored by their shard, as live requests are, when shards are given
+        self.sharded_model = sharded_model
+        self.data_processor = data_processor
+        self.feature_engineer = feature_engineer
+        self.store = store
+        self.train_states = train_states
+        self.weather = weather
+        self.interval_minutes = int(
+            interval_minutes if interval_minutes is not None else os.getenv('ML_PRECOMPUTE_INTERVAL_MINUTES', 5)
+        )
+        # Results older than this read as missing so callers fall back to live
+        # predictions when sweeps stop; two missed sweeps by default
+        self.max_age_minutes = float(
+            os.getenv('ML_PRECOMPUTE_MAX_AGE_MINUTES', 2 * (self.interval_minutes if self.interval_minutes > 0 else 5))
+        )
+        # Sweeps are written back to predictions in bulk only when enabled; those
+        # rows carry the outcomes training learns from
+        self.persist = os.getenv('ML_PRECOMPUTE_PERSIST', 'false').lower() == 'true'
+        # Knock-on delays from trains sharing single track are added unless disabled
+        self.simulator = simulator if os.getenv('ML_NETWORK_SIMULATION', 'true').lower() == 'true' else None
+        self.network_delays = {}
+        self.last_run = None
+        self._run_lock = threading.Lock()
+        self._scheduler = schedule.Scheduler()
+        self._thread = None
+
+    def upcoming_stops(self, stops, now=None):
+        """Keep the stops still ahead of each train; a train with none left keeps none
+
+        Stops after the last one the train has arrived at today are ahead, however
+        late it runs. Without a recorded arrival the schedule decides: stops from
+        the current time of day on.
+        """
+        now = now or datetime.now()
+        stops = stops.copy()
+        stops['scheduled_minutes'] = parse_minutes_array(stops['scheduled_time'].to_numpy())
+        stops = stops[stops['scheduled_minutes'] >= 0]
+
+        arrived = stops['arrived'].fillna(False).astype(bool) if 'arrived' in stops else pd.Series(False, index=stops.index)
+        last_arrived = stops['order_index'].where(arrived).groupby(stops['train_id']).transform('max')
+        ahead = np.where(
+            last_arrived.notna(),
+            stops['order_index'] > last_arrived,
+            stops['scheduled_minutes'] >= now.hour * 60 + now.minute
+        )
+        return stops[ahead & ~arrived].reset_index(drop=True)
+
+    def build_features(self, stops, now=None):
+        """One feature row per train x stop, filled column by column"""
+        now = now or datetime.now()
+        names = self.feature_engineer.feature_names
+        column = names.index
+        base = self.feature_engineer.get_default_features()
+        base.update({
+            'day_of_week': now.weekday(),
+            'is_weekend': int(now.weekday() >= 5)
+        })
+        matrix = np.tile(np.array([base[name] for name in names], dtype=float), (len(stops), 1))
+
+        # 24:00:00 sorts last in the day but is the same clock time as 00:00
+        minutes = stops['scheduled_minutes'].to_numpy(dtype=float)
+        scheduled = minutes % MINUTES_PER_DAY
+        hours = scheduled // 60
+        matrix[:, column('scheduled_time_minutes')] = scheduled
+        matrix[:, column('hour')] = hours
+        matrix[:, column('is_peak_hour')] = np.isin(hours, [7, 8, 9, 17, 18, 19])
+
+        train_type = stops['train_type'].fillna('local').str.lower().to_numpy()
+        matrix[:, column('train_type_express')] = train_type == 'express'
+        matrix[:, column('train_type_intercity')] = train_type == 'intercity'
+
+        # Weather at each station around its scheduled time, interpolated in one pass
+        if self.weather is not None:
+            midnight = epoch_minutes(now.replace(hour=0, minute=0, second=0, microsecond=0))
+            unknown = np.full(len(stops), np.nan)
+            self.weather.apply(
+                matrix, names, unknown, unknown, midnight + minutes, station_ids=stops['station_id'].to_numpy()
+            )
+
+        # Movement comes from the streamed train state where the service has one
+        if self.train_states is not None:
+            train_ids = stops['train_id'].to_numpy()
+            station_ids = stops['station_id'].to_numpy()
+            starts = np.flatnonzero(np.r_[True, train_ids[1:] != train_ids[:-1]])
+            ends = np.r_[starts[1:], len(stops)]
+            for start, end in zip(starts, ends):
+                state = self.train_states.get(train_ids[start])
+                if state is None:
+                    continue
+                if state.speed is not None:
+                    matrix[start:end, column('current_speed')] = state.speed
+                distances = self.train_states.distances_for(train_ids[start], station_ids[start:end].tolist())
+                known = [i for i, distance in enumerate(distances) if distance is not None]
+                matrix[start + np.array(known, dtype=int), column('distance_to_station')] = [
+                    distances[i] for i in known
+                ]
+
+        return matrix
+
+    def score_routes(self, stops, feature_matrix, route_starts):
+        """Score every train's stops with the model serving its segment, one call per model
+
+        Uncertainty columns are NaN for rows whose model gives none.
+        """
+        n_rows = len(feature_matrix)
+        route_ends = np.append(route_starts[1:], n_rows)
+        models = [self.model] * len(route_starts)
+        if self.sharded_model is not None:
+            names = self.feature_engineer.feature_names
+            route_ids = stops['route_id'].to_numpy()
+            models = [
+                self.sharded_model.get_model(self.sharded_model.segment_key(
+                    {'route_id': None if pd.isna(route_ids[start]) else int(route_ids[start])},
+                    dict(zip(names, feature_matrix[start]))
+                ))
+                for start in route_starts
+            ]
+
+        train_ids = stops['train_id'].to_numpy()
+        scored = {
+            'scheduled_minutes': np.zeros(n_rows),
+            'delay_minutes': np.zeros(n_rows),
+            'lower': np.full(n_rows, np.nan),
+            'upper': np.full(n_rows, np.nan),
+            'confidence': np.full(n_rows, np.nan),
+            'interval_level': np.full(n_rows, np.nan),
+            'models': 0
+        }
+        groups = {}
+        for route, model in enumerate(models):
+            groups.setdefault(id(model), (model, []))[1].append(route)
+
+        for model, routes in groups.values():
+            rows = np.concatenate([np.arange(route_starts[route], route_ends[route]) for route in routes])
+            lengths = route_ends[routes] - route_starts[routes]
+            windows = None
+            if model.uses_tracking_windows():
+                # Every stop of a train reads that train's recent tracking
+                tracks = [
+                    self.train_states.window_for(train_ids[route_starts[route]]) if self.train_states is not None else []
+                    for route in routes
+                ]
+                windows = np.repeat(tracking_windows(tracks), lengths, axis=0)
+            route = model.predict_routes(
+                feature_matrix[rows], np.concatenate([[0], np.cumsum(lengths)[:-1]]), windows=windows
+            )
+            scored['scheduled_minutes'][rows] = route['scheduled_minutes']
+            scored['delay_minutes'][rows] = route['delay_minutes']
+            if route['uncertainty'] is not None:
+                scored['lower'][rows] = route['uncertainty']['lower']
+                scored['upper'][rows] = route['uncertainty']['upper']
+                scored['confidence'][rows] = route['uncertainty']['confidence']
+                scored['interval_level'][rows] = model.interval_level
+            scored['models'] += 1
+
+        return scored
+
+    def simulate_network(self, active_stops, stops, delay, now):
+        """Knock-on delay at each upcoming stop from the rest of the network
+
+        Every active train enters the simulation with the delay predicted at
+        its next stop; the per-train summary is kept for lookups.
+        """
+        def minutes(column):
+            parsed = parse_minutes_array(active_stops[column].to_numpy()).astype(float)
+            return np.where(parsed < 0, np.nan, parsed)
+
+        self.simulator.load_schedule(pd.DataFrame({
+            'train_id': active_stops['train_id'].to_numpy(),
+            'station_id': active_stops['station_id'].to_numpy(),
+            'arrival_minutes': minutes('arrival_time'),
+            'departure_minutes': minutes('departure_time')
+        }))
+
+        train_ids = stops['train_id'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, train_ids[1:] != train_ids[:-1]])
+        current = pd.Series(delay[starts], index=train_ids[starts]).reindex(self.simulator.train_ids).fillna(0)
+
+        result = self.simulator.knock_on(current.to_numpy(), now.hour * 60 + now.minute)
+        features = self.simulator.summarize(result)
+        self.network_delays = {
+            str(row['train_id']): {
+                'max_knock_on_delay_minutes': round(row['max_knock_on_delay_minutes'], 1),
+                'final_knock_on_delay_minutes': round(row['final_knock_on_delay_minutes'], 1),
+                'track_wait_minutes': round(row['track_wait_minutes'], 1),
+                'simulated_stops': int(row['simulated_stops'])
+            }
+            for row in features.to_dict('records')
+        }
+        return np.nan_to_num(result['knock_on_delay_minutes'])[stops['stop_row'].to_numpy()]
+
+    def run(self):
+        """Score every active train x upcoming stop in one pass and publish the results"""
+        if not self.model.is_loaded():
+            logger.warning("Skipping prediction sweep, model not loaded")
+            return None
+        if not self._run_lock.acquire(blocking=False):
+            logger.warning("Previous prediction sweep still running, skipping")
+            return None
+
+        try:
+            started = time.perf_counter()
+            now = datetime.now()
+
+            stops = self.data_processor.load_active_stops()
+            load_ms = (time.perf_counter() - started) * 1000
+            if stops.empty:
+                logger.info("Prediction sweep: no active trains")
+                return None
+
+            stops['stop_row'] = np.arange(len(stops))
+            active_stops = stops
+            stops = self.upcoming_stops(stops, now)
+            if stops.empty:
+                # Nothing is ahead of any train; an empty sweep replaces the last one
+                meta = {
+                    'computed_at': now.isoformat(),
+                    'model_version': self.model.get_version(),
+                    'trains': 0,
+                    'predictions': 0,
+                    'persisted': False,
+                    'load_ms': round(load_ms, 1),
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+                }
+                self.store.publish(sweep_version(self.model.get_version(), now), {}, meta)
+                self.last_run = meta
+                logger.info("Prediction sweep: no upcoming stops")
+                return meta
+            feature_matrix = self.build_features(stops, now)
+
+            train_ids = stops['train_id'].to_numpy()
+            route_starts = np.flatnonzero(np.r_[True, train_ids[1:] != train_ids[:-1]])
+            score_started = time.perf_counter()
+            route = self.score_routes(stops, feature_matrix, route_starts)
+            score_ms = (time.perf_counter() - score_started) * 1000
+
+            delay = route['delay_minutes']
+            knock_on = None
+            simulate_ms = 0.0
+            if self.simulator is not None:
+                simulate_started = time.perf_counter()
+                try:
+                    knock_on = self.simulate_network(active_stops, stops, delay, now)
+                    delay = delay + knock_on
+                except Exception as e:
+                    logger.error(f"Network simulation error: {e}")
+                simulate_ms = (time.perf_counter() - simulate_started) * 1000
+            scheduled = route['scheduled_minutes']
+            predicted_times = format_minutes_array(scheduled + delay)
+            has_interval = ~np.isnan(route['lower'])
+            confidence = np.where(has_interval, route['confidence'], 0.6)
+            factors = self.model.analyze_prediction_factors_many(feature_matrix, delay)
+
+            version = sweep_version(self.model.get_version(), now)
+            computed_at = now.isoformat()
+            trains = {}
+            scheduled_times = stops['scheduled_time'].astype(str).to_numpy()
+            for i, (train_id, station_id) in enumerate(zip(train_ids, stops['station_id'].to_numpy())):
+                prediction = {
+                    'station_id': int(station_id),
+                    'scheduled_time': scheduled_times[i],
+                    'predicted_time': str(predicted_times[i]),
+                    'delay_minutes': int(round(float(delay[i]))),
+                    'confidence_score': round(float(confidence[i]), 2),
+                    'prediction_method': 'ml_precomputed',
+                    'factors': factors[i],
+                    'computed_at': computed_at
+                }
+                extra = 0.0
+                if knock_on is not None:
+                    extra = float(knock_on[i])
+                    prediction['knock_on_delay_minutes'] = round(extra, 1)
+                    if extra >= 1:
+                        prediction['factors'] = [f for f in factors[i] if f != 'normal_conditions'] + ['network_knock_on']
+                if has_interval[i]:
+                    prediction['prediction_interval'] = {
+                        'level': float(route['interval_level'][i]),
+                        'lower_delay_minutes': round(float(route['lower'][i]) + extra, 1),
+                        'upper_delay_minutes': round(float(route['upper'][i]) + extra, 1)
+                    }
+                trains.setdefault(str(train_id), {})[str(station_id)] = prediction
+
+            persisted = False
+            if self.persist:
+                rows = [
+                    {**prediction, 'train_id': int(train_id)}
+                    for train_id, stops_by_station in trains.items()
+                    for prediction in stops_by_station.values()
+                ]
+                try:
+                    self.data_processor.save_predictions_bulk(rows)
+                    persisted = True
+                except Exception as e:
+                    logger.error(f"Prediction sweep write-back error: {e}")
+            for stops_by_station in trains.values():
+                for prediction in stops_by_station.values():
+                    prediction['persisted'] = persisted
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            meta = {
+                'computed_at': computed_at,
+                'model_version': self.model.get_version(),
+                'trains': len(trains),
+                'predictions': len(stops),
+                'persisted': persisted,
+                'load_ms': round(load_ms, 1),
+                'score_ms': round(score_ms, 1),
+                'scoring_models': route['models'],
+                'simulate_ms': round(simulate_ms, 1),
+                'elapsed_ms': round(elapsed_ms, 1)
+            }
+            self.store.publish(version, trains, meta)
+            self.last_run = meta
+
+            logger.info(
+                f"Prediction sweep {version}: {len(stops)} predictions for {len(trains)} trains "
+                f"in {elapsed_ms:.0f} ms (scoring {score_ms:.0f} ms)"
+            )
+            return meta
+
+        except Exception as e:
+            logger.error(f"Prediction sweep error: {e}")
+            return None
+        finally:
+            self._run_lock.release()
+
+    def is_stale(self, prediction, now=None):
+        """Whether a precomputed prediction is older than the maximum age"""
+        age = (now or datetime.now()) - datetime.fromisoformat(prediction['computed_at'])
+        return age > timedelta(minutes=self.max_age_minutes)
+
+    def lookup(self, train_id, station_id=None):
+        """O(1) read of precomputed predictions for a train, or one of its stops; stale sweeps read as missing"""
+        stops, version = self.store.get_train(train_id)
+        # Every stop of a train comes from the same sweep
+        if stops is None or not stops or self.is_stale(next(iter(stops.values()))):
+            return None, version
+        if station_id is None:
+            return list(stops.values()), version
+        return stops.get(str(station_id)), version
+
+    def lookup_network_delay(self, train_id):
+        """Knock-on delay features for a train from the latest sweep"""
+        return self.network_delays.get(str(train_id))
+
+    def start(self):
+        """Run the sweep on a background schedule"""
+        if self.interval_minutes <= 0 or self._thread is not None:
+            return
+
+        self._scheduler.every(self.interval_minutes).minutes.do(self.run)
+
+        def loop():
+            self.run()
+            while True:
+                self._scheduler.run_pending()
+                time.sleep(1)
+
+        self._thread = threading.Thread(target=loop, name='prediction-sweeper', daemon=True)
+        self._thread.start()
+        logger.info(f"Prediction sweep scheduled every {self.interval_minutes} minutes")
+
+    def get_info(self):
+        """Get sweep schedule and the latest published sweep"""
+        try:
+            store = self.store.get_info()
+        except Exception as e:
+            store = {'error': str(e)}
+        return {
+            'interval_minutes': self.interval_minutes,
+            'max_age_minutes': self.max_age_minutes,
+            'scheduled': self._thread is not None,
+            'last_run': self.last_run,
+            'network_simulation': self.simulator.get_info() if self.simulator is not None else None,
+            'store': store
+        }
@@ -0,0 +1,269 @@
+import io
+import os
+import threading
+import logging
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, RegressorMixin
+from utils.train_state import parse_timestamp, STOPPED_SPEED_KMH, TRAIN_STATE_TTL_MINUTES
+from utils.geo import haversine_km
+from utils.thread_budget import training_threads
+
+logger = logging.getLogger(__name__)
+
+# Tracking points per window, newest last; shorter tracks are padded at the front
+SEQUENCE_LENGTH = int(os.getenv('ML_SEQUENCE_LENGTH', 32))
+
+# Per-point inputs, each scaled to roughly unit range
+TRACKING_CHANNELS = ('speed', 'gap_minutes', 'step_km', 'stopped', 'age_hours', 'observed')
+
+# Training rows whose windows are gathered together when rebuilding them from raw points
+WINDOW_CHUNK_ROWS = 65536
+
+
+def import_torch():
+    """torch is only needed for the sequence model, so it is imported on first use"""
+    try:
+        import torch
+    except ImportError as e:
+        raise ImportError("The sequence model needs torch (see requirements.txt)") from e
+    return torch
+
+
+_interop_lock = threading.Lock()
+_interop_configured = False
+
+
+def set_torch_threads(torch, threads):
+    """Size torch's intra-op pool; inter-op parallelism stays off, requests supply it"""
+    global _interop_configured
+    if torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+
+    # The inter-op pool can be sized once per process, before its first task;
+    # torch 2.0 aborts the process rather than raising on a second call
+    with _interop_lock:
+        if _interop_configured:
+            return
+        _interop_configured = True
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+
+
+def window_channels(minutes, speed, latitude, longitude):
+    """Channel array (rows, length, channels) from right-aligned points, NaN where padded"""
+    observed = ~np.isnan(minutes)
+
+    gap = np.diff(minutes, axis=1, prepend=np.nan)
+    step = np.concatenate([
+        np.full((len(minutes), 1), np.nan),
+        haversine_km(latitude[:, :-1], longitude[:, :-1], latitude[:, 1:], longitude[:, 1:])
+    ], axis=1)
+    age = minutes[:, -1:] - minutes
+
+    with np.errstate(invalid='ignore'):
+        stopped = observed & (speed < STOPPED_SPEED_KMH)
+    channels = np.stack([
+        np.nan_to_num(speed) / 100,
+        np.clip(np.nan_to_num(gap), 0, 30) / 10,
+        np.clip(np.nan_to_num(step), 0, 50) / 10,
+        stopped,
+        np.clip(np.nan_to_num(age), 0, 180) / 60,
+        observed
+    ], axis=-1)
+    return channels.astype(np.float32)
+
+
+def _point_value(point, key):
+    value = point.get(key)
+    return np.nan if value is None else float(value)
+
+
+def tracking_windows(tracks, length=SEQUENCE_LENGTH):
+    """Fixed-length windows from tracking point lists, each newest first as the server sends them"""
+    shape = (len(tracks), length)
+    minutes, speed, latitude, longitude = (np.full(shape, np.nan) for _ in range(4))
+    for row, points in enumerate(tracks):
+        for k, point in enumerate((points or [])[:length]):
+            column = length - 1 - k
+            minutes[row, column] = parse_timestamp(point.get('timestamp')).timestamp() / 60
+            speed[row, column] = _point_value(point, 'speed')
+            latitude[row, column] = _point_value(point, 'latitude')
+            longitude[row, column] = _point_value(point, 'longitude')
+    return window_channels(minutes, speed, latitude, longitude)
+
+
+def epoch_minutes_array(timestamps):
+    """Naive timestamps as float minutes since the epoch"""
+    timestamps = pd.to_datetime(pd.Series(timestamps))
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert(None)
+    return timestamps.to_numpy(dtype='datetime64[ns]').astype(np.int64) / 6e10
+
+
+def point_windows(points, train_ids, timestamps, length=SEQUENCE_LENGTH, ttl_minutes=TRAIN_STATE_TTL_MINUTES):
+    """Window each train had in its live state at each time, rebuilt from its raw tracking points
+
+    points holds every streamed point (train_id, timestamp, speed, latitude,
+    longitude), so training sees the same spacing as serving. A silence longer
+    than the state TTL starts the window afresh, as eviction does.
+    """
+    query_minutes = epoch_minutes_array(timestamps)
+    query_trains = np.asarray(train_ids, dtype=np.int64)
+    empty = np.full((len(query_trains), length), np.nan)
+    if len(points) == 0:
+        return window_channels(empty, empty, empty, empty)
+
+    point_minutes = epoch_minutes_array(points['timestamp'])
+    point_trains = points['train_id'].to_numpy(dtype=np.int64)
+    order = np.lexsort((point_minutes, point_trains))
+    point_minutes, point_trains = point_minutes[order], point_trains[order]
+    n_points = len(order)
+
+    new_session = np.r_[True, (point_trains[1:] != point_trains[:-1]) | (np.diff(point_minutes) > ttl_minutes)]
+    session_start = np.maximum.accumulate(np.where(new_session, np.arange(n_points), 0))
+
+    # One sorted key per (train, time) finds each row's latest point with a single search
+    _, codes = np.unique(np.concatenate([point_trains, query_trains]), return_inverse=True)
+    origin = min(point_minutes.min(), query_minutes.min(initial=point_minutes.min()))
+    span = max(point_minutes.max(), query_minutes.max(initial=point_minutes.max())) - origin + 1
+    point_keys = codes[:n_points] * span + (point_minutes - origin)
+    query_keys = codes[n_points:] * span + (query_minutes - origin)
+    last = np.searchsorted(point_keys, query_keys, side='right') - 1
+    found = (last >= 0) & (point_trains[np.maximum(last, 0)] == query_trains)
+    last = np.maximum(last, 0)
+
+    speed = points['speed'].to_numpy(dtype=float)[order]
+    latitude = points['latitude'].to_numpy(dtype=float)[order]
+    longitude = points['longitude'].to_numpy(dtype=float)[order]
+    windows = np.empty((len(query_trains), length, len(TRACKING_CHANNELS)), dtype=np.float32)
+
+    # Rows are gathered a chunk at a time so the (rows x length) temporaries stay small
+    for start in range(0, len(query_trains), WINDOW_CHUNK_ROWS):
+        rows = slice(start, start + WINDOW_CHUNK_ROWS)
+
+        # Row i looks back at sorted points last-length+1 .. last of the same session
+        index = last[rows, None] - np.arange(length - 1, -1, -1)[None, :]
+        valid = found[rows, None] & (index >= session_start[last[rows]][:, None])
+        index = np.where(valid, index, 0)
+
+        def column(values):
+            return np.where(valid, values[index], np.nan)
+
+        windows[rows] = window_channels(column(point_minutes), column(speed), column(latitude), column(longitude))
+    return windows
+
+
+def build_network(n_features, n_channels, hidden_size):
+    """GRU over the tracking window, joined with the tabular features in a small head"""
+    torch = import_torch()
+    nn = torch.nn
+
+    class TrackingNetwork(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.gru = nn.GRU(n_channels, hidden_size, batch_first=True)
+            self.head = nn.Sequential(
+                nn.Linear(hidden_size + n_features, 64),
+                nn.ReLU(),
+                nn.Linear(64, 1)
+            )
+
+        def forward(self, features, windows):
+            _, hidden = self.gru(windows)
+            return self.head(torch.cat([hidden[-1], features], dim=1)).squeeze(1)
+
+    return TrackingNetwork()
+
+
+class SequenceRegressor(BaseEstimator, RegressorMixin):
+    """Delay regressor over scaled features plus the window of recent tracking points
+
+    Rows without tracking are scored on an all-padding window. After fitting
+    the network is traced and frozen to TorchScript, which is what is pickled
+    with the model and served.
+    """
+
+    def __init__(self, sequence_length=SEQUENCE_LENGTH, hidden_size=32, epochs=30, batch_size=256,
+                 learning_rate=0.003, n_jobs=None, random_state=42):
+        self.sequence_length = sequence_length
+        self.hidden_size = hidden_size
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def _windows(self, windows, n_rows):
+        if windows is None:
+            return np.zeros((n_rows, self.sequence_length, len(TRACKING_CHANNELS)), dtype=np.float32)
+        return np.ascontiguousarray(windows, dtype=np.float32)
+
+    def fit(self, X, y, windows=None):
+        torch = import_torch()
+        set_torch_threads(torch, self.n_jobs or training_threads())
+        torch.manual_seed(self.random_state)
+        rng = np.random.default_rng(self.random_state)
+
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float32)
+        windows = self._windows(windows, len(X))
+
+        # The network learns the standardized delay
+        self.y_mean_ = float(y.mean())
+        self.y_scale_ = float(y.std()) or 1.0
+        features = torch.from_numpy(X)
+        sequences = torch.from_numpy(windows)
+        target = torch.from_numpy((y - self.y_mean_) / self.y_scale_)
+
+        network = build_network(X.shape[1], windows.shape[2], self.hidden_size)
+        optimizer = torch.optim.Adam(network.parameters(), lr=self.learning_rate)
+        # Huber loss keeps a few very late trains from dominating the fit
+        loss_fn = torch.nn.SmoothL1Loss()
+
+        network.train()
+        n_batches = max(1, int(np.ceil(len(X) / self.batch_size)))
+        for _ in range(self.epochs):
+            for batch in np.array_split(rng.permutation(len(X)), n_batches):
+                index = torch.from_numpy(batch)
+                optimizer.zero_grad()
+                loss = loss_fn(network(features[index], sequences[index]), target[index])
+                loss.backward()
+                optimizer.step()
+
+        network.eval()
+        with torch.no_grad():
+            traced = torch.jit.trace(network, (features[:2], sequences[:2]))
+        self.network_ = torch.jit.optimize_for_inference(traced)
+        self.n_features_in_ = X.shape[1]
+        return self
+
+    def predict(self, X, windows=None):
+        torch = import_torch()
+        set_torch_threads(torch, self.n_jobs or 1)
+
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        windows = self._windows(windows, len(X))
+        with torch.inference_mode():
+            output = self.network_(torch.from_numpy(X), torch.from_numpy(windows)).numpy()
+        return output.astype(float) * self.y_scale_ + self.y_mean_
+
+    def __getstate__(self):
+        # The base state can be the live __dict__, so pop from a copy
+        state = dict(super().__getstate__())
+        network = state.pop('network_', None)
+        if network is not None:
+            torch = import_torch()
+            buffer = io.BytesIO()
+            torch.jit.save(network, buffer)
+            state['network_bytes_'] = buffer.getvalue()
+        return state
+
+    def __setstate__(self, state):
+        network_bytes = state.pop('network_bytes_', None)
+        if network_bytes is not None:
+            torch = import_torch()
+            state['network_'] = torch.jit.load(io.BytesIO(network_bytes))
+        super().__setstate__(state)
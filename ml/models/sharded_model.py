@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from joblib import Parallel, delayed
+from models.prediction_model import PredictionModel
+from utils.thread_budget import training_threads
+
+logger = logging.getLogger(__name__)
+
+# Compact forest used for every shard; each segment is far more homogeneous
+# than the whole network so fewer, shallower trees are enough
+SHARD_MODEL_PARAMS = {
+    'n_estimators': 30,
+    'max_depth': 8,
+    'min_samples_leaf': 5,
+    'n_jobs': 1
+}
+
+
+def _train_shard(model_dir, X, y, feature_names, model_type, model_params, timestamps=None):
+    """Train and persist a single shard (runs in a worker process)"""
+    shard = PredictionModel(model_dir=model_dir)
+    shard.feature_names = list(feature_names)
+    result = shard.train(X, y, model_type, model_params=model_params, timestamps=timestamps)
+    return result['metrics']
+
+
+class ShardedModelSet:
+    def __init__(self, global_model, shard_by=None, max_loaded=None, min_samples=None):
+        self.global_model = global_model
+        self.shard_by = shard_by or os.getenv('ML_SHARD_BY', 'train_type')
+        self.max_loaded = int(max_loaded or os.getenv('ML_MAX_LOADED_SHARDS', 32))
+        self.min_samples = int(min_samples or os.getenv('ML_SHARD_MIN_SAMPLES', 50))
+        self.shards_dir = os.path.join(os.path.dirname(__file__), 'shards')
+        self.index_path = os.path.join(self.shards_dir, 'index.json')
+        self.available = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self.load_index()
+
+    def load_index(self):
+        """Load the list of trained shards from disk"""
+        try:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+                self.shard_by = index.get('shard_by', self.shard_by)
+                self.available = index.get('shards', {})
+            with self._lock:
+                self._loaded.clear()
+            return True
+        except Exception as e:
+            logger.error(f"Error loading shard index: {e}")
+            self.available = {}
+            return False
+
+    def shard_dir(self, segment):
+        """Directory holding the files of one shard"""
+        safe_name = re.sub(r'[^A-Za-z0-9_-]', '_', str(segment))
+        return os.path.join(self.shards_dir, safe_name)
+
+    def segment_key(self, data, features=None):
+        """Resolve the shard segment for a prediction request"""
+        if self.shard_by == 'route':
+            route_id = data.get('route_id')
+            return f"route_{route_id}" if route_id is not None else None
+
+        if isinstance(features, dict):
+            if features.get('train_type_express'):
+                return 'express'
+            if features.get('train_type_intercity'):
+                return 'intercity'
+            return 'local'
+        return None
+
+    def segments_from_matrix(self, X, feature_names):
+        """Derive train-type segments from the one-hot columns of a feature matrix"""
+        X = np.asarray(X)
+        express = X[:, feature_names.index('train_type_express')] > 0
+        intercity = X[:, feature_names.index('train_type_intercity')] > 0
+        return np.where(express, 'express', np.where(intercity, 'intercity', 'local'))
+
+    def train_shards(self, X, y, segments, model_type='random_forest', n_jobs=None, timestamps=None):
+        """Train one compact model per segment in parallel, each split by time when timestamps are given"""
+        n_jobs = n_jobs or training_threads()
+        X = np.asarray(X)
+        y = np.asarray(y)
+        if timestamps is not None:
+            timestamps = np.asarray(timestamps)
+        segments = np.asarray(segments).astype(str)
+        feature_names = self.global_model.feature_names
+
+        keys, inverse, counts = np.unique(segments, return_inverse=True, return_counts=True)
+        keys = [str(key) for key in keys]
+        sample_counts = dict(zip(keys, counts))
+        jobs = []
+        trained_keys = []
+        for idx, key in enumerate(keys):
+            if counts[idx] < self.min_samples:
+                logger.info(f"Segment {key} has {counts[idx]} samples, using global model")
+                continue
+            mask = inverse == idx
+            trained_keys.append(key)
+            jobs.append(delayed(_train_shard)(
+                self.shard_dir(key), X[mask], y[mask], feature_names,
+                model_type, SHARD_MODEL_PARAMS if model_type == 'random_forest' else None,
+                timestamps[mask] if timestamps is not None else None
+            ))
+
+        metrics = Parallel(n_jobs=n_jobs)(jobs) if jobs else []
+
+        shards = {}
+        for key, shard_metrics in zip(trained_keys, metrics):
+            shards[key] = {
+                'samples': int(sample_counts[key]),
+                'mae': float(shard_metrics['mae']),
+                'r2': float(shard_metrics['r2'])
+            }
+
+        os.makedirs(self.shards_dir, exist_ok=True)
+        with open(self.index_path, 'w') as f:
+            json.dump({
+                'shard_by': self.shard_by,
+                'model_type': model_type,
+                'trained_at': datetime.now().isoformat(),
+                'shards': shards
+            }, f, indent=2)
+
+        self.load_index()
+        logger.info(f"Trained {len(shards)} {self.shard_by} shards")
+        return shards
+
+    def retrain(self, model_type='random_forest'):
+        """Retrain train-type shards with new data"""
+        # Route shards need route ids, which only the training script has
+        X, y = self.global_model.generate_synthetic_data(2000)
+        self.shard_by = 'train_type'
+        segments = self.segments_from_matrix(X, self.global_model.feature_names)
+        return self.train_shards(X, y, segments, model_type)
+
+    def get_model(self, segment):
+        """Return the shard for a segment, loading it lazily, or the global model"""
+        if segment is None or segment not in self.available:
+            return self.global_model
+
+        with self._lock:
+            shard = self._loaded.get(segment)
+            if shard is not None:
+                self._loaded.move_to_end(segment)
+                return shard
+
+        shard = PredictionModel(model_dir=self.shard_dir(segment))
+        if not shard.load_model():
+            logger.warning(f"Could not load shard {segment}, using global model")
+            return self.global_model
+
+        with self._lock:
+            self._loaded[segment] = shard
+            self._loaded.move_to_end(segment)
+            while len(self._loaded) > self.max_loaded:
+                evicted, _ = self._loaded.popitem(last=False)
+                logger.info(f"Evicted shard {evicted}")
+
+        return shard
+
+    def get_info(self):
+        """Get information about trained and loaded shards"""
+        with self._lock:
+            loaded = list(self._loaded.keys())
+        return {
+            'shard_by': self.shard_by,
+            'available': len(self.available),
+            'loaded': loaded,
+            'max_loaded': self.max_loaded,
+            'shards': self.available
+        }
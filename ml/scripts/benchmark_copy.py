@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+SmartRail training data extraction benchmark
+Compares pd.read_sql_query against bulk COPY extraction on the local database
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import timedelta
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.data_processor import DataProcessor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def time_loader(name, loader, repeats):
+    """Run a loader several times and report the best wall time"""
+    best = float('inf')
+    rows = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        df = loader()
+        best = min(best, time.perf_counter() - start)
+        rows = len(df)
+
+    rate = rows / best if best > 0 else 0
+    logger.info(f"{name:<24} {rows:>10} rows  {best:8.2f} s  {rate:>12,.0f} rows/s")
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark training data extraction')
+    parser.add_argument('--days', type=int, default=90, help='Days of history to extract')
+    parser.add_argument('--parallel', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Connection counts to try for COPY')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    data_processor = DataProcessor()
+    end = data_processor.get_database_time()
+    start = end - timedelta(days=args.days)
+
+    def full_query_load():
+        # Start from an empty watermark so every repeat reads the whole window
+        data_processor.reset_training_watermark()
+        return data_processor.load_training_data(days_back=args.days)
+
+    baseline = time_loader('read_sql_query', full_query_load, args.repeats)
+
+    for parallel in args.parallel:
+        elapsed = time_loader(
+            f"COPY x{parallel}",
+            lambda: data_processor.copy_training_data(start, end, parallel),
+            args.repeats
+        )
+        logger.info(f"{'':<24} speed-up {baseline / elapsed:.1f}x")
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), '../../.env'))
+    main()
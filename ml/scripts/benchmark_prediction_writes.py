@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+SmartRail prediction write-back benchmark
+Compares one INSERT ... ON CONFLICT per prediction (as the Node service saves
+them) against staged COPY batches merged with one upsert, on the local database
+"""
+
+import os
+import sys
+import time
+import json
+import logging
+import argparse
+import numpy as np
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.data_processor import DataProcessor
+from utils.time_codec import format_minutes_array
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Rows written by the benchmark are tagged with this method and removed afterwards
+BENCHMARK_METHOD = 'write_benchmark'
+
+ROW_UPSERT = """
+    INSERT INTO predictions (
+        train_id, station_id, predicted_time, confidence_score,
+        delay_minutes, prediction_method, factors, created_at
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+    ON CONFLICT (train_id, station_id, DATE(created_at))
+    DO UPDATE SET
+        predicted_time = EXCLUDED.predicted_time,
+        confidence_score = EXCLUDED.confidence_score,
+        delay_minutes = EXCLUDED.delay_minutes,
+        prediction_method = EXCLUDED.prediction_method,
+        factors = EXCLUDED.factors,
+        updated_at = NOW()
+    WHERE predictions.actual_arrival_time IS NULL
+"""
+
+def build_predictions(data_processor, count, seed=42):
+    """Synthetic predictions over existing train x station pairs"""
+    conn = data_processor.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM trains ORDER BY id")
+        train_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT id FROM stations ORDER BY id")
+        station_ids = [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    pairs = len(train_ids) * len(station_ids)
+    if pairs < count:
+        logger.warning(f"Only {pairs} train x station pairs, writing {pairs} predictions")
+        count = pairs
+
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(pairs, size=count, replace=False)
+    delays = rng.gamma(2.0, 3.0, count).round().astype(int)
+    times = format_minutes_array(rng.integers(300, 1380, count) + delays)
+
+    return [
+        {
+            'train_id': train_ids[pick // len(station_ids)],
+            'station_id': station_ids[pick % len(station_ids)],
+            'predicted_time': str(times[i]),
+            'confidence_score': 0.75,
+            'delay_minutes': int(delays[i]),
+            'prediction_method': BENCHMARK_METHOD,
+            'factors': ['normal_conditions']
+        }
+        for i, pick in enumerate(picks)
+    ]
+
+def save_row_by_row(data_processor, predictions):
+    """One autocommitted round trip per prediction"""
+    conn = data_processor.get_connection()
+    conn.autocommit = True
+    try:
+        cursor = conn.cursor()
+        for prediction in predictions:
+            cursor.execute(ROW_UPSERT, (
+                prediction['train_id'],
+                prediction['station_id'],
+                prediction['predicted_time'],
+                prediction['confidence_score'],
+                prediction['delay_minutes'],
+                prediction['prediction_method'],
+                json.dumps(prediction['factors'])
+            ))
+    finally:
+        conn.close()
+
+def remove_benchmark_rows(data_processor):
+    conn = data_processor.get_connection()
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM predictions WHERE prediction_method = %s", (BENCHMARK_METHOD,))
+    finally:
+        conn.close()
+
+def time_writer(name, writer, count, repeats):
+    """Run a writer several times and report the best wall time"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        writer()
+        best = min(best, time.perf_counter() - start)
+
+    logger.info(f"{name:<24} {count:>10} rows  {best:8.2f} s  {count / best:>12,.0f} rows/s")
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark prediction write-back')
+    parser.add_argument('--count', type=int, default=20000, help='Predictions per run')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1000, 5000, 20000],
+                        help='Batch sizes to try for staged COPY')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    logger.warning("Benchmark upserts into predictions; run it against a local or development database")
+
+    data_processor = DataProcessor()
+    predictions = build_predictions(data_processor, args.count)
+
+    try:
+        baseline = time_writer(
+            'row-by-row upsert', lambda: save_row_by_row(data_processor, predictions),
+            len(predictions), args.repeats
+        )
+
+        for batch_size in args.batch_sizes:
+            elapsed = time_writer(
+                f"staged COPY x{batch_size}",
+                lambda: data_processor.save_predictions_bulk(predictions, batch_size),
+                len(predictions), args.repeats
+            )
+            logger.info(f"{'':<24} speed-up {baseline / elapsed:.1f}x")
+    finally:
+        remove_benchmark_rows(data_processor)
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), '../../.env'))
+    main()
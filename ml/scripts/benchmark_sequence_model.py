@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+SmartRail sequence model benchmark
+Trains the random forest and the tracking-window sequence model on the same
+synthetic rows and compares held-out accuracy, single-row p99 latency and
+batch throughput at different thread counts
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import numpy as np
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.prediction_model import PredictionModel
+from models.sequence_model import window_channels, SEQUENCE_LENGTH
+from utils.feature_engineer import FeatureEngineer
+from utils.workload_generator import WorkloadGenerator
+from utils.thread_budget import available_cores
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Minutes of recent standing still that carry into the delay at the next stop
+HOLD_EFFECT = 0.8
+HOLD_LOOKBACK = 15
+
+def synthetic_rows(num_trains, length, seed=42):
+    """Feature rows, one-minute tracking windows and delays that depend on both
+
+    Some trains were recently held at a signal. The hold adds to the delay but
+    is only visible in the window; current speed shows it only while it lasts.
+    """
+    feature_names = FeatureEngineer().feature_names
+    generator = WorkloadGenerator(num_trains=num_trains, seed=seed)
+    df = generator.outcomes(0, num_trains)
+    X, y = generator.to_training_arrays(df, feature_names)
+
+    rng = np.random.default_rng(seed)
+    n_rows = len(X)
+    cruise = np.maximum(X[:, feature_names.index('current_speed')], 20)
+    speed = cruise[:, None] * rng.uniform(0.9, 1.05, (n_rows, length))
+
+    held = rng.random(n_rows) < 0.4
+    hold_length = rng.integers(1, 13, n_rows)
+    hold_end = rng.integers(length - HOLD_LOOKBACK, length + 1, n_rows)
+    position = np.arange(length)[None, :]
+    holding = held[:, None] & (position >= (hold_end - hold_length)[:, None]) & (position < hold_end[:, None])
+    speed = np.where(holding, rng.uniform(0, 3, (n_rows, length)), speed)
+
+    minutes = np.broadcast_to(np.arange(length, dtype=float), (n_rows, length)) + rng.normal(0, 0.05, (n_rows, length))
+    latitude = 7.0 + np.cumsum(speed / 60, axis=1) / 111
+    longitude = np.full((n_rows, length), 80.0)
+
+    # Windows start part-way for trains that have only just begun reporting
+    reported = rng.integers(length // 4, length + 1, n_rows)
+    missing = position < (length - reported)[:, None]
+    minutes, speed, latitude = (np.where(missing, np.nan, values) for values in (minutes, speed, latitude))
+    windows = window_channels(minutes, speed, latitude, longitude)
+
+    recent_hold = (holding & ~missing)[:, length - HOLD_LOOKBACK:].sum(axis=1)
+    X[:, feature_names.index('current_speed')] = np.nan_to_num(speed[:, -1])
+    return X, y + HOLD_EFFECT * recent_hold, windows, feature_names
+
+def measure(model, X, windows, repeats, batch_size):
+    """Single-row latency percentiles and batch throughput through predict_many"""
+    rng = np.random.default_rng(0)
+    latencies = []
+    for i in rng.integers(0, len(X), repeats):
+        row_windows = windows[i:i + 1] if windows is not None else None
+        start = time.perf_counter()
+        model.predict_many(X[i:i + 1], windows=row_windows)
+        latencies.append(time.perf_counter() - start)
+
+    batch = np.arange(batch_size) % len(X)
+    start = time.perf_counter()
+    model.predict_many(X[batch], windows=windows[batch] if windows is not None else None)
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'rows_per_s': batch_size / elapsed
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the forest with the tracking-window sequence model')
+    parser.add_argument('--trains', type=int, default=1000, help='Synthetic trains (12 rows each)')
+    parser.add_argument('--length', type=int, default=SEQUENCE_LENGTH, help='Tracking points per window')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--repeats', type=int, default=2000, help='Single-row predictions timed')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--threads', type=int, nargs='+', default=None,
+                        help='Thread counts to time (default 1 and all cores)')
+    args = parser.parse_args()
+
+    X, y, windows, feature_names = synthetic_rows(args.trains, args.length)
+    logger.info(f"{len(X)} rows with {args.length}-point windows")
+
+    thread_counts = args.threads or sorted({1, available_cores()})
+    candidates = [
+        ('random_forest', {}, None),
+        ('sequence', {'epochs': args.epochs, 'sequence_length': args.length}, windows)
+    ]
+
+    for model_type, params, model_windows in candidates:
+        # Models train into a scratch directory so the served model is untouched
+        with tempfile.TemporaryDirectory() as model_dir:
+            model = PredictionModel(model_dir=model_dir)
+            model.feature_names = list(feature_names)
+            start = time.perf_counter()
+            result = model.train(X, y, model_type, params, windows=model_windows)
+            train_s = time.perf_counter() - start
+            size_kb = os.path.getsize(model.model_path) / 1024
+
+            # Time the model as served, reloaded from disk
+            model.load_model()
+            metrics = result['metrics']
+            logger.info(
+                f"{model_type:<14} MAE {metrics['mae']:6.3f}  R2 {metrics['r2']:.3f}  "
+                f"train {train_s:6.1f} s  {size_kb:8.1f} KB"
+            )
+            for threads in thread_counts:
+                model.model.set_params(n_jobs=threads)
+                stats = measure(model, X, model_windows, args.repeats, args.batch_size)
+                logger.info(
+                    f"{'':<14} {threads:>2} threads  p50 {stats['p50_ms']:7.3f} ms  "
+                    f"p99 {stats['p99_ms']:7.3f} ms  {stats['rows_per_s']:>10,.0f} rows/s"
+                )
+
+if __name__ == "__main__":
+    main()
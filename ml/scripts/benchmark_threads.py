@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+SmartRail thread budget benchmark
+Measures in-process prediction throughput and latency against request
+concurrency, with estimators fanning out to every core versus the serving
+thread budget
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from threadpoolctl import threadpool_limits
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.prediction_model import PredictionModel
+from utils.feature_engineer import FeatureEngineer
+from utils.thread_budget import available_cores, serving_n_jobs, serving_blas_threads, get_budget
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def run_level(model, rows, concurrency, requests_per_thread):
+    """Score rows from concurrent threads, one request per call"""
+    def worker(offset):
+        latencies = []
+        for i in range(requests_per_thread):
+            row = rows[(offset + i) % len(rows)]
+            start = time.perf_counter()
+            model.model.predict(model.scaler.transform(row))
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(0, concurrency * requests_per_thread, requests_per_thread)))
+    elapsed = time.perf_counter() - start
+
+    latency_ms = np.concatenate(results) * 1000
+    return {
+        'concurrency': concurrency,
+        'throughput_rps': round(len(latency_ms) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(latency_ms, 50)), 2),
+        'p99_ms': round(float(np.percentile(latency_ms, 99)), 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark prediction throughput against concurrency')
+    parser.add_argument('--samples', type=int, default=5000, help='Synthetic training samples')
+    parser.add_argument('--batch-size', type=int, default=1, help='Rows per request')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32', help='Comma-separated thread counts')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per thread at each level')
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    # Train a throwaway model so the benchmark never touches the served one
+    model = PredictionModel(model_dir=tempfile.mkdtemp(prefix='smartrail-threads-'))
+    model.feature_names = FeatureEngineer().feature_names
+    X, y = model.generate_synthetic_data(args.samples)
+    model.train(X, y)
+
+    batches = [
+        X[start:start + args.batch_size]
+        for start in range(0, len(X) - args.batch_size + 1, args.batch_size)
+    ]
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    # Estimators fanning out to every core with native pools at their defaults,
+    # against the serving budget of one estimator job and capped BLAS threads
+    configs = {
+        'unbounded': (-1, available_cores()),
+        'budgeted': (serving_n_jobs(), serving_blas_threads())
+    }
+
+    results = {}
+    for name, (n_jobs, blas_threads) in configs.items():
+        model.model.set_params(n_jobs=n_jobs)
+        with threadpool_limits(limits=blas_threads):
+            results[name] = [run_level(model, batches, level, args.requests) for level in levels]
+
+        for level in results[name]:
+            logger.info(
+                f"{name:<10} concurrency {level['concurrency']:>3}  {level['throughput_rps']:>9.1f} req/s  "
+                f"p50 {level['p50_ms']:>8.2f} ms  p99 {level['p99_ms']:>8.2f} ms"
+            )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'budget': get_budget(), 'batch_size': args.batch_size, 'results': results}, f, indent=2)
+        logger.info(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
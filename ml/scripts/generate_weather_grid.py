@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+SmartRail local weather feed stub
+Writes hourly gridded weather over the rail network into the weather drop
+directory, standing in for an observation/forecast feed during development,
+and times batch interpolation from the resulting cache
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.weather_grid import WeatherGrid
+from utils.workload_generator import NETWORK_BOUNDS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def stub_grid(valid_time, resolution, rng):
+    """Plausible monsoon weather: diurnal heat, cooler hills, a few drifting rain cells"""
+    latitudes = np.arange(NETWORK_BOUNDS['lat'][0], NETWORK_BOUNDS['lat'][1] + resolution / 2, resolution)
+    longitudes = np.arange(NETWORK_BOUNDS['lon'][0], NETWORK_BOUNDS['lon'][1] + resolution / 2, resolution)
+    lat, lon = np.meshgrid(latitudes, longitudes, indexing='ij')
+
+    hour = valid_time.hour + valid_time.minute / 60
+    # Central highlands around (7.0, 80.7) run several degrees cooler
+    highland = np.exp(-((lat - 7.0) ** 2 + (lon - 80.7) ** 2) / 0.3)
+    temperature = 27 + 4 * np.sin((hour - 9) / 24 * 2 * np.pi) - 8 * highland + rng.normal(0, 0.3, lat.shape)
+
+    rainfall = np.zeros(lat.shape)
+    for _ in range(3):
+        centre_lat = rng.uniform(*NETWORK_BOUNDS['lat'])
+        centre_lon = rng.uniform(*NETWORK_BOUNDS['lon'])
+        rainfall += rng.gamma(2, 4) * np.exp(-((lat - centre_lat) ** 2 + (lon - centre_lon) ** 2) / 0.1)
+    humidity = np.clip(70 + 2.5 * rainfall + 5 * highland + rng.normal(0, 2, lat.shape), 30, 100)
+
+    return {
+        'valid_time': valid_time.isoformat(),
+        'latitudes': latitudes.round(4).tolist(),
+        'longitudes': longitudes.round(4).tolist(),
+        'temperature': temperature.round(1).tolist(),
+        'humidity': humidity.round(1).tolist(),
+        'rainfall': rainfall.round(2).tolist()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Write stub weather grids and time interpolation')
+    parser.add_argument('--hours', type=int, default=6, help='Hourly grids from the current hour on')
+    parser.add_argument('--resolution', type=float, default=0.1, help='Grid spacing in degrees')
+    parser.add_argument('--points', type=int, default=100000, help='Points interpolated in the timing run')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    weather = WeatherGrid(poll_seconds=0)
+    start = datetime.now().replace(minute=0, second=0, microsecond=0)
+    for hour in range(args.hours):
+        weather.write(stub_grid(start + timedelta(hours=hour), args.resolution, rng))
+    info = weather.get_info()
+    logger.info(f"Wrote {args.hours} grids to {weather.drop_dir} ({info['first_bucket']} -> {info['last_bucket']})")
+
+    # Random positions on the network at random times across the grids
+    latitudes = rng.uniform(*NETWORK_BOUNDS['lat'], args.points)
+    longitudes = rng.uniform(*NETWORK_BOUNDS['lon'], args.points)
+    minutes = start.timestamp() / 60 + rng.uniform(0, args.hours * 60, args.points)
+    timings = []
+    for _ in range(5):
+        started = time.perf_counter()
+        result = weather.sample(latitudes, longitudes, minutes)
+        timings.append(time.perf_counter() - started)
+    logger.info(
+        f"Interpolated {args.points} points in {min(timings) * 1000:.1f} ms "
+        f"({args.points / min(timings):,.0f} points/s), {result['covered'].mean():.0%} covered"
+    )
+
+if __name__ == "__main__":
+    main()
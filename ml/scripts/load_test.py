@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+SmartRail ML service load test
+Replays recorded or synthetic /predict and /batch_predict traffic at a fixed
+rate, reports latency percentiles, errors and server CPU/RSS, and can ramp the
+rate to find where each serving mode saturates
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+import requests
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.admission import DEGRADED
+from utils.workload_generator import WorkloadGenerator
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'load_tests')
+
+_local = threading.local()
+
+
+def load_payloads(path=None, count=5000, seed=42):
+    """Read recorded /predict payloads (NDJSON) or generate synthetic ones"""
+    if path:
+        with open(path, 'r') as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+        logger.info(f"Loaded {len(payloads)} recorded payloads from {path}")
+        return payloads
+
+    trains = max(1, count // 12)
+    generator = WorkloadGenerator(num_trains=trains, seed=seed)
+    payloads = generator.requests(0, trains).to_dict('records')
+    logger.info(f"Generated {len(payloads)} synthetic payloads")
+    return payloads
+
+
+def build_requests(payloads, mode, batch_size):
+    """Turn payloads into (endpoint, body, rows) tuples for a serving mode"""
+    if mode == 'predict':
+        return [('/predict', payload, 1) for payload in payloads]
+
+    batches = []
+    for start in range(0, len(payloads), batch_size):
+        batch = payloads[start:start + batch_size]
+        batches.append(('/batch_predict', {'predictions': batch}, len(batch)))
+    return batches
+
+
+def send(base_url, endpoint, body, timeout):
+    """POST one request on this thread's session; returns (ok, status, rows scored, degraded)"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    try:
+        response = session.post(f"{base_url}{endpoint}", json=body, timeout=timeout)
+    except requests.RequestException as e:
+        return False, type(e).__name__, 0, False
+
+    if response.status_code >= 400:
+        return False, response.status_code, 0, False
+    # Overflow answered by the fallback model is a 200, but not a full-model prediction
+    degraded = response.headers.get('X-Prediction-Mode') == DEGRADED
+    if endpoint == '/batch_predict':
+        try:
+            predictions = response.json().get('predictions', [])
+        except ValueError:
+            # A truncated or non-JSON body is a failed request, not a crashed worker
+            return False, 'InvalidJSON', 0, degraded
+        # A batch succeeds as a whole even when some of its rows fail
+        scored = sum(1 for prediction in predictions if 'error' not in prediction)
+        return True, response.status_code, scored, degraded
+    return True, response.status_code, 1, degraded
+
+
+class ProcessSampler:
+    """Samples CPU and RSS of the server process from /proc once a second"""
+
+    def __init__(self, pid, interval=1.0):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+
+    def read(self):
+        """Cumulative CPU seconds and resident memory in MB"""
+        with open(f"/proc/{self.pid}/stat", 'r') as f:
+            # The command name may contain spaces, so split after its closing paren
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / self.clock_ticks
+        rss_mb = int(fields[21]) * self.page_size / (1024 * 1024)
+        return cpu_seconds, rss_mb
+
+    def run(self):
+        last_time = time.perf_counter()
+        last_cpu, _ = self.read()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            cpu, rss = self.read()
+            self.samples.append({
+                'elapsed_s': round(now - self.started, 2),
+                'cpu_percent': round(100 * (cpu - last_cpu) / (now - last_time), 1),
+                'rss_mb': round(rss, 1)
+            })
+            last_time, last_cpu = now, cpu
+
+    def start(self):
+        if not self.pid:
+            return self
+        if not os.path.exists(f"/proc/{self.pid}/stat"):
+            logger.warning(f"Process {self.pid} not found, server metrics disabled")
+            self.pid = None
+            return self
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+        return self.samples
+
+
+def run_stage(base_url, work, rate, duration, concurrency, timeout, server_pid=None):
+    """Issue requests open-loop at a fixed rate and measure them"""
+    n_requests = max(1, int(rate * duration))
+    sampler = ProcessSampler(server_pid).start()
+
+    latencies = np.full(n_requests, np.nan)
+    rows = np.zeros(n_requests, dtype=int)
+    statuses = [None] * n_requests
+    degraded = np.zeros(n_requests, dtype=bool)
+    finished = np.zeros(n_requests)
+
+    def issue(i, scheduled_at):
+        endpoint, body, _ = work[i % len(work)]
+        try:
+            ok, status, scored, fallback = send(base_url, endpoint, body, timeout)
+        except Exception as e:
+            # Exceptions vanish inside the executor; every request must still be recorded
+            ok, status, scored, fallback = False, type(e).__name__, 0, False
+        done = time.perf_counter()
+        # Latency runs from when the request was due, so a backed-up client
+        # still counts the time the request spent waiting to be sent
+        latencies[i] = done - scheduled_at
+        finished[i] = done
+        rows[i] = scored
+        statuses[i] = None if ok else status
+        degraded[i] = ok and fallback
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(n_requests):
+            scheduled_at = start + i / rate
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(issue, i, scheduled_at)
+    elapsed = time.perf_counter() - start
+    server = sampler.stop()
+
+    errors = [s for s in statuses if s is not None]
+    latency_ms = latencies * 1000
+    per_second = np.bincount(
+        ((finished - start) // 1).astype(int), minlength=int(np.ceil(elapsed))
+    )[:int(np.ceil(elapsed))]
+
+    result = {
+        'offered_rate': rate,
+        'requests': n_requests,
+        'duration_s': round(elapsed, 2),
+        'throughput_rps': round(n_requests / elapsed, 1),
+        'rows_per_s': round(rows[~degraded].sum() / elapsed, 1),
+        'degraded_rows_per_s': round(rows[degraded].sum() / elapsed, 1),
+        'error_rate': round(len(errors) / n_requests, 4),
+        'degraded_rate': round(int(degraded.sum()) / n_requests, 4),
+        'errors': {str(status): errors.count(status) for status in set(errors)},
+        'latency_ms': {
+            'p50': round(float(np.percentile(latency_ms, 50)), 2),
+            'p90': round(float(np.percentile(latency_ms, 90)), 2),
+            'p99': round(float(np.percentile(latency_ms, 99)), 2),
+            'max': round(float(latency_ms.max()), 2),
+            'mean': round(float(latency_ms.mean()), 2)
+        },
+        'completed_per_second': per_second.tolist()
+    }
+    if server:
+        result['server'] = {
+            'peak_cpu_percent': max(s['cpu_percent'] for s in server),
+            'peak_rss_mb': max(s['rss_mb'] for s in server),
+            'timeline': server
+        }
+    return result
+
+
+def find_saturation(base_url, work, start_rate, max_rate, growth, duration,
+                    concurrency, timeout, slo_p99_ms, max_error_rate, max_degraded_rate,
+                    server_pid=None):
+    """Raise the offered rate until latency, errors, fallback answers or throughput give out"""
+    stages = []
+    sustainable = None
+    rate = start_rate
+
+    while rate <= max_rate:
+        stage = run_stage(base_url, work, rate, duration, concurrency, timeout, server_pid)
+        stages.append(stage)
+
+        reasons = []
+        if stage['latency_ms']['p99'] > slo_p99_ms:
+            reasons.append(f"p99 {stage['latency_ms']['p99']} ms > {slo_p99_ms} ms")
+        if stage['error_rate'] > max_error_rate:
+            reasons.append(f"error rate {stage['error_rate']:.2%}")
+        if stage['degraded_rate'] > max_degraded_rate:
+            reasons.append(f"degraded rate {stage['degraded_rate']:.2%}")
+        if stage['throughput_rps'] < 0.9 * rate:
+            reasons.append(f"served {stage['throughput_rps']} of {rate} req/s")
+
+        logger.info(
+            f"rate {rate:>8.1f} req/s  p50 {stage['latency_ms']['p50']:>8.1f} ms  "
+            f"p99 {stage['latency_ms']['p99']:>8.1f} ms  errors {stage['error_rate']:.2%}  degraded {stage['degraded_rate']:.2%}"
+        )
+
+        if reasons:
+            stage['saturated_by'] = reasons
+            break
+
+        sustainable = rate
+        rate = round(rate * growth, 1)
+
+    return {
+        'saturation_rate': sustainable,
+        'stages': stages
+    }
+
+
+def compare(result, baseline_path):
+    """Log the change in headline numbers against a saved run"""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+
+    def headline(run):
+        stage = run['stages'][-1] if 'stages' in run else run
+        return {
+            'saturation_rate': run.get('saturation_rate'),
+            'throughput_rps': stage['throughput_rps'],
+            'p50_ms': stage['latency_ms']['p50'],
+            'p99_ms': stage['latency_ms']['p99'],
+            'error_rate': stage['error_rate'],
+            'degraded_rate': stage.get('degraded_rate')
+        }
+
+    old, new = headline(baseline['result']), headline(result)
+    for key in new:
+        if old[key] is None or new[key] is None:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0
+        logger.info(f"{key:<16} {old[key]:>10} -> {new[key]:>10}  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the SmartRail ML service')
+    parser.add_argument('--url', default=os.getenv('ML_SERVICE_URL', 'http://localhost:8000'))
+    parser.add_argument('--mode', choices=['predict', 'batch_predict'], default='predict')
+    parser.add_argument('--payloads', help='NDJSON file of recorded /predict payloads')
+    parser.add_argument('--count', type=int, default=5000, help='Synthetic payloads to generate')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=50, help='Requests per second (start rate when ramping)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per stage')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--server-pid', type=int, help='Sample CPU/RSS of this process')
+    parser.add_argument('--find-saturation', action='store_true')
+    parser.add_argument('--max-rate', type=float, default=5000)
+    parser.add_argument('--growth', type=float, default=1.5)
+    parser.add_argument('--slo-p99-ms', type=float, default=500)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--max-degraded-rate', type=float, default=0.01,
+                        help='Share of fallback-model answers a sustainable rate may have')
+    parser.add_argument('--label', default=None, help='Build label stored with the results')
+    parser.add_argument('--output', help='Results file (defaults to ml/data/load_tests/)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads, args.count)
+    work = build_requests(payloads, args.mode, args.batch_size)
+
+    if args.find_saturation:
+        result = find_saturation(
+            args.url, work, args.rate, args.max_rate, args.growth, args.duration,
+            args.concurrency, args.timeout, args.slo_p99_ms, args.max_error_rate,
+            args.max_degraded_rate, args.server_pid
+        )
+        logger.info(f"Saturation point for {args.mode}: {result['saturation_rate']} req/s")
+    else:
+        result = run_stage(
+            args.url, work, args.rate, args.duration, args.concurrency, args.timeout, args.server_pid
+        )
+        logger.info(json.dumps({k: v for k, v in result.items() if k not in ('completed_per_second', 'server')}))
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{args.mode}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'label': args.label,
+            'mode': args.mode,
+            'batch_size': args.batch_size if args.mode == 'batch_predict' else None,
+            'concurrency': args.concurrency,
+            'url': args.url,
+            'run_at': datetime.now().isoformat(),
+            'result': result
+        }, f, indent=2)
+    logger.info(f"Results saved to {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+if __name__ == "__main__":
+    main()
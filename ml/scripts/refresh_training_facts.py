@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+SmartRail training facts maintenance
+Incrementally refreshes the ml_training_facts table the training loaders read from
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.data_processor import DataProcessor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh the ML training facts table')
+    parser.add_argument('--rebuild', action='store_true', help='Truncate and rebuild from scratch')
+    args = parser.parse_args()
+
+    data_processor = DataProcessor()
+    try:
+        result = data_processor.refresh_training_facts(rebuild=args.rebuild)
+        logger.info(f"Refresh complete: {result}")
+    except Exception as e:
+        logger.error(f"Training facts refresh failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), '../../.env'))
+    main()
@@ -1,45 +1,41 @@
 import os
+import sys
 import json
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.time_codec import format_minutes_array
+
 def generate_synthetic_predictions(num_trains=3, stations_per_train=12):
     """Generate a synthetic dataset for arrival predictions.
     Produces rows with train_id, station_id, scheduled_time, features, and target predicted_time with noise.
     """
-    rows = []
-    base_train_ids = list(range(1, num_trains + 1))
-    base_station_ids = list(range(100, 100 + stations_per_train))
-
-    for train_id in base_train_ids:
-        # Start at 06:00, each station +25 minutes
-        start = datetime.strptime('06:00:00', '%H:%M:%S')
-        for idx, station_id in enumerate(base_station_ids):
-            scheduled = start + timedelta(minutes=25 * idx)
-            # Features
-            hour = scheduled.hour
-            day_of_week = 2  # Wednesday
-            distance_km = 10 + 8 * idx
-            speed_kmh = 60 + np.random.randn() * 4
-            weather_factor = np.random.choice([0, 0.5, 1.0])
-            # Noise/delay in minutes
-            baseline_delay = max(0, np.random.normal(loc=2 + 0.02 * distance_km + 0.15 * weather_factor * 10, scale=2))
-            predicted_dt = scheduled + timedelta(minutes=baseline_delay)
-            rows.append({
-                'train_id': train_id,
-                'station_id': station_id,
-                'scheduled_time': scheduled.strftime('%H:%M:%S'),
-                'predicted_time': predicted_dt.strftime('%H:%M:%S'),
-                'hour': hour,
-                'day_of_week': day_of_week,
-                'distance_km': distance_km,
-                'speed_kmh': speed_kmh,
-                'weather_factor': weather_factor,
-                'delay_minutes': baseline_delay
-            })
-
-    df = pd.DataFrame(rows)
+    n_rows = num_trains * stations_per_train
+    idx = np.tile(np.arange(stations_per_train), num_trains)
+
+    # Start at 06:00, each station +25 minutes
+    scheduled_minutes = 6 * 60 + 25 * idx
+    distance_km = 10 + 8 * idx
+    speed_kmh = 60 + np.random.randn(n_rows) * 4
+    weather_factor = np.random.choice([0, 0.5, 1.0], n_rows)
+
+    # Noise/delay in minutes
+    baseline_delay = np.maximum(0, np.random.normal(2 + 0.02 * distance_km + 0.15 * weather_factor * 10, 2))
+
+    df = pd.DataFrame({
+        'train_id': np.repeat(np.arange(1, num_trains + 1), stations_per_train),
+        'station_id': 100 + idx,
+        'scheduled_time': format_minutes_array(scheduled_minutes),
+        'predicted_time': format_minutes_array(scheduled_minutes + baseline_delay),
+        'hour': (scheduled_minutes // 60) % 24,
+        'day_of_week': 2,  # Wednesday
+        'distance_km': distance_km,
+        'speed_kmh': speed_kmh,
+        'weather_factor': weather_factor,
+        'delay_minutes': baseline_delay
+    })
     return df
 
 def save_synthetic_dataset(output_dir):
@@ -69,8 +65,14 @@ import numpy as np
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models.prediction_model import PredictionModel
+from models.sharded_model import ShardedModelSet
+from models.backtester import Backtester
+from models.compression import compress_model, COMPRESSION_METHODS
+from models.sequence_model import point_windows, SEQUENCE_LENGTH
 from utils.data_processor import DataProcessor
 from utils.feature_engineer import FeatureEngineer
+from utils.feature_cache import FeatureCache
+from utils.train_state import TRAIN_STATE_TTL_MINUTES
 
 # Configure logging
 logging.basicConfig(
@@ -83,6 +85,125 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def extract_training_arrays(df, data_processor, feature_engineer, sequence_length=None):
+    """Preprocess training rows and extract feature arrays
+    
+    With a sequence length, each row also gets the window of its train's
+    raw tracking points up to it, as the live train state would have held it.
+    """
+    features_list = []
+    targets = []
+    route_ids = []
+    timestamps = []
+    kept = []
+    windows = None
+    
+    if not df.empty:
+        # Preprocess data
+        logger.info("Preprocessing data...")
+        df_processed = data_processor.preprocess_data(df)
+        
+        if sequence_length:
+            # Training rows are only points with a recorded outcome; windows read
+            # every point, reaching back as far as a full window can span
+            logger.info("Building tracking windows...")
+            row_times = pd.to_datetime(df_processed['timestamp'])
+            points = data_processor.load_tracking_points(
+                row_times.min() - timedelta(minutes=TRAIN_STATE_TTL_MINUTES * sequence_length), row_times.max()
+            )
+            windows = point_windows(points, df_processed['train_id'], row_times, sequence_length)
+        
+        # Extract features
+        logger.info("Engineering features...")
+        for position, (_, row) in enumerate(df_processed.iterrows()):
+            try:
+                # Convert row to feature format
+                data_dict = {
+                    'train_id': row['train_id'],
+                    'station_id': row['station_id'],
+                    'current_location': {
+                        'latitude': row['latitude'],
+                        'longitude': row['longitude'],
+                        'speed': row['speed']
+                    },
+                    'time_features': {
+                        'hour': row['hour'],
+                        'day_of_week': row['day_of_week'],
+                        'is_weekend': row.get('is_weekend', False),
+                        'is_peak_hour': row.get('is_peak_hour', False)
+                    },
+                    'weather_data': {
+                        'temperature': 28,  # Default values
+                        'humidity': 75,
+                        'rainfall': 0
+                    }
+                }
+                
+                features = feature_engineer.extract_features(data_dict)
+                features_list.append([features[name] for name in feature_engineer.feature_names])
+                targets.append(row.get('actual_delay_minutes', 0))
+                route_ids.append(int(row['route_id']) if pd.notna(row.get('route_id')) else -1)
+                timestamps.append(row.get('timestamp'))
+                kept.append(position)
+                
+            except Exception as e:
+                logger.warning(f"Skipping row due to feature extraction error: {e}")
+                continue
+    
+    arrays = {
+        'X': np.array(features_list, dtype=float).reshape(-1, len(feature_engineer.feature_names)),
+        'y': np.array(targets, dtype=float),
+        'timestamps': np.array(timestamps, dtype='datetime64[ns]'),
+        'route_ids': np.array(route_ids, dtype=np.int64)
+    }
+    if windows is not None:
+        arrays['windows'] = windows[kept]
+    return arrays
+
+def load_training_matrix(model, data_processor, feature_engineer, days_back=90):
+    """Load training data and build the feature matrix, targets and row metadata"""
+    arrays = None
+    use_cache = os.getenv('ML_FEATURE_CACHE', 'true').lower() == 'true'
+    
+    # Fold new tracking rows and recorded outcomes into the training facts
+    try:
+        data_processor.refresh_training_facts()
+    except Exception as e:
+        logger.warning(f"Could not refresh training facts: {e}")
+    
+    # Load training data
+    logger.info("Loading training data...")
+    if use_cache:
+        try:
+            cache = FeatureCache(feature_engineer.feature_names)
+            end_day = datetime.now().date()
+            start_day = end_day - timedelta(days=days_back)
+            arrays = cache.load(
+                start_day, end_day,
+                lambda day: extract_training_arrays(
+                    data_processor.load_training_partition(day), data_processor, feature_engineer
+                ),
+                data_processor.load_training_partition_sources(start_day, end_day)
+            )
+        except Exception as e:
+            logger.warning(f"Feature cache unavailable, loading directly: {e}")
+            use_cache = False
+    
+    if not use_cache:
+        df = data_processor.load_training_data(days_back=days_back)
+        if not df.empty:
+            logger.info(f"Loaded {len(df)} training records")
+            arrays = extract_training_arrays(df, data_processor, feature_engineer)
+    
+    if arrays is None or not len(arrays['y']):
+        logger.warning("No training data found, generating synthetic data...")
+        X, y = model.generate_synthetic_data(2000)
+        return X, y, None, None
+    
+    model.feature_names = list(feature_engineer.feature_names)
+    logger.info(f"Extracted features for {len(arrays['y'])} samples")
+    return arrays['X'], arrays['y'], arrays['route_ids'], arrays['timestamps']
+
 def main():
     """Main training function"""
     try:
@@ -93,65 +214,7 @@ def main():
         data_processor = DataProcessor()
         feature_engineer = FeatureEngineer()
         
-        # Load training data
-        logger.info("Loading training data...")
-        df = data_processor.load_training_data(days_back=90)
-        
-        if df.empty:
-            logger.warning("No training data found, generating synthetic data...")
-            X, y = model.generate_synthetic_data(2000)
-            feature_names = feature_engineer.feature_names
-        else:
-            logger.info(f"Loaded {len(df)} training records")
-            
-            # Preprocess data
-            logger.info("Preprocessing data...")
-            df_processed = data_processor.preprocess_data(df)
-            
-            # Extract features
-            logger.info("Engineering features...")
-            features_list = []
-            targets = []
-            
-            for _, row in df_processed.iterrows():
-                try:
-                    # Convert row to feature format
-                    data_dict = {
-                        'train_id': row['train_id'],
-                        'station_id': row['station_id'],
-                        'current_location': {
-                            'latitude': row['latitude'],
-                            'longitude': row['longitude'],
-                            'speed': row['speed']
-                        },
-                        'time_features': {
-                            'hour': row['hour'],
-                            'day_of_week': row['day_of_week'],
-                            'is_weekend': row.get('is_weekend', False),
-                            'is_peak_hour': row.get('is_peak_hour', False)
-                        },
-                        'weather_data': {
-                            'temperature': 28,  # Default values
-                            'humidity': 75,
-                            'rainfall': 0
-                        }
-                    }
-                    
-                    features = feature_engineer.extract_features(data_dict)
-                    features_list.append([features[name] for name in feature_engineer.feature_names])
-                    targets.append(row.get('actual_delay_minutes', 0))
-                    
-                except Exception as e:
-                    logger.warning(f"Skipping row due to feature extraction error: {e}")
-                    continue
-            
-            if not features_list:
-                logger.warning("No valid features extracted, using synthetic data...")
-                X, y = model.generate_synthetic_data(2000)
-            else:
-                X = np.array(features_list)
-                y = np.array(targets)
-                logger.info(f"Extracted features for {len(X)} samples")
+        X, y, route_ids, timestamps = load_training_matrix(model, data_processor, feature_engineer)
         
         # Train different model types and compare
         model_types = ['random_forest', 'gradient_boosting', 'linear_regression']
@@ -162,7 +225,7 @@ def main():
             logger.info(f"Training {model_type} model...")
             
             try:
-                result = model.train(X, y, model_type)
+                result = model.train(X, y, model_type, timestamps=timestamps)
                 mae = result['metrics']['mae']
                 
                 logger.info(f"{model_type} - MAE: {mae:.2f}, R2: {result['metrics']['r2']:.3f}")
@@ -179,11 +242,35 @@ def main():
             logger.info(f"Best model: {best_model} (MAE: {best_score:.2f})")
             logger.info("Training final model...")
             
-            final_result = model.train(X, y, best_model)
+            final_result = model.train(X, y, best_model, timestamps=timestamps)
             
             logger.info("Saving trained model...")
             model.save_model()
             
+            # Shrink the served model where it costs no more than the guardrail allows
+            methods = compression_methods()
+            if methods:
+                logger.info(f"Compressing model ({', '.join(methods)})...")
+                X_train, X_test, y_train, y_test, _ = model.split_data(X, y, timestamps)
+                compress_model(model, X_train, y_train, X_test, y_test, methods)
+            
+            # Train compact per-segment shards alongside the global model
+            logger.info("Training model shards...")
+            sharded = ShardedModelSet(model)
+            shard_rows = np.arange(len(y))
+            if sharded.shard_by == 'route' and route_ids is not None:
+                # Rows without a route belong to no shard; the global model covers them
+                shard_rows = np.flatnonzero(route_ids >= 0)
+                segments = np.array([f"route_{route_id}" for route_id in route_ids[shard_rows]])
+            else:
+                sharded.shard_by = 'train_type'
+                segments = sharded.segments_from_matrix(X, model.feature_names)
+            shards = sharded.train_shards(
+                X[shard_rows], y[shard_rows], segments, best_model,
+                timestamps=timestamps[shard_rows] if timestamps is not None else None
+            )
+            logger.info(f"Trained {len(shards)} shards by {sharded.shard_by}")
+            
             # Print final metrics
             metrics = final_result['metrics']
             logger.info("Final Model Performance:")
@@ -202,6 +289,64 @@ def main():
         logger.error(f"Training failed: {e}")
         sys.exit(1)
 
+def compression_methods():
+    """Compression methods enabled for training (ML_COMPRESSION, 'none' to disable)"""
+    setting = os.getenv('ML_COMPRESSION', ','.join(COMPRESSION_METHODS))
+    return [method for method in setting.split(',') if method in COMPRESSION_METHODS]
+
+def compress_saved_model(methods=None):
+    """Compress the saved model, judged on held-out rows of the current training data"""
+    try:
+        model = PredictionModel()
+        if not model.load_model():
+            logger.error("No trained model found")
+            return
+        
+        X, y, _, timestamps = load_training_matrix(model, DataProcessor(), FeatureEngineer())
+        X_train, X_test, y_train, y_test, _ = model.split_data(X, y, timestamps)
+        report = compress_model(model, X_train, y_train, X_test, y_test, methods or compression_methods())
+        logger.info(f"Serving {report['chosen']} model")
+        return report
+        
+    except Exception as e:
+        logger.error(f"Compression failed: {e}")
+
+def train_sequence_model(days_back=90):
+    """Train the tracking-window sequence model and serve it if it beats the forest on the same split"""
+    try:
+        model = PredictionModel()
+        data_processor = DataProcessor()
+        feature_engineer = FeatureEngineer()
+        
+        # Windows need the raw tracking rows, which the feature cache does not keep
+        df = data_processor.load_training_data(days_back=days_back)
+        if df.empty:
+            logger.error("No training data found; the sequence model needs recorded tracking")
+            return
+        arrays = extract_training_arrays(df, data_processor, feature_engineer, SEQUENCE_LENGTH)
+        model.feature_names = list(feature_engineer.feature_names)
+        X, y, timestamps, windows = arrays['X'], arrays['y'], arrays['timestamps'], arrays['windows']
+        logger.info(f"Extracted features and {SEQUENCE_LENGTH}-point windows for {len(y)} samples")
+        
+        results = {}
+        for model_type in ('random_forest', 'sequence'):
+            logger.info(f"Training {model_type} model...")
+            result = model.train(X, y, model_type, timestamps=timestamps,
+                                 windows=windows if model_type == 'sequence' else None)
+            results[model_type] = result['metrics']
+            logger.info(f"{model_type} - MAE: {result['metrics']['mae']:.2f}, R2: {result['metrics']['r2']:.3f}")
+        
+        # The last train saved the sequence model; put the forest back if it did better
+        if results['sequence']['mae'] > results['random_forest']['mae']:
+            logger.info("Sequence model did not beat the forest, keeping the forest")
+            model.train(X, y, 'random_forest', timestamps=timestamps)
+        else:
+            logger.info("Serving the sequence model")
+        return results
+        
+    except Exception as e:
+        logger.error(f"Sequence model training failed: {e}")
+
 def evaluate_model():
     """Evaluate the trained model"""
     try:
@@ -231,6 +376,35 @@ def evaluate_model():
     except Exception as e:
         logger.error(f"Evaluation failed: {e}")
 
+def backtest_model(model_type='random_forest'):
+    """Backtest a model type over rolling-origin windows"""
+    try:
+        logger.info(f"Backtesting {model_type} model...")
+        
+        model = PredictionModel()
+        X, y, _, timestamps = load_training_matrix(model, DataProcessor(), FeatureEngineer())
+        
+        if timestamps is None:
+            logger.warning("No timestamps available, replaying synthetic data in generation order")
+            timestamps = np.arange(len(X))
+        
+        report = Backtester(model_type).run(X, y, timestamps)
+        
+        logger.info("Backtest Results:")
+        for window in report['windows']:
+            logger.info(
+                f"   - Window {window['window']} ({window['test_from']} -> {window['test_to']}): "
+                f"MAE {window['mae']:.2f} min, ±5min {window['accuracy_within_5min']*100:.1f}% "
+                f"[train {window['train_samples']}, test {window['test_samples']}]"
+            )
+        logger.info(f"   - Mean MAE: {report['mean_mae']:.2f} minutes")
+        logger.info(f"   - Mean Accuracy (±5min): {report['mean_accuracy_within_5min']*100:.1f}%")
+        
+        return report
+        
+    except Exception as e:
+        logger.error(f"Backtest failed: {e}")
+
 if __name__ == "__main__":
     # Load environment variables
     from dotenv import load_dotenv
@@ -239,5 +413,11 @@ if __name__ == "__main__":
     # Check command line arguments
     if len(sys.argv) > 1 and sys.argv[1] == 'evaluate':
         evaluate_model()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'backtest':
+        backtest_model(sys.argv[2] if len(sys.argv) > 2 else 'random_forest')
+    elif len(sys.argv) > 1 and sys.argv[1] == 'sequence':
+        train_sequence_model()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'compress':
+        compress_saved_model(sys.argv[2].split(',') if len(sys.argv) > 2 else None)
     else:
         main()
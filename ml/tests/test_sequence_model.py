@@ -0,0 +1,49 @@
+import pickle
+import numpy as np
+from models.sequence_model import SequenceRegressor, TRACKING_CHANNELS
+
+
+def fitted_regressor():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(64, 5))
+    windows = rng.normal(size=(64, 8, len(TRACKING_CHANNELS)))
+    y = X[:, 0] * 2 + windows[:, -1, 0]
+    regressor = SequenceRegressor(sequence_length=8, hidden_size=8, epochs=2, batch_size=32).fit(X, y, windows)
+    return regressor, X, windows
+
+
+def test_pickle_round_trip_keeps_predictions():
+    regressor, X, windows = fitted_regressor()
+    expected = regressor.predict(X, windows)
+
+    restored = pickle.loads(pickle.dumps(regressor))
+
+    np.testing.assert_allclose(restored.predict(X, windows), expected, rtol=1e-5)
+
+
+def test_pickling_leaves_the_fitted_network_in_place():
+    regressor, X, windows = fitted_regressor()
+    expected = regressor.predict(X, windows)
+
+    pickle.dumps(regressor)
+
+    np.testing.assert_allclose(regressor.predict(X, windows), expected, rtol=1e-5)
+
+
+def test_saved_model_serves_the_same_predictions(tmp_path):
+    from models.prediction_model import PredictionModel
+
+    rng = np.random.default_rng(1)
+    model = PredictionModel(model_dir=str(tmp_path))
+    X, y = model.generate_synthetic_data(200)
+    X = np.asarray(X, dtype=float)
+    windows = rng.normal(size=(len(X), 8, len(TRACKING_CHANNELS)))
+    model.train(X, y, 'sequence', {'sequence_length': 8, 'hidden_size': 8, 'epochs': 2}, windows=windows)
+    expected = model.predict_many(X[:20], windows=windows[:20])['delay_minutes']
+
+    served = PredictionModel(model_dir=str(tmp_path))
+    assert served.load_model()
+    assert served.uses_tracking_windows()
+
+    np.testing.assert_allclose(served.predict_many(X[:20], windows=windows[:20])['delay_minutes'], expected, rtol=1e-5)
+    np.testing.assert_allclose(model.predict_many(X[:20], windows=windows[:20])['delay_minutes'], expected, rtol=1e-5)
@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from utils.thread_budget import serving_threads
+
+logger = logging.getLogger(__name__)
+
+# Remaining time budget the caller grants a request, in milliseconds
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+FULL = 'full'
+DEGRADED = 'degraded'
+REJECTED = 'rejected'
+
+# Time kept back from a deadline so a degraded answer still arrives in time
+DEGRADE_RESERVE_MS = 50
+
+# Weight of the latest request in the running service-time estimate
+_SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionController:
+    """Bounds concurrent and queued model calls; overflow is served by the cheap model"""
+
+    def __init__(self, max_in_flight=None, max_queue=None, default_deadline_ms=None):
+        self.max_in_flight = int(max_in_flight or os.getenv('ML_MAX_IN_FLIGHT', serving_threads()))
+        self.max_queue = int(max_queue if max_queue is not None else os.getenv('ML_MAX_QUEUE', 4 * self.max_in_flight))
+        self.default_deadline_ms = float(default_deadline_ms or os.getenv('ML_DEFAULT_DEADLINE_MS', 10000))
+        self.in_flight = 0
+        self.waiting = 0
+        self.service_ms = 20.0
+        self.counters = {FULL: 0, DEGRADED: 0, REJECTED: 0, 'queued': 0}
+        self._cond = threading.Condition()
+
+    def deadline_from(self, headers):
+        """Absolute monotonic deadline from the caller's remaining budget header"""
+        try:
+            budget_ms = float(headers.get(DEADLINE_HEADER, self.default_deadline_ms))
+        except (TypeError, ValueError):
+            budget_ms = self.default_deadline_ms
+        return time.monotonic() + budget_ms / 1000
+
+    def acquire(self, deadline):
+        """Decide how a request is served: a model slot, the cheap model, or not at all"""
+        with self._cond:
+            remaining_ms = (deadline - time.monotonic()) * 1000
+            if remaining_ms <= 0:
+                self.counters[REJECTED] += 1
+                return REJECTED
+
+            if self.in_flight < self.max_in_flight and remaining_ms > self.service_ms:
+                self.in_flight += 1
+                self.counters[FULL] += 1
+                return FULL
+
+            # Queued requests drain max_in_flight at a time; only wait if the
+            # full model is likely to finish before the caller gives up
+            expected_wait_ms = (self.waiting + 1) * self.service_ms / self.max_in_flight
+            if (self.waiting >= self.max_queue or
+                    expected_wait_ms + self.service_ms > remaining_ms - DEGRADE_RESERVE_MS):
+                self.counters[DEGRADED] += 1
+                return DEGRADED
+
+            self.waiting += 1
+            self.counters['queued'] += 1
+            try:
+                while True:
+                    # Give up on the slot once the model could no longer finish in time
+                    timeout = deadline - time.monotonic() - (self.service_ms + DEGRADE_RESERVE_MS) / 1000
+                    if timeout <= 0:
+                        self.counters[DEGRADED] += 1
+                        # Pass a freed slot on rather than swallowing the wakeup
+                        self._cond.notify()
+                        return DEGRADED
+                    if self.in_flight < self.max_in_flight:
+                        break
+                    self._cond.wait(timeout)
+                self.in_flight += 1
+                self.counters[FULL] += 1
+                return FULL
+            finally:
+                self.waiting -= 1
+
+    def release(self, elapsed_ms):
+        """Free a model slot and fold its service time into the estimate"""
+        with self._cond:
+            self.in_flight -= 1
+            self.service_ms += _SERVICE_TIME_ALPHA * (elapsed_ms - self.service_ms)
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self, deadline):
+        """Hold a model slot for the duration of a request when one is granted"""
+        mode = self.acquire(deadline)
+        started = time.perf_counter()
+        try:
+            yield mode
+        finally:
+            if mode == FULL:
+                self.release((time.perf_counter() - started) * 1000)
+
+    def get_info(self):
+        """Get limits, current load and admission counters"""
+        with self._cond:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'service_ms': round(self.service_ms, 2),
+                'counters': dict(self.counters)
+            }
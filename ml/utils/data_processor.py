@@ -2,11 +2,254 @@ import pandas as pd
 import numpy as np
 import psycopg2
 import os
+import io
+import csv
+import json
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import logging
+from utils.time_codec import parse_seconds_array, delay_minutes
+from utils.geo import haversine_km
 
 logger = logging.getLogger(__name__)
 
+PEAK_HOURS = [7, 8, 9, 17, 18, 19]
+
+# Measured columns stored as float32 after preprocessing
+FLOAT32_COLUMNS = ['latitude', 'longitude', 'speed', 'heading', 'accuracy', 'station_lat', 'station_lon']
+
+# Denormalized training facts owned by the ML service; one row per tracking
+# point whose prediction has a recorded outcome
+TRAINING_FACTS_DDL = """
+    CREATE TABLE IF NOT EXISTS ml_training_facts (
+        tracking_id INTEGER PRIMARY KEY,
+        train_id INTEGER NOT NULL,
+        station_id INTEGER NOT NULL,
+        latitude DECIMAL(10, 8),
+        longitude DECIMAL(11, 8),
+        speed DECIMAL(5, 2),
+        heading DECIMAL(5, 2),
+        estimated_arrival TIME,
+        accuracy DECIMAL(5, 2),
+        timestamp TIMESTAMP NOT NULL,
+        train_type VARCHAR(50),
+        capacity INTEGER,
+        route_id INTEGER,
+        station_lat DECIMAL(10, 8),
+        station_lon DECIMAL(11, 8),
+        prediction_id INTEGER,
+        predicted_time TIME,
+        actual_arrival_time TIME,
+        confidence_score DECIMAL(3, 2),
+        hour SMALLINT,
+        day_of_week SMALLINT,
+        actual_delay_minutes DOUBLE PRECISION,
+        refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    CREATE INDEX IF NOT EXISTS idx_ml_training_facts_timestamp ON ml_training_facts(timestamp);
+    CREATE INDEX IF NOT EXISTS idx_ml_training_facts_train_time ON ml_training_facts(train_id, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_ml_training_facts_refreshed_at ON ml_training_facts(refreshed_at);
+    
+    CREATE TABLE IF NOT EXISTS ml_training_facts_state (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+        last_tracking_id INTEGER NOT NULL DEFAULT 0,
+        last_prediction_update TIMESTAMP NOT NULL DEFAULT '-infinity'
+    );
+    
+    -- Tracking ids up to settled_tracking_id are final; last_tracking_id, seen
+    -- at last_tracking_at, settles once no transaction that predates it can
+    -- still commit
+    ALTER TABLE ml_training_facts_state
+        ADD COLUMN IF NOT EXISTS settled_tracking_id INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS last_tracking_at TIMESTAMP NOT NULL DEFAULT '-infinity';
+    
+    -- Lets the refresh find newly recorded outcomes without scanning predictions
+    CREATE INDEX IF NOT EXISTS idx_predictions_updated_at ON predictions(updated_at);
+"""
+
+# Whether the newest objects of TRAINING_FACTS_DDL exist. Even when there is
+# nothing to create, the DDL takes a share lock on predictions that queues
+# behind open prediction writes, and every later write queues behind it
+TRAINING_FACTS_READY = """
+    SELECT to_regclass('idx_predictions_updated_at') IS NOT NULL
+    AND to_regclass('idx_ml_training_facts_refreshed_at') IS NOT NULL
+    AND EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'ml_training_facts_state' AND column_name = 'last_tracking_at'
+    )
+"""
+
+# Upsert of tracking rows joined with the outcome of their prediction; the
+# join condition is supplied per refresh step so it matches the driving index
+TRAINING_FACTS_UPSERT = """
+    INSERT INTO ml_training_facts (
+        tracking_id, train_id, station_id, latitude, longitude, speed, heading,
+        estimated_arrival, accuracy, timestamp, train_type, capacity, route_id,
+        station_lat, station_lon, prediction_id, predicted_time, actual_arrival_time,
+        confidence_score, hour, day_of_week, actual_delay_minutes
+    )
+    SELECT 
+        td.id,
+        td.train_id,
+        td.station_id,
+        td.latitude,
+        td.longitude,
+        td.speed,
+        td.heading,
+        td.estimated_arrival,
+        td.accuracy,
+        td.timestamp,
+        t.type,
+        t.capacity,
+        t.route_id,
+        s.latitude,
+        s.longitude,
+        p.id,
+        p.predicted_time,
+        p.actual_arrival_time,
+        p.confidence_score,
+        EXTRACT(HOUR FROM td.timestamp),
+        EXTRACT(DOW FROM td.timestamp),
+        EXTRACT(EPOCH FROM (p.actual_arrival_time - p.predicted_time))/60
+    FROM tracking_data td
+    JOIN trains t ON td.train_id = t.id
+    JOIN stations s ON td.station_id = s.id
+    JOIN predictions p ON td.train_id = p.train_id 
+        AND td.station_id = p.station_id 
+        AND {join_condition}
+    WHERE p.actual_arrival_time IS NOT NULL
+    AND {where}
+    ON CONFLICT (tracking_id) DO UPDATE SET
+        prediction_id = EXCLUDED.prediction_id,
+        predicted_time = EXCLUDED.predicted_time,
+        actual_arrival_time = EXCLUDED.actual_arrival_time,
+        confidence_score = EXCLUDED.confidence_score,
+        actual_delay_minutes = EXCLUDED.actual_delay_minutes,
+        refreshed_at = NOW()
+    -- Re-scanned rows whose outcome is unchanged are left alone
+    WHERE (
+        ml_training_facts.prediction_id, ml_training_facts.predicted_time,
+        ml_training_facts.actual_arrival_time, ml_training_facts.confidence_score
+    ) IS DISTINCT FROM (
+        EXCLUDED.prediction_id, EXCLUDED.predicted_time,
+        EXCLUDED.actual_arrival_time, EXCLUDED.confidence_score
+    )
+"""
+
+# Training rows read from the facts table
+TRAINING_SELECT = """
+    SELECT 
+        td.tracking_id,
+        td.train_id,
+        td.station_id,
+        td.latitude,
+        td.longitude,
+        td.speed,
+        td.heading,
+        td.estimated_arrival,
+        td.accuracy,
+        td.timestamp,
+        td.train_type,
+        td.capacity,
+        td.route_id,
+        td.station_lat,
+        td.station_lon,
+        td.predicted_time,
+        td.actual_arrival_time,
+        td.confidence_score,
+        td.hour,
+        td.day_of_week,
+        td.actual_delay_minutes,
+        td.refreshed_at
+    FROM ml_training_facts td
+"""
+
+# Incremental training load: rows that arrived or had their outcome changed
+# since the watermarks, within the window. Placeholders are filled per driver
+# style, $n for prepared statements and %(name)s for COPY
+TRAINING_CHANGED_WHERE = """
+    WHERE td.timestamp > GREATEST({since}, LOCALTIMESTAMP - {days_back} * INTERVAL '1 day')
+    OR (td.refreshed_at > {outcomes_since} AND td.timestamp > LOCALTIMESTAMP - {days_back} * INTERVAL '1 day')
+"""
+
+# Staging table for bulk prediction write-back. Unlogged because every row is
+# merged into predictions and deleted in the same transaction that copied it;
+# the batch id keeps concurrent writers apart
+PREDICTIONS_STAGING_DDL = """
+    CREATE UNLOGGED TABLE IF NOT EXISTS ml_predictions_staging (
+        batch_id UUID NOT NULL,
+        seq INTEGER NOT NULL,
+        train_id INTEGER NOT NULL,
+        station_id INTEGER NOT NULL,
+        predicted_time TIME NOT NULL,
+        confidence_score DECIMAL(3, 2),
+        delay_minutes INTEGER,
+        prediction_method VARCHAR(50),
+        factors JSONB
+    );
+    
+    CREATE INDEX IF NOT EXISTS idx_ml_predictions_staging_batch ON ml_predictions_staging(batch_id);
+"""
+
+# Set-based merge of one staged batch; the last row wins for a repeated
+# train and station, as a later single-row upsert would. Rows with a recorded
+# arrival are settled outcomes that training learns from and are left alone
+PREDICTIONS_MERGE = """
+    INSERT INTO predictions (
+        train_id, station_id, predicted_time, confidence_score,
+        delay_minutes, prediction_method, factors, created_at
+    )
+    SELECT DISTINCT ON (train_id, station_id)
+        train_id, station_id, predicted_time, confidence_score,
+        delay_minutes, prediction_method, factors, NOW()
+    FROM ml_predictions_staging
+    WHERE batch_id = %(batch_id)s
+    ORDER BY train_id, station_id, seq DESC
+    ON CONFLICT (train_id, station_id, DATE(created_at))
+    DO UPDATE SET
+        predicted_time = EXCLUDED.predicted_time,
+        confidence_score = EXCLUDED.confidence_score,
+        delay_minutes = EXCLUDED.delay_minutes,
+        prediction_method = EXCLUDED.prediction_method,
+        factors = EXCLUDED.factors,
+        updated_at = NOW()
+    WHERE predictions.actual_arrival_time IS NULL
+"""
+
+PREDICTIONS_STAGING_COLUMNS = (
+    'batch_id', 'seq', 'train_id', 'station_id', 'predicted_time', 'confidence_score',
+    'delay_minutes', 'prediction_method', 'factors'
+)
+
+# Column types for parsing COPY output straight into typed arrays
+TRAINING_DTYPES = {
+    'tracking_id': np.int64,
+    'train_id': np.int32,
+    'station_id': np.int32,
+    'latitude': np.float32,
+    'longitude': np.float32,
+    'speed': np.float32,
+    'heading': np.float32,
+    'estimated_arrival': str,
+    'accuracy': np.float32,
+    'train_type': 'category',
+    'capacity': np.float32,
+    'route_id': np.float32,
+    'station_lat': np.float32,
+    'station_lon': np.float32,
+    'predicted_time': str,
+    'actual_arrival_time': str,
+    'confidence_score': np.float32,
+    'hour': np.float32,
+    'day_of_week': np.float32,
+    'actual_delay_minutes': np.float64
+}
+
+TRAINING_DATE_COLUMNS = ['timestamp', 'refreshed_at']
+
 class DataProcessor:
     def __init__(self):
         self.db_config = {
@@ -16,6 +259,20 @@ class DataProcessor:
             'user': os.getenv('DB_USER', 'postgres'),
             'password': os.getenv('DB_PASSWORD', 'password')
         }
+        self.load_method = os.getenv('ML_TRAINING_LOAD_METHOD', 'query')
+        self.copy_parallelism = int(os.getenv('ML_COPY_PARALLELISM', 4))
+        self.prediction_write_batch = int(os.getenv('ML_PREDICTION_WRITE_BATCH', 5000))
+        self._staging_ready = False
+        
+        # Incremental training loads: rows newer than the watermark are appended
+        self.watermark_lag = timedelta(minutes=int(os.getenv('ML_WATERMARK_LAG_MINUTES', 60)))
+        self._training_frame = None
+        self._training_watermark = None
+        self._outcome_watermark = None
+        self._training_days_back = None
+        
+        # Prepared statements live on a connection, so each thread keeps its own
+        self._local = threading.local()
 
     def get_connection(self):
         """Get database connection"""
@@ -25,59 +282,361 @@ class DataProcessor:
             logger.error(f"Database connection error: {e}")
             raise e
 
+    def get_prepared_connection(self):
+        """Get this thread's long-lived connection for prepared statements"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn.closed:
+            conn = self.get_connection()
+            conn.autocommit = True
+            self._local.conn = conn
+            self._local.prepared = set()
+        return conn
+
+    def execute_prepared(self, name, sql, params):
+        """Execute a server-side prepared statement, preparing it on first use"""
+        conn = self.get_prepared_connection()
+        try:
+            with conn.cursor() as cursor:
+                if name not in self._local.prepared:
+                    cursor.execute(f"PREPARE {name} AS {sql}")
+                    self._local.prepared.add(name)
+                
+                placeholders = ', '.join(['%s'] * len(params))
+                cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+                columns = [column[0] for column in cursor.description]
+                return pd.DataFrame.from_records(cursor.fetchall(), columns=columns, coerce_float=True)
+        except psycopg2.Error:
+            # Drop the broken connection; the next call reconnects and re-prepares
+            conn.close()
+            raise
+
+    def reset_training_watermark(self):
+        """Forget incrementally loaded training data"""
+        self._training_frame = None
+        self._training_watermark = None
+        self._outcome_watermark = None
+        self._training_days_back = None
+
     def load_training_data(self, days_back=90):
         """Load training data from database"""
         try:
-            conn = self.get_connection()
+            if days_back != self._training_days_back:
+                self.reset_training_watermark()
+            
+            # Re-read a short overlap so rows and outcomes committed late are picked up
+            since = self._training_watermark - self.watermark_lag if self._training_watermark else datetime.min
+            outcomes_since = self._outcome_watermark - self.watermark_lag if self._outcome_watermark else datetime.min
+            
+            if self.load_method == 'copy' and self._training_frame is None:
+                end = self.get_database_time()
+                new_rows = self.copy_training_data(end - timedelta(days=days_back), end, self.copy_parallelism)
+            elif self.load_method == 'copy':
+                new_rows = self._copy_training_rows(TRAINING_CHANGED_WHERE.format(
+                    since='%(since)s', outcomes_since='%(outcomes_since)s', days_back='%(days_back)s::float8'
+                ), {'since': since, 'outcomes_since': outcomes_since, 'days_back': days_back})
+                new_rows.sort_values('timestamp', ascending=False, inplace=True, ignore_index=True)
+            else:
+                new_rows = self.execute_prepared('ml_training_rows', TRAINING_SELECT + TRAINING_CHANGED_WHERE.format(
+                    since='$1::timestamp', outcomes_since='$2::timestamp', days_back='$3::float8'
+                ) + """
+                ORDER BY td.timestamp DESC
+                """, (since, outcomes_since, days_back))
+            
+            if self._training_frame is None:
+                df = new_rows
+            elif new_rows.empty:
+                df = self._training_frame
+            else:
+                # Re-read rows replace their kept copies, carrying any changed outcome
+                df = pd.concat([new_rows, self._training_frame], ignore_index=True)
+                df.drop_duplicates('tracking_id', keep='first', inplace=True, ignore_index=True)
+                
+                # Drop rows that have aged out of the window
+                cutoff = df['timestamp'].max() - timedelta(days=days_back)
+                df = df[df['timestamp'] > cutoff].reset_index(drop=True)
+            
+            if not df.empty:
+                self._training_watermark = df['timestamp'].max()
+                self._outcome_watermark = df['refreshed_at'].max()
+            self._training_frame = df
+            self._training_days_back = days_back
+            
+            method = 'COPY' if self.load_method == 'copy' else 'query'
+            logger.info(f"Loaded {len(new_rows)} new or updated training records via {method}, {len(df)} in window")
+            
+            # Callers preprocess in place, so hand out a copy of the kept dataset
+            return df.copy()
             
-            query = """
-            SELECT 
-                td.train_id,
-                td.station_id,
-                td.latitude,
-                td.longitude,
-                td.speed,
-                td.heading,
-                td.estimated_arrival,
-                td.accuracy,
-                td.timestamp,
-                t.type as train_type,
-                t.capacity,
-                s.latitude as station_lat,
-                s.longitude as station_lon,
-                p.predicted_time,
-                p.actual_arrival_time,
-                p.confidence_score,
-                EXTRACT(HOUR FROM td.timestamp) as hour,
-                EXTRACT(DOW FROM td.timestamp) as day_of_week,
-                EXTRACT(EPOCH FROM (p.actual_arrival_time - p.predicted_time))/60 as actual_delay_minutes
-            FROM tracking_data td
-            JOIN trains t ON td.train_id = t.id
-            JOIN stations s ON td.station_id = s.id
-            LEFT JOIN predictions p ON td.train_id = p.train_id 
-                AND td.station_id = p.station_id 
-                AND DATE(td.timestamp) = DATE(p.created_at)
-            WHERE td.timestamp > NOW() - INTERVAL '%s days'
-            AND p.actual_arrival_time IS NOT NULL
-            ORDER BY td.timestamp DESC
-            """ % days_back
+        except Exception as e:
+            logger.error(f"Error loading training data: {e}")
+            return pd.DataFrame()
+
+    def refresh_training_facts(self, rebuild=False):
+        """Create the training facts table if needed and fold in rows added since the last refresh"""
+        conn = self.get_connection()
+        try:
+            with conn, conn.cursor() as cursor:
+                cursor.execute(TRAINING_FACTS_READY)
+                if not cursor.fetchone()[0]:
+                    cursor.execute(TRAINING_FACTS_DDL)
+                
+                if rebuild:
+                    cursor.execute("TRUNCATE ml_training_facts")
+                    cursor.execute("DELETE FROM ml_training_facts_state")
+                
+                # Lock the state row so concurrent refreshes run one after another
+                cursor.execute("INSERT INTO ml_training_facts_state (id) VALUES (TRUE) ON CONFLICT DO NOTHING")
+                cursor.execute("""
+                SELECT settled_tracking_id, last_tracking_id, last_tracking_at, last_prediction_update
+                FROM ml_training_facts_state WHERE id FOR UPDATE
+                """)
+                settled_tracking_id, last_tracking_id, last_tracking_at, last_prediction_update = cursor.fetchone()
+                
+                cursor.execute("SELECT COALESCE(MAX(id), 0), LOCALTIMESTAMP FROM tracking_data")
+                max_tracking_id, refreshed_at = cursor.fetchone()
+                
+                # Ids and update times are assigned before their transaction commits, so
+                # rows this snapshot cannot see may still land below the high-water
+                # marks. Ids seen one lag ago are settled; everything above them, and
+                # outcomes from the last lag, are scanned again. The upserts are
+                # idempotent, so the overlap costs a re-read and no writes.
+                matured = last_tracking_at <= refreshed_at - self.watermark_lag
+                if matured:
+                    settled_tracking_id = last_tracking_id
+                    last_tracking_id, last_tracking_at = max_tracking_id, refreshed_at
+                
+                # New tracking rows, driven by the primary key and matched to the
+                # predictions unique index on (train_id, station_id, DATE(created_at))
+                cursor.execute(TRAINING_FACTS_UPSERT.format(
+                    join_condition="DATE(p.created_at) = td.timestamp::date",
+                    where="td.id > %(settled_id)s AND td.id <= %(max_id)s"
+                ), {'settled_id': settled_tracking_id, 'max_id': max_tracking_id})
+                new_rows = cursor.rowcount
+                
+                # Outcomes recorded since the last refresh for settled rows, driven
+                # by predictions.updated_at and ranging over idx_tracking_train_time
+                cursor.execute(TRAINING_FACTS_UPSERT.format(
+                    join_condition=(
+                        "td.timestamp >= date_trunc('day', p.created_at) "
+                        "AND td.timestamp < date_trunc('day', p.created_at) + INTERVAL '1 day'"
+                    ),
+                    where=(
+                        "p.updated_at > %(last_update)s - %(lag)s AND p.updated_at <= %(refreshed_at)s "
+                        "AND td.id <= %(settled_id)s"
+                    )
+                ), {
+                    'last_update': last_prediction_update,
+                    'lag': self.watermark_lag,
+                    'refreshed_at': refreshed_at,
+                    'settled_id': settled_tracking_id
+                })
+                updated_rows = cursor.rowcount
+                
+                cursor.execute("""
+                UPDATE ml_training_facts_state
+                SET settled_tracking_id = %s, last_tracking_id = %s, last_tracking_at = %s,
+                    last_prediction_update = %s
+                WHERE id
+                """, (settled_tracking_id, last_tracking_id, last_tracking_at, refreshed_at))
+            
+            logger.info(f"Training facts refreshed: {new_rows} new rows, {updated_rows} updated outcomes")
+            return {
+                'new_rows': new_rows,
+                'updated_rows': updated_rows,
+                'last_tracking_id': max_tracking_id,
+                'settled_tracking_id': settled_tracking_id,
+                'refreshed_at': refreshed_at.isoformat()
+            }
+        finally:
+            conn.close()
+
+    def get_database_time(self):
+        """Get the database's current local timestamp"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT LOCALTIMESTAMP")
+            return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+    def copy_training_data(self, start, end, parallel_ranges=1):
+        """Bulk-load training rows in [start, end) through COPY, optionally over parallel connections"""
+        bounds = pd.date_range(start, end, periods=parallel_ranges + 1).to_pydatetime()
+        ranges = list(zip(bounds[:-1], bounds[1:]))
+        
+        if len(ranges) == 1:
+            frames = [self._copy_training_range(*ranges[0])]
+        else:
+            # Each range gets its own connection; the driver releases the GIL while waiting
+            with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                frames = list(pool.map(lambda r: self._copy_training_range(*r), ranges))
+        
+        df = pd.concat(frames, ignore_index=True)
+        df.sort_values('timestamp', ascending=False, inplace=True, ignore_index=True)
+        return df
+
+    def _copy_training_range(self, start, end):
+        """Stream one time range of training rows as CSV into typed columns"""
+        return self._copy_training_rows("""
+            WHERE td.timestamp >= %(start)s AND td.timestamp < %(end)s
+        """, {'start': start, 'end': end})
+
+    def _copy_training_rows(self, where, params):
+        """Stream the training rows matching a WHERE clause as CSV into typed columns"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
             
-            df = pd.read_sql_query(query, conn)
+            # COPY takes no bind parameters, so let the driver quote them
+            query = cursor.mogrify(TRAINING_SELECT + where, params).decode('utf-8')
+            
+            # COPY writes into a pipe on a helper thread while read_csv parses the
+            # other end, so only the pipe buffer is ever held as raw CSV
+            read_fd, write_fd = os.pipe()
+            reader = os.fdopen(read_fd, 'rb')
+            writer = os.fdopen(write_fd, 'wb')
+
+            def produce():
+                try:
+                    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", writer)
+                finally:
+                    writer.close()
+
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                copying = pool.submit(produce)
+                try:
+                    df = pd.read_csv(reader, dtype=TRAINING_DTYPES, parse_dates=TRAINING_DATE_COLUMNS)
+                except Exception:
+                    # Closing the read end also stops a COPY whose output is no longer wanted
+                    reader.close()
+                    # An empty or cut-off stream is explained by the COPY's own error
+                    copy_error = copying.exception()
+                    if copy_error is not None and not isinstance(copy_error, BrokenPipeError):
+                        raise copy_error
+                    raise
+                reader.close()
+                # A COPY that failed part-way can still leave a frame that parses
+                copying.result()
+
+            return df
+        finally:
+            conn.close()
+
+    def save_predictions_bulk(self, predictions, batch_size=None):
+        """Persist predictions in batches: COPY into the staging table, then one upsert per batch"""
+        batch_size = batch_size or self.prediction_write_batch
+        predictions = list(predictions)
+        if not predictions:
+            return 0
+        
+        conn = self.get_connection()
+        try:
+            if not self._staging_ready:
+                with conn, conn.cursor() as cursor:
+                    cursor.execute(PREDICTIONS_STAGING_DDL)
+                self._staging_ready = True
+            
+            written = 0
+            skipped = 0
+            for start in range(0, len(predictions), batch_size):
+                batch = predictions[start:start + batch_size]
+                batch_id = str(uuid.uuid4())
+                
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, lineterminator='\n')
+                for seq, prediction in enumerate(batch):
+                    writer.writerow((
+                        batch_id,
+                        seq,
+                        prediction['train_id'],
+                        prediction['station_id'],
+                        prediction['predicted_time'],
+                        prediction.get('confidence_score'),
+                        prediction.get('delay_minutes'),
+                        prediction.get('prediction_method'),
+                        json.dumps(prediction.get('factors', []))
+                    ))
+                buffer.seek(0)
+                
+                # Copy, merge and clear the batch atomically
+                with conn, conn.cursor() as cursor:
+                    cursor.copy_expert(
+                        f"COPY ml_predictions_staging ({', '.join(PREDICTIONS_STAGING_COLUMNS)}) "
+                        "FROM STDIN WITH (FORMAT csv)",
+                        buffer
+                    )
+                    cursor.execute(PREDICTIONS_MERGE, {'batch_id': batch_id})
+                    written += cursor.rowcount
+                    # Each distinct train and station is inserted or updated unless already settled
+                    skipped += len({(p['train_id'], p['station_id']) for p in batch}) - cursor.rowcount
+                    cursor.execute("DELETE FROM ml_predictions_staging WHERE batch_id = %s", (batch_id,))
+            
+            logger.info(
+                f"Saved {written} predictions in {-(-len(predictions) // batch_size)} batches, "
+                f"skipped {skipped} with a recorded arrival"
+            )
+            return written
+        finally:
             conn.close()
+
+    def load_training_partition_sources(self, start_day, end_day):
+        """Row count and latest refresh of each day of training facts in [start_day, end_day]"""
+        try:
+            df = self.execute_prepared('ml_training_partition_sources', """
+            SELECT timestamp::date AS day, MAX(refreshed_at) AS refreshed_at, COUNT(*) AS rows
+            FROM ml_training_facts
+            WHERE timestamp >= $1::timestamp AND timestamp < $2::timestamp
+            GROUP BY 1
+            """, (datetime.combine(start_day, datetime.min.time()),
+                  datetime.combine(end_day + timedelta(days=1), datetime.min.time())))
+            
+            return {
+                row['day']: {'refreshed_at': row['refreshed_at'].isoformat(), 'rows': int(row['rows'])}
+                for row in df.to_dict('records')
+            }
+            
+        except Exception as e:
+            logger.error(f"Error loading training partition sources: {e}")
+            raise e
+
+    def load_training_partition(self, day):
+        """Load one calendar day of training data"""
+        try:
+            start = datetime.combine(day, datetime.min.time())
+            if self.load_method == 'copy':
+                return self.copy_training_data(start, start + timedelta(days=1))
+            
+            df = self.execute_prepared('ml_training_partition', TRAINING_SELECT + """
+            WHERE td.timestamp >= $1::timestamp AND td.timestamp < $2::timestamp
+            ORDER BY td.timestamp
+            """, (start, start + timedelta(days=1)))
             
-            logger.info(f"Loaded {len(df)} training records from database")
             return df
             
         except Exception as e:
-            logger.error(f"Error loading training data: {e}")
-            return pd.DataFrame()
+            logger.error(f"Error loading training partition {day}: {e}")
+            raise e
+
+    def load_tracking_points(self, start, end):
+        """Load every tracking point in [start, end] as the live stream carried it"""
+        try:
+            return self.execute_prepared('ml_tracking_points', """
+            SELECT train_id, timestamp, speed, latitude, longitude
+            FROM tracking_data
+            WHERE timestamp >= $1::timestamp AND timestamp <= $2::timestamp
+            AND latitude IS NOT NULL AND longitude IS NOT NULL
+            ORDER BY train_id, timestamp
+            """, (start, end))
+            
+        except Exception as e:
+            logger.error(f"Error loading tracking points: {e}")
+            raise e
 
     def load_real_time_data(self, train_id, hours_back=2):
         """Load recent tracking data for a specific train"""
         try:
-            conn = self.get_connection()
-            
-            query = """
+            df = self.execute_prepared('ml_real_time_rows', """
             SELECT 
                 td.*,
                 t.type as train_type,
@@ -88,13 +647,10 @@ class DataProcessor:
             FROM tracking_data td
             JOIN trains t ON td.train_id = t.id
             LEFT JOIN stations s ON td.station_id = s.id
-            WHERE td.train_id = %s 
-            AND td.timestamp > NOW() - INTERVAL '%s hours'
+            WHERE td.train_id = $1::integer 
+            AND td.timestamp > LOCALTIMESTAMP - $2::float8 * INTERVAL '1 hour'
             ORDER BY td.timestamp DESC
-            """ % (train_id, hours_back)
-            
-            df = pd.read_sql_query(query, conn)
-            conn.close()
+            """, (train_id, hours_back))
             
             return df
             
@@ -102,44 +658,108 @@ class DataProcessor:
             logger.error(f"Error loading real-time data: {e}")
             return pd.DataFrame()
 
+    def load_real_time_data_bulk(self, train_ids, hours_back=2, max_rows=50):
+        """Load recent tracking data for many trains in one query
+        
+        Returns the rows grouped by train (newest first within a train, at most
+        max_rows each), the train id of every group and group offsets, so group
+        i is df.iloc[offsets[i]:offsets[i + 1]].
+        """
+        empty = (pd.DataFrame(), np.array([], dtype=np.int64), np.zeros(1, dtype=np.int64))
+        train_ids = sorted({int(train_id) for train_id in train_ids})
+        if not train_ids:
+            return empty
+        
+        try:
+            df = self.execute_prepared('ml_real_time_rows_bulk', """
+            SELECT * FROM (
+                SELECT 
+                    td.*,
+                    t.type as train_type,
+                    t.capacity,
+                    s.name as station_name,
+                    s.latitude as station_lat,
+                    s.longitude as station_lon,
+                    ROW_NUMBER() OVER (PARTITION BY td.train_id ORDER BY td.timestamp DESC) as row_rank
+                FROM tracking_data td
+                JOIN trains t ON td.train_id = t.id
+                LEFT JOIN stations s ON td.station_id = s.id
+                WHERE td.train_id = ANY($1::integer[])
+                AND td.timestamp > LOCALTIMESTAMP - $2::float8 * INTERVAL '1 hour'
+            ) recent
+            WHERE row_rank <= $3::integer
+            ORDER BY train_id, timestamp DESC
+            """, (train_ids, hours_back, max_rows))
+            if df.empty:
+                return empty
+            
+            df.drop(columns='row_rank', inplace=True)
+            
+            # Rows arrive sorted by train, so groups start wherever the id changes
+            ids = df['train_id'].to_numpy()
+            starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+            offsets = np.append(starts, len(df)).astype(np.int64)
+            
+            return df, ids[starts].astype(np.int64), offsets
+            
+        except Exception as e:
+            logger.error(f"Error loading bulk real-time data: {e}")
+            return empty
+
     def preprocess_data(self, df):
-        """Preprocess data for ML model"""
+        """Preprocess data for ML model, modifying the frame in place"""
         try:
             if df.empty:
                 return df
             
-            # Handle missing values
-            df = df.fillna({
+            # Handle missing values without copying the frame
+            fill_values = {
                 'speed': df['speed'].median() if 'speed' in df else 45,
                 'accuracy': df['accuracy'].median() if 'accuracy' in df else 10,
                 'weather_temp': 28,
                 'weather_humidity': 75,
                 'weather_rainfall': 0
-            })
+            }
+            df.fillna({k: v for k, v in fill_values.items() if k in df.columns}, inplace=True)
+            
+            # Downcast measurements; float32 is far finer than GPS accuracy
+            for column in FLOAT32_COLUMNS:
+                if column in df.columns:
+                    df[column] = df[column].astype(np.float32)
+            
+            # Time-based features, derived once from the timestamp when present
+            if 'timestamp' in df.columns:
+                timestamps = pd.to_datetime(df['timestamp'])
+                df['timestamp'] = timestamps
+                df['hour'] = timestamps.dt.hour.astype(np.int8)
+                df['day_of_week'] = timestamps.dt.dayofweek.astype(np.int8)
+                df['month'] = timestamps.dt.month.astype(np.int8)
+            
+            # Recompute the target from the TIME columns so arrivals after
+            # midnight are not read as a day early
+            if 'predicted_time' in df.columns and 'actual_arrival_time' in df.columns:
+                predicted = parse_seconds_array(df['predicted_time'].to_numpy())
+                actual = parse_seconds_array(df['actual_arrival_time'].to_numpy())
+                known = (predicted >= 0) & (actual >= 0)
+                df.loc[known, 'actual_delay_minutes'] = delay_minutes(predicted[known] / 60, actual[known] / 60)
             
             # Create derived features
-            df['is_weekend'] = (df['day_of_week'] >= 5).astype(int)
-            df['is_peak_hour'] = df['hour'].apply(lambda x: int(x in [7, 8, 9, 17, 18, 19]))
+            df['is_weekend'] = (df['day_of_week'] >= 5).astype(np.int8)
+            df['is_peak_hour'] = df['hour'].isin(PEAK_HOURS).astype(np.int8)
             
             # Train type encoding
-            df['train_type_express'] = (df['train_type'] == 'express').astype(int)
-            df['train_type_intercity'] = (df['train_type'] == 'intercity').astype(int)
+            if 'train_type' in df.columns:
+                df['train_type_express'] = (df['train_type'] == 'express').astype(np.int8)
+                df['train_type_intercity'] = (df['train_type'] == 'intercity').astype(np.int8)
             
             # Calculate distance features
             if 'latitude' in df.columns and 'station_lat' in df.columns:
                 df['distance_to_station'] = self.calculate_distance(
-                    df['latitude'], df['longitude'],
-                    df['station_lat'], df['station_lon']
-                )
+                    df['latitude'].to_numpy(), df['longitude'].to_numpy(),
+                    df['station_lat'].to_numpy(), df['station_lon'].to_numpy()
+                ).astype(np.float32)
             else:
-                df['distance_to_station'] = 10  # Default distance
-            
-            # Time-based features
-            if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                df['hour'] = df['timestamp'].dt.hour
-                df['day_of_week'] = df['timestamp'].dt.dayofweek
-                df['month'] = df['timestamp'].dt.month
+                df['distance_to_station'] = np.float32(10)  # Default distance
             
             # Remove outliers
             df = self.remove_outliers(df)
@@ -151,22 +771,56 @@ class DataProcessor:
             logger.error(f"Data preprocessing error: {e}")
             return df
 
-    def calculate_distance(self, lat1, lon1, lat2, lon2):
-        """Calculate distance between two points using Haversine formula"""
+    def load_active_stops(self):
+        """Load every stop of every active train's route, in stop order, flagging stops arrived at today"""
         try:
-            # Convert to radians
-            lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+            conn = self.get_connection()
+            df = pd.read_sql_query("""
+            SELECT 
+                t.id as train_id,
+                t.type as train_type,
+                t.route_id,
+                rs.station_id,
+                rs.order_index,
+                -- As text, since the driver turns the end-of-day 24:00:00 into 00:00
+                COALESCE(rs.arrival_time, rs.departure_time)::text as scheduled_time,
+                rs.arrival_time::text as arrival_time,
+                rs.departure_time::text as departure_time,
+                p.actual_arrival_time IS NOT NULL as arrived
+            FROM trains t
+            JOIN route_stations rs ON rs.route_id = t.route_id
+            LEFT JOIN predictions p
+                ON p.train_id = t.id AND p.station_id = rs.station_id AND DATE(p.created_at) = CURRENT_DATE
+            WHERE t.status IN ('running', 'delayed', 'scheduled')
+            ORDER BY t.id, rs.order_index
+            """, conn)
+            conn.close()
             
-            # Haversine formula
-            dlat = lat2 - lat1
-            dlon = lon2 - lon1
-            a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
-            c = 2 * np.arcsin(np.sqrt(a))
+            return df
             
-            # Earth's radius in kilometers
-            r = 6371
+        except Exception as e:
+            logger.error(f"Error loading active stops: {e}")
+            return pd.DataFrame()
+
+    def load_station_coordinates(self):
+        """Load station locations keyed by station id"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, latitude, longitude FROM stations")
+            rows = cursor.fetchall()
+            conn.close()
             
-            return c * r
+            return {row[0]: (row[1], row[2]) for row in rows}
+            
+        except Exception as e:
+            logger.error(f"Error loading station coordinates: {e}")
+            return {}
+
+    def calculate_distance(self, lat1, lon1, lat2, lon2):
+        """Calculate distance between two points using Haversine formula"""
+        try:
+            return haversine_km(lat1, lon1, lat2, lon2)
             
         except Exception as e:
             logger.error(f"Distance calculation error: {e}")
@@ -178,20 +832,23 @@ class DataProcessor:
             if columns is None:
                 columns = ['speed', 'actual_delay_minutes', 'distance_to_station']
             
-            for column in columns:
-                if column in df.columns:
-                    Q1 = df[column].quantile(0.25)
-                    Q3 = df[column].quantile(0.75)
-                    IQR = Q3 - Q1
-                    
-                    # Define outlier bounds
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
-                    
-                    # Remove outliers
-                    df = df[(df[column] >= lower_bound) & (df[column] <= upper_bound)]
+            columns = [column for column in columns if column in df.columns]
+            if not columns:
+                return df
             
-            return df
+            # All bounds from one quantile call over the original rows
+            values = df[columns]
+            quartiles = values.quantile([0.25, 0.75])
+            q1, q3 = quartiles.iloc[0], quartiles.iloc[1]
+            iqr = q3 - q1
+            
+            # Define outlier bounds
+            lower_bound = q1 - 1.5 * iqr
+            upper_bound = q3 + 1.5 * iqr
+            
+            # Remove outliers with a single combined mask and one filtered copy
+            mask = ((values >= lower_bound) & (values <= upper_bound)).all(axis=1)
+            return df if mask.all() else df[mask.to_numpy()]
             
         except Exception as e:
             logger.error(f"Outlier removal error: {e}")
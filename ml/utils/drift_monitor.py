@@ -0,0 +1,183 @@
+import threading
+import logging
+from datetime import datetime
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DRIFT_BINS = 10
+
+# Conventional population stability index thresholds
+PSI_WARNING = 0.1
+PSI_DRIFT = 0.25
+
+# Live traffic needed before drift scores mean anything
+MIN_LIVE_SAMPLES = 200
+
+_EPSILON = 1e-4
+
+
+def build_reference(X, feature_names, n_bins=DRIFT_BINS):
+    """Training-time snapshot: decile bin edges, bin counts, moments and nulls per feature"""
+    X = np.asarray(X, dtype=float)
+    null_mask = ~np.isfinite(X)
+
+    edges = np.full((X.shape[1], n_bins - 1), np.inf)
+    counts = np.zeros((X.shape[1], n_bins), dtype=np.int64)
+    means = np.zeros(X.shape[1])
+    stds = np.zeros(X.shape[1])
+
+    for j in range(X.shape[1]):
+        column = X[~null_mask[:, j], j]
+        if not len(column):
+            continue
+        # Quantile edges give equally filled training bins; binary and
+        # low-cardinality features collapse to fewer bins, padded with +inf
+        inner = np.unique(np.quantile(column, np.linspace(0, 1, n_bins + 1)[1:-1]))
+        edges[j, :len(inner)] = inner
+        counts[j] = np.bincount(np.searchsorted(inner, column, side='right'), minlength=n_bins)
+        means[j] = column.mean()
+        stds[j] = column.std()
+
+    return {
+        'feature_names': list(feature_names),
+        'samples': int(len(X)),
+        'edges': np.where(np.isinf(edges), None, edges.round(6)).tolist(),
+        'counts': counts.tolist(),
+        'mean': means.round(6).tolist(),
+        'std': stds.round(6).tolist(),
+        'nulls': null_mask.sum(axis=0).tolist(),
+        'built_at': datetime.now().isoformat()
+    }
+
+
+class DriftMonitor:
+    """Streaming per-feature sketches of live inputs compared to a training snapshot"""
+
+    def __init__(self, feature_names):
+        self.feature_names = list(feature_names)
+        self.reference = None
+        self.n_bins = DRIFT_BINS
+        self.edges = np.full((len(self.feature_names), DRIFT_BINS - 1), np.inf)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def set_reference(self, reference):
+        """Use a training snapshot and start live sketches afresh"""
+        if reference and reference.get('feature_names') != self.feature_names:
+            logger.warning("Drift reference was built for different features, ignoring it")
+            reference = None
+
+        with self._lock:
+            self.reference = reference
+            if reference:
+                edges = np.array(reference['edges'], dtype=float)
+                self.edges = np.where(np.isnan(edges), np.inf, edges)
+                self.n_bins = self.edges.shape[1] + 1
+            else:
+                self.edges = np.full((len(self.feature_names), DRIFT_BINS - 1), np.inf)
+                self.n_bins = DRIFT_BINS
+        self.reset()
+
+    def reset(self):
+        """Clear live sketches"""
+        n_features = len(self.feature_names)
+        with self._lock:
+            self.count = np.zeros(n_features, dtype=np.int64)
+            self.mean = np.zeros(n_features)
+            self.m2 = np.zeros(n_features)
+            self.nulls = np.zeros(n_features, dtype=np.int64)
+            self.counts = np.zeros((n_features, self.n_bins), dtype=np.int64)
+            self.since = datetime.now()
+
+    def update(self, features):
+        """Fold one feature dict or a matrix of feature rows into the live sketches"""
+        if isinstance(features, dict):
+            rows = np.array([[
+                np.nan if features.get(name) is None else features[name] for name in self.feature_names
+            ]], dtype=float)
+        else:
+            rows = np.atleast_2d(np.asarray(features, dtype=float))
+
+        valid = np.isfinite(rows)
+        features_index = np.broadcast_to(np.arange(rows.shape[1]), rows.shape)
+
+        with self._lock:
+            # Bin index is the number of edges at or below the value; padding is +inf
+            bins = (rows[:, :, None] >= self.edges[None, :, :]).sum(axis=2)
+            np.add.at(self.counts, (features_index[valid], bins[valid]), 1)
+            self.nulls += (~valid).sum(axis=0)
+
+            # Chan et al. merge of the batch moments into the running ones
+            batch_n = valid.sum(axis=0)
+            safe_n = np.maximum(batch_n, 1)
+            batch_mean = np.where(valid, rows, 0).sum(axis=0) / safe_n
+            batch_m2 = (np.where(valid, rows - batch_mean, 0) ** 2).sum(axis=0)
+            total = self.count + batch_n
+            delta = batch_mean - self.mean
+            self.mean = np.where(batch_n > 0, self.mean + delta * batch_n / np.maximum(total, 1), self.mean)
+            self.m2 = self.m2 + batch_m2 + delta ** 2 * self.count * batch_n / np.maximum(total, 1)
+            self.count = total
+
+    def report(self):
+        """Per-feature drift scores and data-quality counters"""
+        with self._lock:
+            count = self.count.copy()
+            counts = self.counts.copy()
+            nulls = self.nulls.copy()
+            mean = self.mean.copy()
+            variance = np.where(count > 1, self.m2 / np.maximum(count - 1, 1), 0)
+            since = self.since
+            reference = self.reference
+
+        live_samples = int(count.max()) if len(count) else 0
+        result = {
+            'live_samples': live_samples,
+            'since': since.isoformat(),
+            'reference_samples': reference['samples'] if reference else 0,
+            'reference_built_at': reference['built_at'] if reference else None,
+            'enough_samples': live_samples >= MIN_LIVE_SAMPLES,
+            'features': {}
+        }
+        if not reference:
+            result['status'] = 'no_reference'
+            return result
+
+        ref_counts = np.array(reference['counts'], dtype=float)
+        ref_p = ref_counts / np.maximum(ref_counts.sum(axis=1, keepdims=True), 1)
+        live_p = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+        used = (ref_p > 0) | (live_p > 0)
+        ref_q = np.clip(ref_p, _EPSILON, None)
+        live_q = np.clip(live_p, _EPSILON, None)
+        psi = np.where(used, (live_q - ref_q) * np.log(live_q / ref_q), 0).sum(axis=1)
+
+        ref_mean = np.array(reference['mean'])
+        ref_std = np.array(reference['std'])
+        mean_shift = np.abs(mean - ref_mean) / np.where(ref_std > 0, ref_std, 1)
+
+        drifted = []
+        for j, name in enumerate(self.feature_names):
+            status = 'ok'
+            if psi[j] >= PSI_DRIFT:
+                status = 'drift'
+            elif psi[j] >= PSI_WARNING:
+                status = 'warning'
+            if status == 'drift':
+                drifted.append(name)
+
+            result['features'][name] = {
+                'psi': round(float(psi[j]), 4),
+                'status': status if count[j] else 'no_data',
+                'live_mean': round(float(mean[j]), 3),
+                'live_std': round(float(np.sqrt(variance[j])), 3),
+                'reference_mean': round(float(ref_mean[j]), 3),
+                'reference_std': round(float(ref_std[j]), 3),
+                'mean_shift_std': round(float(mean_shift[j]), 3),
+                'null_rate': round(float(nulls[j] / max(count[j] + nulls[j], 1)), 4)
+            }
+
+        result['drifted_features'] = drifted if result['enough_samples'] else []
+        result['max_psi'] = round(float(psi.max()), 4)
+        result['needs_retraining'] = bool(result['enough_samples'] and drifted)
+        result['status'] = 'drift' if result['needs_retraining'] else 'ok'
+        return result
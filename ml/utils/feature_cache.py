@@ -0,0 +1,122 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bump when the way rows are turned into features changes, so cached
+# partitions built by the old code are no longer picked up
+FEATURE_SCHEMA_VERSION = 1
+
+CACHE_ARRAYS = ('X', 'y', 'timestamps', 'route_ids')
+
+
+class FeatureCache:
+    def __init__(self, feature_names, cache_dir=None):
+        self.feature_names = list(feature_names)
+        self.cache_dir = cache_dir or os.getenv(
+            'ML_FEATURE_CACHE_DIR',
+            os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'feature_cache')
+        )
+        self.schema_hash = self.compute_schema_hash()
+        self.schema_dir = os.path.join(self.cache_dir, self.schema_hash)
+
+    def compute_schema_hash(self):
+        """Hash of the feature layout the cached matrices were built with"""
+        schema = json.dumps({
+            'version': FEATURE_SCHEMA_VERSION,
+            'feature_names': self.feature_names
+        }, sort_keys=True)
+        return hashlib.sha1(schema.encode('utf-8')).hexdigest()[:12]
+
+    def partition_dir(self, day):
+        """Directory holding one day of cached features"""
+        return os.path.join(self.schema_dir, day.strftime('%Y-%m-%d'))
+
+    def is_valid(self, day, source):
+        """Check whether a partition exists and was built from the day's current training facts
+
+        source is the day's row count and latest refresh time; outcomes that
+        arrive or change later refresh rows of past days, so any difference
+        means the partition is stale.
+        """
+        manifest_path = os.path.join(self.partition_dir(day), 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return False
+
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        return manifest.get('source') == source
+
+    def invalidate(self, day=None):
+        """Drop one partition, or the whole cache for this schema"""
+        path = self.partition_dir(day) if day else self.schema_dir
+        shutil.rmtree(path, ignore_errors=True)
+
+    def write_partition(self, day, arrays, source=None):
+        """Write one partition atomically as .npy files"""
+        final_dir = self.partition_dir(day)
+        tmp_dir = f"{final_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        for name in CACHE_ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), arrays[name])
+
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump({
+                'rows': int(len(arrays['y'])),
+                'schema_hash': self.schema_hash,
+                'source': source,
+                'built_at': datetime.now().isoformat()
+            }, f, indent=2)
+
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+
+    def read_partition(self, day):
+        """Memory-map one cached partition"""
+        path = self.partition_dir(day)
+        return {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+            for name in CACHE_ARRAYS
+        }
+
+    def load(self, start_day, end_day, build_partition, sources):
+        """Load cached features for [start_day, end_day], rebuilding stale partitions
+
+        sources maps each day to its training facts' row count and latest
+        refresh time; days missing from it have no rows.
+        """
+        partitions = []
+        rebuilt = 0
+        day = start_day
+        while day <= end_day:
+            source = sources.get(day, {'refreshed_at': None, 'rows': 0})
+            if not self.is_valid(day, source):
+                self.write_partition(day, build_partition(day), source)
+                rebuilt += 1
+            partitions.append(self.read_partition(day))
+            day += timedelta(days=1)
+
+        logger.info(f"Feature cache: {len(partitions) - rebuilt} partitions reused, {rebuilt} rebuilt")
+
+        partitions = [p for p in partitions if len(p['y'])]
+        if not partitions:
+            return None
+        if len(partitions) == 1:
+            # A single partition is handed out as its memory map, without copying
+            return partitions[0]
+
+        return {
+            name: np.concatenate([p[name] for p in partitions])
+            for name in CACHE_ARRAYS
+        }
@@ -2,6 +2,8 @@ import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import logging
+from utils.time_codec import parse_minutes, parse_minutes_array, MINUTES_PER_DAY
+from utils.weather_grid import derive_weather
 
 logger = logging.getLogger(__name__)
 
@@ -14,8 +16,12 @@ class FeatureEngineer:
             'train_type_express', 'train_type_intercity', 'historical_avg_delay'
         ]
 
-    def extract_features(self, data):
-        """Extract features from input data for ML model"""
+    def extract_features(self, data, train_state=None, weather=None):
+        """Extract features from input data for ML model
+        
+        weather, sampled from the weather grid, takes the place of the
+        request's weather_data.
+        """
         try:
             features = {}
             
@@ -27,17 +33,24 @@ class FeatureEngineer:
             features['is_peak_hour'] = int(time_features.get('is_peak_hour', False))
             
             # Weather features
-            weather_data = data.get('weather_data', {})
+            weather_data = weather or data.get('weather_data') or {}
             features['weather_temp'] = weather_data.get('temperature', 28)
             features['weather_humidity'] = weather_data.get('humidity', 75)
             features['weather_rainfall'] = weather_data.get('rainfall', 0)
             
-            # Location and movement features
-            current_location = data.get('current_location', {})
-            features['current_speed'] = current_location.get('speed', 45)
-            features['distance_to_station'] = self.calculate_distance_to_station(
-                current_location, data.get('station_id')
-            )
+            # Location and movement features, preferring the streamed train state
+            current_location = data.get('current_location') or {}
+            if train_state and train_state.get('speed') is not None:
+                features['current_speed'] = train_state['speed']
+            else:
+                features['current_speed'] = current_location.get('speed', 45)
+            
+            if train_state and train_state.get('distance_km') is not None:
+                features['distance_to_station'] = train_state['distance_km']
+            else:
+                features['distance_to_station'] = self.calculate_distance_to_station(
+                    current_location, data.get('station_id')
+                )
             
             # Schedule features
             features['scheduled_time_minutes'] = self.convert_time_to_minutes(
@@ -61,6 +74,33 @@ class FeatureEngineer:
             # Return default features
             return self.get_default_features()
 
+    def extract_route_features(self, data, stops, train_state=None):
+        """Build one feature row per upcoming stop from a single train state"""
+        base = self.extract_features(data, train_state)
+        matrix = np.tile(
+            np.array([base[name] for name in self.feature_names], dtype=float),
+            (len(stops), 1)
+        )
+        column = self.feature_names.index
+        
+        # Only the schedule and the distance differ between stops
+        scheduled = parse_minutes_array([stop.get('scheduled_time') for stop in stops]).astype(float)
+        scheduled[scheduled < 0] = base['scheduled_time_minutes']
+        scheduled %= MINUTES_PER_DAY
+        hours = scheduled // 60
+        matrix[:, column('scheduled_time_minutes')] = scheduled
+        matrix[:, column('hour')] = hours
+        matrix[:, column('is_peak_hour')] = np.isin(hours, [7, 8, 9, 17, 18, 19])
+        
+        distances = np.array([
+            stop.get('distance_km') if stop.get('distance_km') is not None else np.nan
+            for stop in stops
+        ], dtype=float)
+        known = ~np.isnan(distances)
+        matrix[known, column('distance_to_station')] = distances[known]
+        
+        return matrix, base
+
     def get_default_features(self):
         """Get default feature values"""
         now = datetime.now()
@@ -98,8 +138,7 @@ class FeatureEngineer:
         """Convert time string to minutes since midnight"""
         try:
             if isinstance(time_str, str):
-                time_obj = datetime.strptime(time_str, '%H:%M:%S').time()
-                return time_obj.hour * 60 + time_obj.minute
+                return parse_minutes(time_str) % MINUTES_PER_DAY
             return 0
         except Exception as e:
             logger.error(f"Time conversion error: {e}")
@@ -172,36 +211,14 @@ class FeatureEngineer:
                 'weather_severity': 0
             }
         
-        # Normalize temperature (20-40°C range)
-        temp_normalized = (weather_data.get('temperature', 28) - 20) / 20
-        
-        # Normalize humidity (0-100% range)
-        humidity_normalized = weather_data.get('humidity', 75) / 100
-        
-        # Categorize rainfall
-        rainfall = weather_data.get('rainfall', 0)
-        if rainfall == 0:
-            rainfall_category = 0  # No rain
-        elif rainfall < 2.5:
-            rainfall_category = 1  # Light rain
-        elif rainfall < 10:
-            rainfall_category = 2  # Moderate rain
-        else:
-            rainfall_category = 3  # Heavy rain
-        
-        # Calculate weather severity score
-        weather_severity = (
-            (rainfall_category * 0.4) +
-            (abs(temp_normalized - 0.4) * 0.3) +  # Extreme temperatures
-            (humidity_normalized * 0.3)
+        derived = derive_weather(
+            weather_data.get('temperature', 28),
+            weather_data.get('humidity', 75),
+            weather_data.get('rainfall', 0)
         )
-        
-        return {
-            'temp_normalized': temp_normalized,
-            'humidity_normalized': humidity_normalized,
-            'rainfall_category': rainfall_category,
-            'weather_severity': min(1.0, weather_severity)
-        }
+        features = {name: float(value) for name, value in derived.items()}
+        features['rainfall_category'] = int(features['rainfall_category'])
+        return features
 
     def create_movement_features(self, tracking_data):
         """Create movement-based features from tracking data"""
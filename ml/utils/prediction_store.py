@@ -0,0 +1,179 @@
+import os
+import json
+import threading
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'smartrail:predictions'
+
+# Old versions stay readable for one more sweep so in-flight readers never miss
+DEFAULT_VERSION_TTL_SECONDS = 30 * 60
+
+
+class MemoryPredictionStore:
+    """In-process store; each sweep swaps in a new version as one dict"""
+
+    backend = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.meta = {}
+        self.trains = {}
+
+    def publish(self, version, trains, meta):
+        """Make a complete sweep visible at once"""
+        with self._lock:
+            self.version = version
+            self.trains = trains
+            self.meta = meta
+
+    def get_train(self, train_id):
+        """All precomputed stops of a train, keyed by station id"""
+        with self._lock:
+            return self.trains.get(str(train_id)), self.version
+
+    def get_info(self):
+        with self._lock:
+            return {'backend': self.backend, 'version': self.version, **self.meta}
+
+
+class FilePredictionStore(MemoryPredictionStore):
+    """Shares sweeps between worker processes through a JSON file per version"""
+
+    backend = 'file'
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.pointer_path = os.path.join(directory, 'current.json')
+        self._loaded_mtime = None
+
+    def publish(self, version, trains, meta):
+        os.makedirs(self.directory, exist_ok=True)
+        safe_version = version.replace(':', '_')
+        path = os.path.join(self.directory, f"{safe_version}.json")
+
+        # Write the version first, then flip the pointer atomically
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({'version': version, 'meta': meta, 'trains': trains}, f)
+        os.replace(f"{path}.tmp", path)
+        with open(f"{self.pointer_path}.tmp", 'w') as f:
+            json.dump({'version': version, 'file': os.path.basename(path)}, f)
+        os.replace(f"{self.pointer_path}.tmp", self.pointer_path)
+
+        # Keep the previous version for readers that resolved it already
+        versions = sorted(
+            (name for name in os.listdir(self.directory) if name.endswith('.json') and name != 'current.json'),
+            key=lambda name: os.path.getmtime(os.path.join(self.directory, name))
+        )
+        for name in versions[:-2]:
+            os.remove(os.path.join(self.directory, name))
+
+        super().publish(version, trains, meta)
+        self._loaded_mtime = os.path.getmtime(self.pointer_path)
+
+    def refresh(self):
+        """Reload when another process has published a newer version"""
+        try:
+            mtime = os.path.getmtime(self.pointer_path)
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+
+        with open(self.pointer_path, 'r') as f:
+            pointer = json.load(f)
+        with open(os.path.join(self.directory, pointer['file']), 'r') as f:
+            snapshot = json.load(f)
+        super().publish(snapshot['version'], snapshot['trains'], snapshot['meta'])
+        self._loaded_mtime = mtime
+
+    def get_train(self, train_id):
+        self.refresh()
+        return super().get_train(train_id)
+
+    def get_info(self):
+        self.refresh()
+        return super().get_info()
+
+
+class RedisPredictionStore:
+    """Redis store: one hash per sweep version plus a pointer key to the current one"""
+
+    backend = 'redis'
+
+    def __init__(self, host, port, password=None, version_ttl=DEFAULT_VERSION_TTL_SECONDS):
+        import redis
+        self.client = redis.Redis(
+            host=host, port=port, password=password or None,
+            decode_responses=True, socket_connect_timeout=2
+        )
+        self.client.ping()
+        self.version_ttl = version_ttl
+
+    def publish(self, version, trains, meta):
+        key = f"{KEY_PREFIX}:{version}"
+        pipeline = self.client.pipeline(transaction=False)
+        if trains:
+            pipeline.hset(key, mapping={train_id: json.dumps(stops) for train_id, stops in trains.items()})
+        pipeline.expire(key, self.version_ttl)
+        pipeline.execute()
+
+        # Readers switch to the new version in a single write
+        pipeline = self.client.pipeline()
+        pipeline.set(f"{KEY_PREFIX}:current", version)
+        pipeline.set(f"{KEY_PREFIX}:meta", json.dumps(meta))
+        pipeline.execute()
+
+    def get_train(self, train_id):
+        version = self.client.get(f"{KEY_PREFIX}:current")
+        if version is None:
+            return None, None
+        stops = self.client.hget(f"{KEY_PREFIX}:{version}", str(train_id))
+        return (json.loads(stops) if stops else None), version
+
+    def get_info(self):
+        meta = self.client.get(f"{KEY_PREFIX}:meta")
+        return {
+            'backend': self.backend,
+            'version': self.client.get(f"{KEY_PREFIX}:current"),
+            **(json.loads(meta) if meta else {})
+        }
+
+
+def create_prediction_store(backend=None):
+    """Build the configured store; 'auto' uses Redis when it is reachable"""
+    backend = backend or os.getenv('ML_PREDICTION_STORE', 'auto')
+
+    if backend in ('auto', 'redis'):
+        try:
+            store = RedisPredictionStore(
+                os.getenv('REDIS_HOST', 'localhost'),
+                int(os.getenv('REDIS_PORT', 6379)),
+                os.getenv('REDIS_PASSWORD')
+            )
+            logger.info("Prediction store: redis")
+            return store
+        except Exception as e:
+            if backend == 'redis':
+                raise
+            logger.warning(f"Redis unavailable for prediction store, using local store: {e}")
+
+    if backend == 'file':
+        directory = os.getenv(
+            'ML_PREDICTION_STORE_DIR',
+            os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'predictions')
+        )
+        logger.info(f"Prediction store: file ({directory})")
+        return FilePredictionStore(directory)
+
+    logger.info("Prediction store: memory")
+    return MemoryPredictionStore()
+
+
+def sweep_version(model_version, at=None):
+    """Versioned key component for one sweep"""
+    return f"{model_version}:{(at or datetime.now()).strftime('%Y%m%dT%H%M%S')}"
@@ -0,0 +1,100 @@
+import os
+import logging
+from contextlib import contextmanager
+from threadpoolctl import threadpool_limits
+
+logger = logging.getLogger(__name__)
+
+# Native thread pools read these at load time; child processes inherit them
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+    'BLIS_NUM_THREADS', 'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS'
+)
+
+
+def available_cores():
+    """Cores this process may run on (respects CPU affinity and container pinning)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def serving_workers():
+    """Server worker processes sharing the machine"""
+    return max(1, int(os.getenv('ML_WORKERS', os.getenv('WEB_CONCURRENCY', 1))))
+
+
+def serving_threads():
+    """Concurrent model calls one serving worker should run: its share of the cores"""
+    return max(1, int(os.getenv('ML_SERVING_THREADS', available_cores() // serving_workers())))
+
+
+def serving_n_jobs():
+    """Estimator n_jobs while serving"""
+    # Parallelism comes from concurrent requests; a request fanning out to
+    # every core multiplies with the request threads instead of adding to them
+    return int(os.getenv('ML_SERVING_N_JOBS', 1))
+
+
+def serving_blas_threads():
+    """BLAS/OpenMP threads per model call while serving"""
+    return max(1, int(os.getenv('ML_SERVING_BLAS_THREADS', 1)))
+
+
+def training_threads():
+    """Cores training may use (the whole machine unless configured)"""
+    return max(1, int(os.getenv('ML_TRAINING_THREADS', available_cores())))
+
+
+def configure_serving():
+    """Cap native thread pools for a serving worker; call once at startup"""
+    blas_threads = serving_blas_threads()
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(blas_threads))
+    threadpool_limits(limits=blas_threads)
+
+    logger.info(
+        f"Thread budget: {available_cores()} cores, {serving_workers()} workers, "
+        f"{serving_threads()} model calls x {blas_threads} BLAS threads per worker"
+    )
+    return get_budget()
+
+
+def use_serving_threads(estimator):
+    """Switch a trained estimator to the serving n_jobs"""
+    if hasattr(estimator, 'get_params') and 'n_jobs' in estimator.get_params():
+        estimator.set_params(n_jobs=serving_n_jobs())
+    return estimator
+
+
+@contextmanager
+def training_budget(estimator=None):
+    """Give training the training budget, split between estimator jobs and BLAS threads
+
+    Limits are process-wide, so serving threads running alongside an in-process
+    retrain briefly share the training budget.
+    """
+    threads = training_threads()
+    n_jobs = 1
+    if hasattr(estimator, 'get_params') and 'n_jobs' in estimator.get_params():
+        # An explicit n_jobs (e.g. single-threaded shards in worker processes) is kept
+        n_jobs = estimator.get_params()['n_jobs']
+        if n_jobs in (None, -1):
+            estimator.set_params(n_jobs=threads)
+            n_jobs = threads
+
+    with threadpool_limits(limits=max(1, threads // n_jobs)):
+        yield threads
+
+
+def get_budget():
+    """Get the effective thread budget"""
+    return {
+        'cores': available_cores(),
+        'workers': serving_workers(),
+        'serving_threads': serving_threads(),
+        'serving_n_jobs': serving_n_jobs(),
+        'serving_blas_threads': serving_blas_threads(),
+        'training_threads': training_threads()
+    }
@@ -0,0 +1,87 @@
+import math
+import logging
+from datetime import time
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 1440
+
+# Every label a minute of the day can format to; formatting is a table lookup
+MINUTE_LABELS = np.array([
+    f"{minute // 60:02d}:{minute % 60:02d}:00" for minute in range(MINUTES_PER_DAY)
+])
+_MINUTE_LABEL_LIST = MINUTE_LABELS.tolist()
+
+
+@lru_cache(maxsize=16384)
+def parse_seconds(value):
+    """Parse HH:MM[:SS[.ffffff]] or a datetime.time into seconds since midnight
+
+    Postgres TIME also holds 24:00:00, the end of the day, which parses to
+    86400 so it sorts after every other time of that day.
+    """
+    if isinstance(value, time):
+        return value.hour * 3600 + value.minute * 60 + value.second
+
+    parts = value.split(':')
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Invalid time: {value!r}")
+
+    hours = int(parts[0])
+    minutes = int(parts[1])
+    seconds = int(parts[2].split('.', 1)[0]) if len(parts) == 3 else 0
+    if hours == 24 and minutes == 0 and seconds == 0:
+        return MINUTES_PER_DAY * 60
+    if not (0 <= hours < 24 and 0 <= minutes < 60 and 0 <= seconds < 60):
+        raise ValueError(f"Invalid time: {value!r}")
+
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def parse_minutes(value):
+    """Parse a time of day into whole minutes since midnight"""
+    return parse_seconds(value) // 60
+
+
+def parse_seconds_array(values, missing=-1):
+    """Parse a column of times into an int32 array of seconds since midnight"""
+    # A column holds few distinct times, so parse each distinct value once
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    parsed = np.empty(len(uniques) + 1, dtype=np.int32)
+    parsed[-1] = missing
+    for i, value in enumerate(uniques):
+        try:
+            parsed[i] = parse_seconds(value)
+        except (AttributeError, TypeError, ValueError):
+            parsed[i] = missing
+    return parsed[codes]
+
+
+def parse_minutes_array(values, missing=-1):
+    """Parse a column of times into an int32 array of whole minutes since midnight"""
+    seconds = parse_seconds_array(values, missing)
+    return np.where(seconds == missing, missing, seconds // 60).astype(np.int32)
+
+
+def format_minutes(minutes):
+    """Format minutes since midnight (any day, any sign) as HH:MM:00"""
+    return _MINUTE_LABEL_LIST[math.floor(minutes) % MINUTES_PER_DAY]
+
+
+def format_minutes_array(minutes):
+    """Vectorized format of minutes since midnight as HH:MM:00 labels"""
+    return MINUTE_LABELS[np.floor(np.asarray(minutes, dtype=float)).astype(np.int64) % MINUTES_PER_DAY]
+
+
+def delay_minutes(scheduled, actual):
+    """Signed minutes from scheduled to actual, wrapping across midnight
+
+    Times of day carry no date, so 23:55 -> 00:05 is ten minutes late rather
+    than 1430 minutes early; differences are folded into [-12h, +12h).
+    """
+    difference = np.asarray(actual, dtype=float) - np.asarray(scheduled, dtype=float)
+    wrapped = (difference + MINUTES_PER_DAY / 2) % MINUTES_PER_DAY - MINUTES_PER_DAY / 2
+    return float(wrapped) if wrapped.ndim == 0 else wrapped
@@ -0,0 +1,252 @@
+import os
+import math
+import threading
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from utils.geo import haversine_km
+
+logger = logging.getLogger(__name__)
+
+# Number of points applied per lock acquisition when reading a stream
+INGEST_BATCH_SIZE = 500
+
+# Speed below which a point counts as the train standing at a signal or platform
+STOPPED_SPEED_KMH = 5
+
+# Recent points kept per train for models that read the tracking window
+TRACKING_WINDOW = int(os.getenv('ML_SEQUENCE_LENGTH', 32))
+
+# Trains silent for longer than this are dropped, and start afresh when they report again
+TRAIN_STATE_TTL_MINUTES = int(os.getenv('ML_TRAIN_STATE_TTL_MINUTES', 180))
+
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp from a tracking point, defaulting to now"""
+    if isinstance(value, str) and value:
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if not isinstance(value, datetime):
+        return datetime.now()
+    # Compare everything in naive local time, like datetime.now()
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+
+class TrainState:
+    """Running movement state of one train, updated point by point"""
+
+    __slots__ = (
+        'train_id', 'latitude', 'longitude', 'speed', 'heading', 'station_id',
+        'timestamp', 'points', 'speed_mean', 'speed_m2', 'stopped_points', 'distance_km', 'recent'
+    )
+
+    def __init__(self, train_id, window=TRACKING_WINDOW):
+        self.train_id = train_id
+        self.latitude = None
+        self.longitude = None
+        self.speed = None
+        self.heading = None
+        self.station_id = None
+        self.timestamp = None
+        self.points = 0
+        self.speed_mean = 0.0
+        self.speed_m2 = 0.0
+        self.stopped_points = 0
+        self.distance_km = None
+        self.recent = deque(maxlen=window)
+
+    def update(self, point, timestamp, station_coords):
+        """Fold one tracking point into the running state"""
+        self.latitude = point['latitude']
+        self.longitude = point['longitude']
+        if point['heading'] is not None:
+            self.heading = point['heading']
+        if point['station_id'] is not None:
+            self.station_id = point['station_id']
+        self.timestamp = timestamp
+        self.recent.append((timestamp, point['speed'], self.latitude, self.longitude))
+
+        speed = point['speed']
+        if speed is not None:
+            # Welford's update keeps mean and variance without storing history
+            self.speed = speed
+            self.points += 1
+            delta = self.speed - self.speed_mean
+            self.speed_mean += delta / self.points
+            self.speed_m2 += delta * (self.speed - self.speed_mean)
+            self.stopped_points += int(self.speed < STOPPED_SPEED_KMH)
+
+        coords = station_coords.get(self.station_id)
+        self.distance_km = (
+            float(haversine_km(self.latitude, self.longitude, coords[0], coords[1])) if coords else None
+        )
+
+    def window(self):
+        """Recent points, newest first like the tracking rows the server sends"""
+        return [
+            {'timestamp': timestamp, 'speed': speed, 'latitude': latitude, 'longitude': longitude}
+            for timestamp, speed, latitude, longitude in reversed(self.recent)
+        ]
+
+    def distance_to(self, station_id, station_coords):
+        """Distance from the last position to a station, when its location is known"""
+        if station_id is None or station_id == self.station_id:
+            return self.distance_km
+        coords = station_coords.get(station_id)
+        if coords is None or self.latitude is None:
+            return None
+        return float(haversine_km(self.latitude, self.longitude, coords[0], coords[1]))
+
+    def to_dict(self):
+        """Serializable view of the state"""
+        variance = self.speed_m2 / (self.points - 1) if self.points > 1 else 0.0
+        return {
+            'train_id': self.train_id,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'speed': self.speed,
+            'heading': self.heading,
+            'station_id': self.station_id,
+            'distance_km': None if self.distance_km is None else round(self.distance_km, 3),
+            'avg_speed': round(self.speed_mean, 2),
+            'speed_std': round(math.sqrt(variance), 2),
+            'stopped_points': self.stopped_points,
+            'points': self.points,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None
+        }
+
+
+class TrainStateStore:
+    def __init__(self, ttl_minutes=None):
+        self.ttl = timedelta(minutes=int(ttl_minutes or TRAIN_STATE_TTL_MINUTES))
+        self.states = {}
+        self.station_coords = {}
+        self.ingested = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def set_station_coordinates(self, coordinates):
+        """Register station locations used for distance-to-station"""
+        with self._lock:
+            self.station_coords = {
+                int(station_id): (float(lat), float(lon))
+                for station_id, (lat, lon) in coordinates.items()
+                if lat is not None and lon is not None
+            }
+        logger.info(f"Train state store knows {len(self.station_coords)} station locations")
+
+    def ingest(self, points):
+        """Apply a batch of tracking points; stale or malformed points are rejected"""
+        accepted = 0
+        rejected = 0
+        trains = set()
+
+        with self._lock:
+            for point in points:
+                try:
+                    train_id = int(point['train_id'])
+                    timestamp = parse_timestamp(point.get('timestamp'))
+                    point = {
+                        'latitude': float(point['latitude']),
+                        'longitude': float(point['longitude']),
+                        'speed': float(point['speed']) if point.get('speed') is not None else None,
+                        'heading': point.get('heading'),
+                        'station_id': int(point['station_id']) if point.get('station_id') is not None else None
+                    }
+                except (KeyError, TypeError, ValueError):
+                    rejected += 1
+                    continue
+
+                state = self.states.get(train_id)
+                if state is None:
+                    state = self.states[train_id] = TrainState(train_id)
+                elif state.timestamp and timestamp < state.timestamp:
+                    # Late, out-of-order points would move the train backwards
+                    rejected += 1
+                    continue
+
+                state.update(point, timestamp, self.station_coords)
+                accepted += 1
+                trains.add(train_id)
+
+            self.ingested += accepted
+            self.rejected += rejected
+
+        return {'accepted': accepted, 'rejected': rejected, 'trains': len(trains)}
+
+    def get(self, train_id):
+        """Return the live state of a train, or None if unknown or expired"""
+        try:
+            train_id = int(train_id)
+        except (TypeError, ValueError):
+            return None
+
+        with self._lock:
+            state = self.states.get(train_id)
+            if state is None:
+                return None
+            if datetime.now() - state.timestamp > self.ttl:
+                del self.states[train_id]
+                return None
+            return state
+
+    def features_for(self, train_id, station_id=None):
+        """Movement inputs for a prediction, read from the live state"""
+        state = self.get(train_id)
+        if state is None:
+            return None
+
+        try:
+            station_id = int(station_id) if station_id is not None else None
+        except (TypeError, ValueError):
+            station_id = None
+
+        with self._lock:
+            snapshot = state.to_dict()
+            snapshot['distance_km'] = state.distance_to(station_id, self.station_coords)
+        return snapshot
+
+    def window_for(self, train_id):
+        """Recent tracking points of a train, newest first (empty if unknown)"""
+        state = self.get(train_id)
+        if state is None:
+            return []
+        with self._lock:
+            return state.window()
+
+    def distances_for(self, train_id, station_ids):
+        """Distances from a train's last position to several stations (None where unknown)"""
+        state = self.get(train_id)
+        if state is None:
+            return [None] * len(station_ids)
+
+        with self._lock:
+            distances = []
+            for station_id in station_ids:
+                try:
+                    station_id = int(station_id)
+                except (TypeError, ValueError):
+                    distances.append(None)
+                    continue
+                distances.append(state.distance_to(station_id, self.station_coords))
+            return distances
+
+    def evict_expired(self):
+        """Drop trains that have not reported within the TTL"""
+        cutoff = datetime.now() - self.ttl
+        with self._lock:
+            expired = [train_id for train_id, state in self.states.items() if state.timestamp < cutoff]
+            for train_id in expired:
+                del self.states[train_id]
+        return len(expired)
+
+    def get_info(self):
+        """Get ingest counters for monitoring"""
+        self.evict_expired()
+        with self._lock:
+            return {
+                'active_trains': len(self.states),
+                'known_stations': len(self.station_coords),
+                'points_ingested': self.ingested,
+                'points_rejected': self.rejected,
+                'ttl_minutes': self.ttl.total_seconds() / 60
+            }
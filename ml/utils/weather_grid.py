@@ -0,0 +1,356 @@
+import os
+import json
+import time
+import threading
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import schedule
+
+logger = logging.getLogger(__name__)
+
+# Gridded values kept per cell; severity is derived once at ingest
+WEATHER_VARIABLES = ('temperature', 'humidity', 'rainfall', 'weather_severity')
+
+# Model feature filled from each gridded variable
+WEATHER_FEATURES = {'weather_temp': 'temperature', 'weather_humidity': 'humidity', 'weather_rainfall': 'rainfall'}
+
+# Values used where no grid covers a point, as in the feature defaults
+DEFAULT_WEATHER = {'temperature': 28.0, 'humidity': 75.0, 'rainfall': 0.0}
+
+# Upper rainfall bounds (mm) of the none / light / moderate categories
+RAINFALL_CATEGORY_BOUNDS = [0, 2.5, 10]
+
+DEFAULT_DROP_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'weather')
+
+
+def derive_weather(temperature, humidity, rainfall):
+    """Normalized weather, rainfall category and severity, for scalars or arrays"""
+    temperature = np.asarray(temperature, dtype=float)
+    humidity = np.asarray(humidity, dtype=float)
+    rainfall = np.asarray(rainfall, dtype=float)
+
+    # Temperature over a 20-40°C range, humidity over 0-100%
+    temp_normalized = (temperature - 20) / 20
+    humidity_normalized = humidity / 100
+    rainfall_category = np.where(rainfall <= 0, 0, np.digitize(rainfall, RAINFALL_CATEGORY_BOUNDS[1:]) + 1)
+    severity = np.minimum(1.0, (
+        rainfall_category * 0.4 +
+        np.abs(temp_normalized - 0.4) * 0.3 +  # Extreme temperatures
+        humidity_normalized * 0.3
+    ))
+    return {
+        'temp_normalized': temp_normalized,
+        'humidity_normalized': humidity_normalized,
+        'rainfall_category': rainfall_category,
+        'weather_severity': severity
+    }
+
+
+def epoch_minutes(value=None):
+    """Minutes since the epoch of a datetime, ISO string or pandas timestamp (now if None)"""
+    if value is None:
+        return time.time() / 60
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        # Grids and requests are compared in naive local time, like datetime.now()
+        timestamp = timestamp.tz_convert(datetime.now().astimezone().tzinfo).tz_localize(None)
+    return timestamp.to_pydatetime().timestamp() / 60
+
+
+def read_grids(path):
+    """Grids in a dropped file: JSON (one grid, a list or {'grids': [...]}) or long-format CSV"""
+    if path.endswith('.csv'):
+        df = pd.read_csv(path)
+        grids = []
+        for valid_time, rows in df.groupby('valid_time', sort=True):
+            grid = {'valid_time': valid_time}
+            for variable in DEFAULT_WEATHER:
+                table = rows.pivot_table(index='latitude', columns='longitude', values=variable, aggfunc='mean')
+                grid['latitudes'] = table.index.to_numpy(dtype=float)
+                grid['longitudes'] = table.columns.to_numpy(dtype=float)
+                grid[variable] = table.to_numpy(dtype=float)
+            grids.append(grid)
+        return grids
+
+    with open(path, 'r') as f:
+        payload = json.load(f)
+    if isinstance(payload, dict) and 'grids' in payload:
+        return payload['grids']
+    return payload if isinstance(payload, list) else [payload]
+
+
+class WeatherGrid:
+    """Time-bucketed regular lat/lon weather grids held in memory
+
+    Each bucket holds one grid per variable; points are sampled with bilinear
+    interpolation from the bucket nearest in time, a whole batch per call.
+    Grids arrive as files in a drop directory, polled in the background, or
+    through ingest directly.
+    """
+
+    def __init__(self, drop_dir=None, bucket_minutes=None, max_age_minutes=None, retention_hours=None,
+                 poll_seconds=None):
+        self.drop_dir = drop_dir or os.getenv('ML_WEATHER_DIR', DEFAULT_DROP_DIR)
+        self.bucket_minutes = int(bucket_minutes or os.getenv('ML_WEATHER_BUCKET_MINUTES', 60))
+        self.max_age_minutes = float(max_age_minutes or os.getenv('ML_WEATHER_MAX_AGE_MINUTES', 180))
+        self.retention_hours = float(retention_hours or os.getenv('ML_WEATHER_RETENTION_HOURS', 48))
+        self.poll_seconds = int(
+            poll_seconds if poll_seconds is not None else os.getenv('ML_WEATHER_POLL_SECONDS', 60)
+        )
+        self.buckets = {}
+        self.bucket_keys = np.array([], dtype=float)
+        self.station_ids = {}
+        self.station_coords = np.zeros((0, 2))
+        self.seen_files = {}
+        self.ingested = 0
+        self.rejected = 0
+        self.last_ingest = None
+        self._lock = threading.Lock()
+        self._scheduler = schedule.Scheduler()
+        self._thread = None
+
+    def set_station_coordinates(self, coordinates):
+        """Register station locations so stations can be sampled by id"""
+        known = [
+            (int(station_id), float(lat), float(lon))
+            for station_id, (lat, lon) in coordinates.items()
+            if lat is not None and lon is not None
+        ]
+        with self._lock:
+            self.station_ids = {station_id: i for i, (station_id, _, _) in enumerate(known)}
+            self.station_coords = np.array([(lat, lon) for _, lat, lon in known], dtype=float).reshape(-1, 2)
+
+    def ingest(self, grid, source='api'):
+        """Add one grid to its time bucket; a later grid for the same bucket replaces it"""
+        latitudes = np.asarray(grid['latitudes'], dtype=float)
+        longitudes = np.asarray(grid['longitudes'], dtype=float)
+        shape = (len(latitudes), len(longitudes))
+        if min(shape) < 2:
+            raise ValueError("Grid needs at least two latitudes and two longitudes")
+        lat_step = np.diff(latitudes)
+        lon_step = np.diff(longitudes)
+        if not (np.allclose(lat_step, lat_step[0]) and np.allclose(lon_step, lon_step[0])) \
+                or lat_step[0] <= 0 or lon_step[0] <= 0:
+            raise ValueError("Grid coordinates must be ascending and evenly spaced")
+
+        fields = {}
+        for variable, default in DEFAULT_WEATHER.items():
+            values = np.asarray(grid.get(variable, np.full(shape, default)), dtype=float)
+            if values.shape != shape:
+                raise ValueError(f"{variable} grid is {values.shape}, expected {shape}")
+            fields[variable] = np.where(np.isnan(values), default, values)
+        fields['weather_severity'] = derive_weather(
+            fields['temperature'], fields['humidity'], fields['rainfall']
+        )['weather_severity']
+
+        bucket = {
+            'lat0': latitudes[0],
+            'lat_step': lat_step[0],
+            'lon0': longitudes[0],
+            'lon_step': lon_step[0],
+            'shape': shape,
+            'values': np.stack([fields[variable] for variable in WEATHER_VARIABLES]).astype(np.float32),
+            'valid_time': str(grid['valid_time']),
+            'source': source
+        }
+        key = np.floor(epoch_minutes(grid['valid_time']) / self.bucket_minutes) * self.bucket_minutes
+
+        with self._lock:
+            self.buckets[key] = bucket
+            cutoff = epoch_minutes() - self.retention_hours * 60
+            for old in [old for old in self.buckets if old < cutoff]:
+                del self.buckets[old]
+            self.bucket_keys = np.array(sorted(self.buckets), dtype=float)
+            self.ingested += 1
+            self.last_ingest = datetime.now().isoformat()
+        return key
+
+    def ingest_file(self, path):
+        """Ingest every grid in a dropped file; returns the number accepted"""
+        accepted = 0
+        for grid in read_grids(path):
+            try:
+                self.ingest(grid, source=os.path.basename(path))
+                accepted += 1
+            except (KeyError, TypeError, ValueError) as e:
+                self.rejected += 1
+                logger.warning(f"Rejected weather grid in {path}: {e}")
+        return accepted
+
+    def poll(self):
+        """Ingest new or changed files in the drop directory and remove expired ones"""
+        if not os.path.isdir(self.drop_dir):
+            return 0
+
+        accepted = 0
+        cutoff = time.time() - self.retention_hours * 3600
+        for name in sorted(os.listdir(self.drop_dir)):
+            if not name.endswith(('.json', '.csv')):
+                continue
+            path = os.path.join(self.drop_dir, name)
+            try:
+                mtime = os.path.getmtime(path)
+                if mtime < cutoff:
+                    os.remove(path)
+                    self.seen_files.pop(name, None)
+                    continue
+                if self.seen_files.get(name) == mtime:
+                    continue
+                accepted += self.ingest_file(path)
+                self.seen_files[name] = mtime
+            except Exception as e:
+                logger.error(f"Weather file ingest error for {name}: {e}")
+
+        if accepted:
+            logger.info(f"Ingested {accepted} weather grids from {self.drop_dir}")
+        return accepted
+
+    def write(self, grid):
+        """Drop a grid into the directory so every worker picks it up, and ingest it here"""
+        os.makedirs(self.drop_dir, exist_ok=True)
+        key = self.ingest(grid)
+        name = f"api_{int(key)}_{int(time.time() * 1000)}.json"
+        path = os.path.join(self.drop_dir, name)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({
+                variable: np.asarray(value).tolist() if not isinstance(value, str) else value
+                for variable, value in grid.items()
+            }, f)
+        os.replace(f"{path}.tmp", path)
+        self.seen_files[name] = os.path.getmtime(path)
+        return key
+
+    def sample(self, latitudes, longitudes, minutes=None):
+        """Bilinear weather at many points
+
+        minutes are epoch minutes per point (now if None). Returns an array per
+        variable and a covered mask; uncovered points get the defaults.
+        """
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=float))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=float))
+        n_points = len(latitudes)
+        minutes = np.full(n_points, epoch_minutes()) if minutes is None else np.broadcast_to(
+            np.asarray(minutes, dtype=float), (n_points,)
+        )
+
+        defaults = derive_weather(**DEFAULT_WEATHER)['weather_severity']
+        values = np.tile(
+            np.array([*DEFAULT_WEATHER.values(), defaults], dtype=float)[:, None], (1, n_points)
+        )
+        covered = np.zeros(n_points, dtype=bool)
+
+        with self._lock:
+            keys = self.bucket_keys
+            buckets = self.buckets
+
+        if len(keys) and n_points:
+            # Nearest bucket in time, by comparing the neighbours either side
+            after = np.clip(np.searchsorted(keys, minutes), 0, len(keys) - 1)
+            before = np.maximum(after - 1, 0)
+            nearest = np.where(np.abs(keys[before] - minutes) <= np.abs(keys[after] - minutes), before, after)
+            in_time = np.abs(keys[nearest] - minutes) <= self.max_age_minutes
+            known = ~(np.isnan(latitudes) | np.isnan(longitudes)) & in_time
+
+            for b in np.unique(nearest[known]):
+                rows = np.flatnonzero(known & (nearest == b))
+                bucket = buckets[keys[b]]
+                n_lat, n_lon = bucket['shape']
+                y = (latitudes[rows] - bucket['lat0']) / bucket['lat_step']
+                x = (longitudes[rows] - bucket['lon0']) / bucket['lon_step']
+
+                # Points within half a cell of the edge are clamped to it
+                inside = (y >= -0.5) & (y <= n_lat - 0.5) & (x >= -0.5) & (x <= n_lon - 0.5)
+                rows, y, x = rows[inside], np.clip(y[inside], 0, n_lat - 1), np.clip(x[inside], 0, n_lon - 1)
+                y0 = np.minimum(np.floor(y).astype(int), n_lat - 2)
+                x0 = np.minimum(np.floor(x).astype(int), n_lon - 2)
+                wy = (y - y0)[None, :]
+                wx = (x - x0)[None, :]
+
+                grid = bucket['values']
+                values[:, rows] = (
+                    grid[:, y0, x0] * (1 - wy) * (1 - wx) +
+                    grid[:, y0, x0 + 1] * (1 - wy) * wx +
+                    grid[:, y0 + 1, x0] * wy * (1 - wx) +
+                    grid[:, y0 + 1, x0 + 1] * wy * wx
+                )
+                covered[rows] = True
+
+        result = {variable: values[i] for i, variable in enumerate(WEATHER_VARIABLES)}
+        result['covered'] = covered
+        return result
+
+    def locate(self, latitudes, longitudes, station_ids):
+        """Fill missing positions from the registered station locations"""
+        latitudes = np.array(latitudes, dtype=float)
+        longitudes = np.array(longitudes, dtype=float)
+        missing = np.flatnonzero(np.isnan(latitudes) | np.isnan(longitudes))
+        with self._lock:
+            for i in missing:
+                try:
+                    index = self.station_ids.get(int(station_ids[i]))
+                except (TypeError, ValueError):
+                    index = None
+                if index is not None:
+                    latitudes[i], longitudes[i] = self.station_coords[index]
+        return latitudes, longitudes
+
+    def sample_stations(self, station_ids, minutes=None):
+        """Weather at registered stations; unknown stations are left uncovered"""
+        nan = np.full(len(station_ids), np.nan)
+        return self.sample(*self.locate(nan, nan, station_ids), minutes)
+
+    def apply(self, matrix, feature_names, latitudes, longitudes, minutes=None, station_ids=None):
+        """Overwrite the weather columns of a feature matrix where a grid covers the row; returns the covered mask"""
+        if station_ids is not None:
+            latitudes, longitudes = self.locate(latitudes, longitudes, station_ids)
+        weather = self.sample(latitudes, longitudes, minutes)
+        covered = weather['covered']
+        for feature, variable in WEATHER_FEATURES.items():
+            matrix[covered, feature_names.index(feature)] = weather[variable][covered]
+        return covered
+
+    def weather_at(self, latitude=None, longitude=None, station_id=None, when=None):
+        """Request-style weather at a position, or at a station without one, when a grid covers it"""
+        latitudes, longitudes = self.locate(
+            [np.nan if latitude is None else latitude], [np.nan if longitude is None else longitude], [station_id]
+        )
+        result = self.sample(latitudes, longitudes, epoch_minutes(when))
+        if not result['covered'][0]:
+            return None
+        return {variable: float(result[variable][0]) for variable in WEATHER_VARIABLES}
+
+    def start(self):
+        """Poll the drop directory on a background schedule"""
+        if self.poll_seconds <= 0 or self._thread is not None:
+            return
+
+        # The first poll runs inline so the cache is warm before serving starts
+        self.poll()
+        self._scheduler.every(self.poll_seconds).seconds.do(self.poll)
+
+        def loop():
+            while True:
+                self._scheduler.run_pending()
+                time.sleep(1)
+
+        self._thread = threading.Thread(target=loop, name='weather-grid', daemon=True)
+        self._thread.start()
+        logger.info(f"Polling {self.drop_dir} for weather grids every {self.poll_seconds} s")
+
+    def get_info(self):
+        """Get cached buckets and ingest counters"""
+        with self._lock:
+            keys = self.bucket_keys
+            return {
+                'drop_dir': self.drop_dir,
+                'bucket_minutes': self.bucket_minutes,
+                'buckets': len(keys),
+                'first_bucket': datetime.fromtimestamp(keys[0] * 60).isoformat() if len(keys) else None,
+                'last_bucket': datetime.fromtimestamp(keys[-1] * 60).isoformat() if len(keys) else None,
+                'ingested': self.ingested,
+                'rejected': self.rejected,
+                'last_ingest': self.last_ingest,
+                'stations': len(self.station_ids)
+            }
@@ -0,0 +1,286 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from utils.time_codec import format_minutes_array
+from utils.geo import haversine_km
+
+logger = logging.getLogger(__name__)
+
+# Rough bounding box of the Sri Lankan rail network
+NETWORK_BOUNDS = {'lat': (6.0, 9.8), 'lon': (79.8, 81.9)}
+
+TRAIN_TYPES = np.array(['express', 'intercity', 'local'])
+TRAIN_TYPE_WEIGHTS = [0.3, 0.2, 0.5]
+CRUISE_SPEED_KMH = {'express': 70.0, 'intercity': 60.0, 'local': 45.0}
+
+PEAK_HOURS = [7, 8, 9, 17, 18, 19]
+
+WORKLOAD_KINDS = ('schedules', 'outcomes', 'tracking', 'requests')
+
+
+class WorkloadGenerator:
+    """Vectorized synthetic rail network for load tests and benchmarks"""
+
+    def __init__(self, num_trains=1000, num_routes=None, stations_per_route=12, seed=42):
+        self.num_trains = int(num_trains)
+        self.num_routes = int(num_routes or max(1, self.num_trains // 10))
+        self.stations_per_route = int(stations_per_route)
+        self.num_stations = 0
+        self.seed = seed
+        self.build_network()
+
+    def build_network(self):
+        """Lay out stations, routes and one daily schedule per train"""
+        rng = np.random.default_rng(self.seed)
+
+        # Each route is a random walk of 5-25 km hops from a random origin, so
+        # consecutive stops are geographically close like a real line
+        origin_lat = rng.uniform(*NETWORK_BOUNDS['lat'], (self.num_routes, 1))
+        origin_lon = rng.uniform(*NETWORK_BOUNDS['lon'], (self.num_routes, 1))
+        bearing = rng.uniform(0, 2 * np.pi, (self.num_routes, 1)) + np.cumsum(
+            rng.normal(0, 0.3, (self.num_routes, self.stations_per_route - 1)), axis=1
+        )
+        hop_km = rng.uniform(5, 25, (self.num_routes, self.stations_per_route - 1))
+        lat = np.concatenate([origin_lat, origin_lat + np.cumsum(hop_km * np.cos(bearing) / 111.0, axis=1)], axis=1)
+        lon = np.concatenate([origin_lon, origin_lon + np.cumsum(hop_km * np.sin(bearing) / 111.0, axis=1)], axis=1)
+        lat = np.clip(lat, *NETWORK_BOUNDS['lat'])
+        lon = np.clip(lon, *NETWORK_BOUNDS['lon'])
+
+        # Routes share a station wherever two of their stops fall in the same
+        # ~1 km grid cell, which gives interchange stations for free
+        cells = np.round(lat * 100).astype(np.int64) * 100000 + np.round(lon * 100).astype(np.int64)
+        unique_cells, inverse = np.unique(cells.ravel(), return_inverse=True)
+        self.num_stations = len(unique_cells)
+        self.station_ids = np.arange(1, self.num_stations + 1)
+        self.station_lat = np.zeros(self.num_stations)
+        self.station_lon = np.zeros(self.num_stations)
+        self.station_lat[inverse] = lat.ravel()
+        self.station_lon[inverse] = lon.ravel()
+        self.route_stops = inverse.reshape(lat.shape)
+
+        segment_km = haversine_km(lat[:, :-1], lon[:, :-1], lat[:, 1:], lon[:, 1:])
+        self.route_segment_km = np.concatenate([np.zeros((self.num_routes, 1)), segment_km], axis=1)
+
+        # Trains: route, type and a departure between 04:30 and 21:00
+        self.train_ids = np.arange(1, self.num_trains + 1)
+        self.train_route = rng.integers(0, self.num_routes, self.num_trains)
+        self.train_type = rng.choice(TRAIN_TYPES, self.num_trains, p=TRAIN_TYPE_WEIGHTS)
+        self.train_departure = rng.integers(270, 1260, self.num_trains).astype(float)
+        self.train_speed = np.select(
+            [self.train_type == t for t in TRAIN_TYPES],
+            [CRUISE_SPEED_KMH[t] for t in TRAIN_TYPES]
+        )
+
+        # Scheduled minutes at every stop: run time at cruise speed plus a dwell
+        run_minutes = self.route_segment_km[self.train_route] / self.train_speed[:, None] * 60
+        dwell = np.where(np.arange(self.stations_per_route) > 0, 2.0, 0.0)
+        self.scheduled_minutes = self.train_departure[:, None] + np.cumsum(run_minutes + dwell, axis=1)
+
+        logger.info(
+            f"Synthetic network: {self.num_stations} stations, {self.num_routes} routes, "
+            f"{self.num_trains} trains x {self.stations_per_route} stops"
+        )
+
+    def _train_slice(self, start, stop):
+        """Per-stop arrays for trains [start, stop), flattened row-major"""
+        trains = np.arange(start, stop)
+        stops = self.route_stops[self.train_route[trains]]
+        return trains, stops
+
+    def schedules(self, start, stop, day_index=0):
+        """Scheduled stop times for a range of trains"""
+        trains, stops = self._train_slice(start, stop)
+        n_stops = self.stations_per_route
+        scheduled = self.scheduled_minutes[trains]
+
+        return pd.DataFrame({
+            'train_id': np.repeat(self.train_ids[trains], n_stops).astype(np.int32),
+            'route_id': np.repeat(self.train_route[trains] + 1, n_stops).astype(np.int32),
+            'stop_index': np.tile(np.arange(n_stops), len(trains)).astype(np.int16),
+            'station_id': self.station_ids[stops].ravel().astype(np.int32),
+            'scheduled_time': format_minutes_array(scheduled.ravel()),
+            'distance_km': np.cumsum(self.route_segment_km[self.train_route[trains]], axis=1).ravel().astype(np.float32),
+            'train_type': np.repeat(self.train_type[trains], n_stops)
+        })
+
+    def outcomes(self, start, stop, day_index=0):
+        """Feature rows and realised delays for every stop of a range of trains on one day"""
+        rng = np.random.default_rng((self.seed, day_index, start))
+        trains, stops = self._train_slice(start, stop)
+        n_trains, n_stops = len(trains), self.stations_per_route
+        shape = (n_trains, n_stops)
+
+        scheduled = self.scheduled_minutes[trains]
+        hours = (scheduled // 60) % 24
+        day_of_week = (day_index + 2) % 7
+        is_peak = np.isin(hours, PEAK_HOURS)
+
+        # Weather is shared by a whole journey, with some variation by stop
+        rainfall = rng.exponential(2, (n_trains, 1)) * rng.uniform(0.5, 1.5, shape)
+        temperature = rng.normal(28, 4, (n_trains, 1)) + rng.normal(0, 1, shape)
+        humidity = np.clip(rng.normal(75, 12, (n_trains, 1)) + rng.normal(0, 3, shape), 20, 100)
+
+        # Delay picks up incidents along the way and recovers slowly in the slack
+        express = self.train_type[trains] == 'express'
+        intercity = self.train_type[trains] == 'intercity'
+        incidents = (
+            is_peak * rng.normal(3, 1.5, shape) +
+            rainfall * rng.normal(0.4, 0.2, shape) +
+            (~express)[:, None] * rng.normal(0.8, 0.5, shape) +
+            rng.exponential(0.8, shape) * (rng.random(shape) < 0.15) * 10
+        )
+        # A delay never goes below zero: d[i] = max(0, d[i-1] + step[i]), which is
+        # the running sum minus its lowest point so far (Lindley's recursion)
+        running = np.cumsum(np.maximum(incidents, 0) - 1.5, axis=1)
+        delay = np.minimum(running - np.minimum.accumulate(np.minimum(running, 0), axis=1), 120)
+
+        segment_km = self.route_segment_km[self.train_route[trains]]
+        speed = self.train_speed[trains, None] * rng.uniform(0.6, 1.1, shape) - rainfall
+
+        return pd.DataFrame({
+            'train_id': np.repeat(self.train_ids[trains], n_stops).astype(np.int32),
+            'station_id': self.station_ids[stops].ravel().astype(np.int32),
+            'route_id': np.repeat(self.train_route[trains] + 1, n_stops).astype(np.int32),
+            'day_index': np.full(n_trains * n_stops, day_index, dtype=np.int16),
+            'hour': hours.ravel().astype(np.int8),
+            'day_of_week': np.full(n_trains * n_stops, day_of_week, dtype=np.int8),
+            'is_weekend': np.full(n_trains * n_stops, int(day_of_week >= 5), dtype=np.int8),
+            'is_peak_hour': is_peak.ravel().astype(np.int8),
+            'weather_temp': temperature.ravel().astype(np.float32),
+            'weather_humidity': humidity.ravel().astype(np.float32),
+            'weather_rainfall': rainfall.ravel().astype(np.float32),
+            'distance_to_station': segment_km.ravel().astype(np.float32),
+            'current_speed': np.clip(speed, 0, None).ravel().astype(np.float32),
+            'scheduled_time_minutes': (scheduled % 1440).ravel().astype(np.float32),
+            'train_type_express': np.repeat(express, n_stops).astype(np.int8),
+            'train_type_intercity': np.repeat(intercity, n_stops).astype(np.int8),
+            'historical_avg_delay': np.repeat(rng.normal(5, 3, n_trains), n_stops).astype(np.float32),
+            'delay_minutes': delay.ravel().astype(np.float32)
+        })
+
+    def tracking(self, start, stop, day_index=0, points_per_segment=10):
+        """GPS points interpolated between consecutive stops for a range of trains"""
+        rng = np.random.default_rng((self.seed, day_index, start, 1))
+        trains, stops = self._train_slice(start, stop)
+        n_trains = len(trains)
+
+        # Fractions along each segment, broadcast to (trains, segments, points)
+        fraction = np.linspace(0, 1, points_per_segment, endpoint=False)[None, None, :]
+        lat = self.station_lat[stops]
+        lon = self.station_lon[stops]
+        point_lat = lat[:, :-1, None] + (lat[:, 1:, None] - lat[:, :-1, None]) * fraction
+        point_lon = lon[:, :-1, None] + (lon[:, 1:, None] - lon[:, :-1, None]) * fraction
+
+        scheduled = self.scheduled_minutes[trains]
+        minutes = scheduled[:, :-1, None] + (scheduled[:, 1:, None] - scheduled[:, :-1, None]) * fraction
+        shape = point_lat.shape
+
+        # Accelerate out of and brake into every station
+        profile = np.sin(np.pi * (fraction + 0.5 / points_per_segment))
+        speed = self.train_speed[trains, None, None] * profile * rng.uniform(0.8, 1.05, shape)
+
+        heading = np.degrees(np.arctan2(lon[:, 1:] - lon[:, :-1], lat[:, 1:] - lat[:, :-1])) % 360
+        base = np.datetime64('2024-01-01T00:00') + np.timedelta64(day_index, 'D')
+        timestamps = base + (minutes * 60).astype('timedelta64[s]')
+
+        return pd.DataFrame({
+            'train_id': np.repeat(self.train_ids[trains], shape[1] * shape[2]).astype(np.int32),
+            'station_id': np.repeat(self.station_ids[stops[:, 1:]], shape[2]).astype(np.int32),
+            'latitude': (point_lat + rng.normal(0, 1e-4, shape)).ravel(),
+            'longitude': (point_lon + rng.normal(0, 1e-4, shape)).ravel(),
+            'speed': speed.ravel().astype(np.float32),
+            'heading': np.repeat(heading, shape[2]).astype(np.float32),
+            'accuracy': rng.uniform(5, 15, n_trains * shape[1] * shape[2]).astype(np.float32),
+            'timestamp': timestamps.ravel()
+        })
+
+    def requests(self, start, stop, day_index=0):
+        """/predict request payloads, one per remaining stop"""
+        df = self.outcomes(start, stop, day_index)
+        scheduled = format_minutes_array(df['scheduled_time_minutes'].to_numpy())
+        return pd.DataFrame({
+            'train_id': df['train_id'],
+            'station_id': df['station_id'],
+            'route_id': df['route_id'],
+            'scheduled_time': scheduled,
+            'time_features': df[['hour', 'day_of_week', 'is_weekend', 'is_peak_hour']].to_dict('records'),
+            'weather_data': df[['weather_temp', 'weather_humidity', 'weather_rainfall']].rename(columns={
+                'weather_temp': 'temperature',
+                'weather_humidity': 'humidity',
+                'weather_rainfall': 'rainfall'
+            }).to_dict('records'),
+            'current_location': df[['current_speed']].rename(columns={'current_speed': 'speed'}).to_dict('records')
+        })
+
+    def iter_chunks(self, kind='outcomes', days=1, trains_per_chunk=1000, **kwargs):
+        """Yield DataFrames of one kind, a block of trains at a time"""
+        if kind not in WORKLOAD_KINDS:
+            raise ValueError(f"Unknown workload kind: {kind}")
+
+        generate = getattr(self, kind)
+        for day_index in range(days):
+            for start in range(0, self.num_trains, trains_per_chunk):
+                stop = min(start + trains_per_chunk, self.num_trains)
+                yield generate(start, stop, day_index=day_index, **kwargs)
+            if kind == 'schedules':
+                # The timetable is the same every day
+                break
+
+    def write(self, path, kind='outcomes', days=1, trains_per_chunk=1000, file_format=None, **kwargs):
+        """Stream one kind of workload to CSV, NDJSON or Parquet without holding it in memory"""
+        file_format = file_format or os.path.splitext(path)[1].lstrip('.') or 'csv'
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        chunks = self.iter_chunks(kind, days, trains_per_chunk, **kwargs)
+        rows = 0
+
+        if file_format == 'parquet':
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ValueError("Parquet output requires pyarrow; use csv or ndjson instead")
+
+            writer = None
+            try:
+                for chunk in chunks:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(path, table.schema)
+                    writer.write_table(table)
+                    rows += len(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+        elif file_format == 'ndjson':
+            with open(path, 'w') as f:
+                for chunk in chunks:
+                    chunk.to_json(f, orient='records', lines=True, date_format='iso')
+                    rows += len(chunk)
+
+        elif file_format == 'csv':
+            with open(path, 'w', newline='') as f:
+                for index, chunk in enumerate(chunks):
+                    chunk.to_csv(f, index=False, header=index == 0)
+                    rows += len(chunk)
+
+        else:
+            raise ValueError(f"Unsupported output format: {file_format}")
+
+        logger.info(f"Wrote {rows} {kind} rows to {path}")
+        return rows
+
+    def to_training_arrays(self, df, feature_names):
+        """Feature matrix and delay target from an outcomes frame"""
+        return df[feature_names].to_numpy(dtype=float), df['delay_minutes'].to_numpy(dtype=float)
+
+    def get_info(self):
+        """Get the size of the generated network"""
+        return {
+            'stations': self.num_stations,
+            'routes': self.num_routes,
+            'trains': self.num_trains,
+            'stops_per_train': self.stations_per_route,
+            'seed': self.seed
+        }
@@ -1,6 +1,7 @@
 const express = require('express');
 const { query, body, validationResult } = require('express-validator');
 const trackingService = require('../services/trackingService');
+const predictionService = require('../services/predictionService');
 const socketService = require('../services/socketService');
 const Train = require('../models/Train');
 const logger = require('../utils/logger');
@@ -286,6 +287,10 @@ router.post('/update/:trainId', [
 
     socketService.broadcastTrainUpdate(trainId, locationData);
 
+    // Keep the ML service's live train state current
+    predictionService.queueTrackingPoint(Number(trainId), locationData);
+    await predictionService.flushTrackingPoints();
+
     logger.info(`Manual location update for train ${trainId}`);
 
     res.json({
@@ -7,13 +7,33 @@ class PredictionService {
   constructor() {
     this.mlServiceUrl = process.env.ML_SERVICE_URL || 'http://localhost:8000';
     this.apiKey = process.env.ML_SERVICE_API_KEY;
+    // When tracking points are streamed to the ML service it keeps each train's
+    // movement state, so predictions only need to carry the latest position
+    this.streamTracking = process.env.ML_TRACKING_INGEST !== 'false';
+    this.pendingTrackingPoints = [];
+    // The ML service precomputes every active train on a schedule; reading
+    // those results is a lookup instead of a model call per request
+    this.usePrecomputed = process.env.ML_PRECOMPUTED !== 'false';
+    // The ML service reads weather from its own grid cache, so requests only
+    // carry weather when that cache is turned off
+    this.useWeatherGrid = process.env.ML_WEATHER_GRID !== 'false';
+    this.mlTimeoutMs = parseInt(process.env.ML_SERVICE_TIMEOUT_MS || '10000', 10);
   }
 
   // Get prediction for specific train and station
   async getPrediction(trainId, stationId) {
     try {
+      const precomputed = await this.getPrecomputedPredictions(trainId, stationId);
+      if (precomputed) {
+        // Sweeps the ML service already wrote back in bulk need no save here
+        if (!precomputed.persisted) {
+          await this.savePrediction(trainId, stationId, precomputed);
+        }
+        return precomputed;
+      }
+
       // Get recent tracking data for the train
-      const trackingData = await this.getTrainTrackingData(trainId);
+      const trackingData = await this.getTrainTrackingData(trainId, 2, this.streamTracking ? 1 : 50);
       
       // Get historical data for this route
       const historicalData = await this.getHistoricalData(trainId, stationId);
@@ -22,10 +42,11 @@ class PredictionService {
       const predictionData = {
         train_id: trainId,
         station_id: stationId,
+        route_id: await this.getTrainRouteId(trainId),
         current_location: trackingData.slice(0, 1)[0] || null,
-        recent_tracking: trackingData,
+        ...(!this.streamTracking && { recent_tracking: trackingData }),
         historical_data: historicalData,
-        weather_data: await this.getWeatherData(),
+        ...(!this.useWeatherGrid && { weather_data: await this.getWeatherData() }),
         time_features: this.extractTimeFeatures()
       };
 
@@ -91,30 +112,143 @@ class PredictionService {
             return false;
           }
         });
-        targetStations = (upcoming.length > 0 ? upcoming : schedule).slice(0, 5);
+        targetStations = upcoming.length > 0 ? upcoming : schedule;
+      }
+
+      if (targetStations.length === 0) return;
+
+      const precomputed = await this.getPrecomputedPredictions(trainId);
+      if (precomputed) {
+        for (const prediction of precomputed.filter(p => !p.persisted)) {
+          await this.savePrediction(trainId, prediction.station_id, prediction);
+        }
+        return;
       }
 
-      for (const station of targetStations) {
-        await this.getPrediction(trainId, station.station_id);
+      try {
+        // One ML call covers every remaining station on the route
+        await this.getRoutePredictions(train, targetStations);
+      } catch (error) {
+        logger.warn(`Route prediction failed for train ${trainId}, predicting stations individually: ${error.message}`);
+        for (const station of targetStations.slice(0, 5)) {
+          await this.getPrediction(trainId, station.station_id);
+        }
       }
     } catch (error) {
       logger.error(`Error updating predictions for train ${trainId}:`, error);
     }
   }
 
+  // Get predictions for all remaining stations of a train in one ML call
+  async getRoutePredictions(train, stations) {
+    const trackingData = await this.getTrainTrackingData(train.id, 2, this.streamTracking ? 1 : 50);
+
+    const routeData = {
+      train_id: train.id,
+      route_id: train.routeId,
+      current_location: trackingData.slice(0, 1)[0] || null,
+      ...(!this.streamTracking && { recent_tracking: trackingData }),
+      ...(!this.useWeatherGrid && { weather_data: await this.getWeatherData() }),
+      time_features: this.extractTimeFeatures(),
+      stops: stations.map(station => ({
+        station_id: station.station_id,
+        scheduled_time: station.arrival_time || station.departure_time || null
+      }))
+    };
+
+    const result = await this.callMLService('/predict_route', routeData);
+
+    for (const prediction of result.predictions) {
+      await this.savePrediction(train.id, prediction.station_id, prediction);
+    }
+
+    return result.predictions;
+  }
+
+  // Read the latest precomputed predictions for a train (or one of its stops); null when there are none
+  async getPrecomputedPredictions(trainId, stationId = null) {
+    if (!this.usePrecomputed) return null;
+
+    const path = stationId ? `/predictions/${trainId}/${stationId}` : `/predictions/${trainId}`;
+    try {
+      const response = await axios.get(`${this.mlServiceUrl}${path}`, {
+        headers: {
+          ...(this.apiKey && { 'Authorization': `Bearer ${this.apiKey}` })
+        },
+        timeout: 2000
+      });
+      return stationId ? response.data : response.data.predictions;
+    } catch (error) {
+      if (error.response && error.response.status !== 404) {
+        logger.warn(`Precomputed prediction lookup failed for train ${trainId}: ${error.message}`);
+      }
+      return null;
+    }
+  }
+
   // Get train tracking data for ML model
-  async getTrainTrackingData(trainId, hours = 2) {
+  async getTrainTrackingData(trainId, hours = 2, limit = 50) {
     const result = await query(
       `SELECT * FROM tracking_data 
        WHERE train_id = $1 AND timestamp > NOW() - INTERVAL '${hours} hours'
        ORDER BY timestamp DESC
-       LIMIT 50`,
-      [trainId]
+       LIMIT $2`,
+      [trainId, limit]
     );
     
     return result.rows;
   }
 
+  // Queue a tracking point to be streamed to the ML service
+  queueTrackingPoint(trainId, locationData) {
+    if (!this.streamTracking) return;
+
+    this.pendingTrackingPoints.push({
+      train_id: trainId,
+      latitude: locationData.latitude,
+      longitude: locationData.longitude,
+      speed: locationData.speed,
+      heading: locationData.heading,
+      station_id: locationData.stationId || null,
+      timestamp: locationData.timestamp || new Date().toISOString()
+    });
+  }
+
+  // Send queued tracking points to the ML service as one NDJSON stream
+  async flushTrackingPoints() {
+    if (this.pendingTrackingPoints.length === 0) return;
+
+    const points = this.pendingTrackingPoints;
+    this.pendingTrackingPoints = [];
+
+    try {
+      await axios.post(
+        `${this.mlServiceUrl}/ingest/tracking`,
+        points.map(point => JSON.stringify(point)).join('\n'),
+        {
+          headers: {
+            'Content-Type': 'application/x-ndjson',
+            ...(this.apiKey && { 'Authorization': `Bearer ${this.apiKey}` })
+          },
+          timeout: 10000
+        }
+      );
+    } catch (error) {
+      // Predictions still work from the latest position sent with each request
+      logger.warn(`Failed to stream ${points.length} tracking points to ML service: ${error.message}`);
+    }
+  }
+
+  // Get the route a train runs on; the ML service picks route shards by it
+  async getTrainRouteId(trainId) {
+    const result = await query(
+      `SELECT route_id FROM trains WHERE id = $1`,
+      [trainId]
+    );
+
+    return result.rows.length > 0 ? result.rows[0].route_id : null;
+  }
+
   // Get historical data for route analysis
   async getHistoricalData(trainId, stationId, days = 30) {
     const result = await query(
@@ -162,9 +296,11 @@ class PredictionService {
       const response = await axios.post(`${this.mlServiceUrl}${endpoint}`, data, {
         headers: {
           'Content-Type': 'application/json',
+          // Lets the ML service answer from its lightweight model before we give up
+          'X-Request-Deadline-Ms': String(Math.max(this.mlTimeoutMs - 500, 100)),
           ...(this.apiKey && { 'Authorization': `Bearer ${this.apiKey}` })
         },
-        timeout: 10000 // 10 second timeout
+        timeout: this.mlTimeoutMs
       });
       
       return response.data;
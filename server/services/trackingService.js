@@ -58,16 +58,31 @@ class TrackingService {
   async updateAllTrainLocations() {
     try {
       const trains = await Train.findAll();
+      const advanced = [];
       
       for (const train of trains) {
         if (train.status === 'running' || train.status === 'delayed') {
           if (this.dataset) {
-            await this.advanceFromDataset(train);
+            if (await this.advanceFromDataset(train)) {
+              advanced.push(train.id);
+            }
           } else {
             await this.simulateTrainMovement(train);
           }
         }
       }
+
+      // Stream the whole tick's points in one batch before predicting so the ML service sees them
+      await predictionService.flushTrackingPoints();
+
+      // Proactively update predictions for trains that moved on dataset points
+      for (const trainId of advanced) {
+        try {
+          await predictionService.updateTrainPredictions(trainId);
+        } catch (e) {
+          logger.warn(`Prediction update failed for train ${trainId}: ${e.message || e}`);
+        }
+      }
     } catch (error) {
       logger.error('Error updating train locations:', error);
     }
@@ -91,12 +106,12 @@ class TrackingService {
     }
   }
 
-  // Advance one step for the given train using dataset
+  // Advance one step for the given train using dataset; returns whether it moved
   async advanceFromDataset(train) {
     const trainId = String(train.id);
     const points = this.dataset?.[trainId];
     if (!Array.isArray(points) || points.length === 0) {
-      return; // no dataset for this train
+      return false; // no dataset for this train
     }
     const currentIndex = this.datasetIndexByTrainId.get(trainId) ?? 0;
     const point = points[currentIndex % points.length];
@@ -114,12 +129,8 @@ class TrackingService {
 
     await this.saveTrackingData(train.id, locationData);
     socketService.broadcastTrainUpdate(train.id, locationData);
-    // Proactively update predictions for this train based on new data
-    try {
-      await predictionService.updateTrainPredictions(train.id);
-    } catch (e) {
-      logger.warn(`Prediction update failed for train ${train.id}: ${e.message || e}`);
-    }
+    predictionService.queueTrackingPoint(train.id, locationData);
+    return true;
   }
 
   // Simulate train movement (replace with real GPS data in production)
@@ -141,6 +152,7 @@ class TrackingService {
       
       // Save tracking data
       await this.saveTrackingData(train.id, locationData);
+      predictionService.queueTrackingPoint(train.id, locationData);
       
       // Broadcast location update
       socketService.broadcastTrainUpdate(train.id, locationData);